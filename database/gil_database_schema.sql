@@ -290,7 +290,7 @@ CREATE TABLE modelos_ia (
     fecha_entrenamiento DATE,
     fecha_deployment TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     estado_modelo ENUM('activo', 'inactivo', 'entrenando') DEFAULT 'activo',
-    parametros_modelo BIGINT(13)
+    parametros_modelo JSON -- Hiperparámetros, métricas y resultados de benchmark
 );
 
 -- Tabla de reconocimientos de imagen
@@ -299,7 +299,7 @@ CREATE TABLE reconocimientos_imagen (
     id_equipo_detectado INT,
     imagen_original_url VARCHAR(500),
     confianza_deteccion DECIMAL(3,2), -- 0.00 a 1.00
-    coordenadas_deteccion BIGINT(13), -- Coordenadas del bounding box
+    coordenadas_deteccion JSON, -- Cajas detectadas: [{etiqueta, confianza, caja: [x, y, ancho, alto]}]
     id_modelo_usado INT,
     procesado_por_usuario INT,
     fecha_reconocimiento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -390,7 +390,11 @@ INSERT INTO configuracion_sistema (clave_config, valor_config, descripcion, tipo
 ('precision_minima_reconocimiento', '0.85', 'Precisión mínima para aceptar reconocimiento automático', 'string'),
 ('dias_alerta_mantenimiento', '7', 'Días de anticipación para alertas de mantenimiento', 'integer'),
 ('max_dias_prestamo', '7', 'Máximo de días para préstamos regulares', 'integer'),
-('email_notificaciones', 'laboratorios@sena.edu.co', 'Email para notificaciones del sistema', 'string');
+('email_notificaciones', 'laboratorios@sena.edu.co', 'Email para notificaciones del sistema', 'string'),
+('fuentes_video', '{"1": {"0": "webcam:0"}}', 'Fuente de video por laboratorio y cámara (webcam:N, archivo:ruta, carpeta:ruta, rtsp://..., sintetica:AxB)', 'json'),
+('cascada_activa', 'true', 'Resolver con la etapa barata de histogramas los reconocimientos claros', 'boolean'),
+('cascada_banda_incertidumbre', '{"inferior": 0.15, "superior": 0.85}', 'Probabilidades de la etapa barata que se escalan al modelo completo', 'json'),
+('recursos_cpu', '{}', 'Hilos de TensorFlow y OpenCV y núcleos por rol (web, inferencia); lo que falte se reparte automáticamente', 'json');
 
 -- Insertar comandos de voz iniciales para Lucia
 INSERT INTO comandos_voz (comando_texto, intencion, parametros, respuesta_esperada) VALUES
@@ -474,4 +478,15 @@ JOIN equipos e ON a.id_equipo = e.id_equipo
 LEFT JOIN laboratorios l ON e.id_laboratorio = l.id_laboratorio
 LEFT JOIN usuarios u ON a.asignado_a = u.id_usuario
 WHERE a.estado_alerta = 'pendiente'
-ORDER BY a.prioridad DESC, a.fecha_limite ASC;
\ No newline at end of file
+ORDER BY a.prioridad DESC, a.fecha_limite ASC;
+
+-- ========================================
+-- MIGRACIONES (bases creadas con versiones anteriores de este archivo)
+-- ========================================
+
+-- parametros_modelo y coordenadas_deteccion se creaban como BIGINT(13); se
+-- pasan por TEXT para que los valores existentes queden como JSON válido
+ALTER TABLE modelos_ia MODIFY parametros_modelo TEXT;
+ALTER TABLE modelos_ia MODIFY parametros_modelo JSON;
+ALTER TABLE reconocimientos_imagen MODIFY coordenadas_deteccion TEXT;
+ALTER TABLE reconocimientos_imagen MODIFY coordenadas_deteccion JSON;
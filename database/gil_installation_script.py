@@ -447,6 +447,42 @@ class GILInstaller:
         cursor.close()
         return True
     
+    def migrate_columns(self):
+        """
+        Convertir a JSON (o TEXT) las columnas que versiones anteriores de
+        gil_database_schema.sql creaban como BIGINT; la aplicación guarda JSON
+        en ellas
+        """
+        json_type = "JSON" if self.supports_json else "TEXT"
+        columnas = [
+            ('modelos_ia', 'parametros_modelo'),
+            ('reconocimientos_imagen', 'coordenadas_deteccion'),
+        ]
+        cursor = self.connection.cursor()
+        
+        print("\n🔄 Migrando columnas...")
+        
+        try:
+            for tabla, columna in columnas:
+                cursor.execute("""
+                    SELECT DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                """, (tabla, columna))
+                fila = cursor.fetchone()
+                if fila is None or fila[0].lower() in ('json', 'text'):
+                    continue
+                # Pasando por TEXT, los valores numéricos existentes quedan como JSON válido
+                cursor.execute(f"ALTER TABLE {tabla} MODIFY {columna} TEXT")
+                if json_type == "JSON":
+                    cursor.execute(f"ALTER TABLE {tabla} MODIFY {columna} JSON")
+                print(f"  ✓ Columna '{tabla}.{columna}' migrada a {json_type}")
+            return True
+        except Error as e:
+            print(f"  ✗ Error migrando columnas: {e}")
+            return False
+        finally:
+            cursor.close()
+    
     def insert_initial_data(self):
         """
         Insertar datos iniciales del sistema
@@ -537,7 +573,11 @@ class GILInstaller:
                 ('precision_minima_reconocimiento', '0.85', 'Precisión mínima para aceptar reconocimiento automático', 'string'),
                 ('dias_alerta_mantenimiento', '7', 'Días de anticipación para alertas de mantenimiento', 'integer'),
                 ('max_dias_prestamo', '7', 'Máximo de días para préstamos regulares', 'integer'),
-                ('email_notificaciones', 'laboratorios@sena.edu.co', 'Email para notificaciones del sistema', 'string')
+                ('email_notificaciones', 'laboratorios@sena.edu.co', 'Email para notificaciones del sistema', 'string'),
+                ('fuentes_video', '{"1": {"0": "webcam:0"}}', 'Fuente de video por laboratorio y cámara (webcam:N, archivo:ruta, carpeta:ruta, rtsp://..., sintetica:AxB)', 'json'),
+                ('cascada_activa', 'true', 'Resolver con la etapa barata de histogramas los reconocimientos claros', 'boolean'),
+                ('cascada_banda_incertidumbre', '{"inferior": 0.15, "superior": 0.85}', 'Probabilidades de la etapa barata que se escalan al modelo completo', 'json'),
+                ('recursos_cpu', '{}', 'Hilos de TensorFlow y OpenCV y núcleos por rol (web, inferencia); lo que falte se reparte automáticamente', 'json')
             ]
             
             for config in config_data:
@@ -722,6 +762,10 @@ class GILInstaller:
         if not self.create_tables():
             return False
         
+        # Migrar columnas de instalaciones anteriores
+        if not self.migrate_columns():
+            return False
+        
         # Insertar datos iniciales
         if not self.insert_initial_data():
             return False
@@ -1,57 +1,199 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Blueprint, Flask, request, jsonify, render_template
+import atexit
 import os
 from dotenv import load_dotenv
 from routes.recognition import recognition_bp
 from routes.equipos import equipos_bp
+from extensiones import socketio
+from models.recursos_cpu import gobernador
+from models.registro_modelos import registro
+from models.cliente_inferencia import cliente
+from models.eventos_reconocimiento import sumidero
+from models.planificador_inferencia import planificador
+from models.fuentes_video import liberar_fuentes
+from models.reconocimiento_video import trabajos_video
+import routes.tiempo_real  # registra los eventos de Socket.IO
 
 load_dotenv()
 
-app = Flask(__name__, template_folder='../templates')
+# Páginas HTML; las APIs están en routes/
+paginas_bp = Blueprint('paginas', __name__)
 
-@app.route('/mockup/usuarios')
+@paginas_bp.route('/mockup/usuarios')
 def mockup_usuarios():
     return render_template('mockups/usuarios.html')
 
-@app.route('/mockup/inventario')
+@paginas_bp.route('/mockup/inventario')
 def mockup_inventario():
     return render_template('mockups/inventario.html')
 
-@app.route('/mockup/laboratorios')
+@paginas_bp.route('/mockup/laboratorios')
 def mockup_laboratorios():
     return render_template('mockups/laboratorios.html')
 
-@app.route('/mockup/prestamos')
+@paginas_bp.route('/mockup/prestamos')
 def mockup_prestamos():
     return render_template('mockups/prestamos.html')
 
-@app.route('/index.html')
+@paginas_bp.route('/index.html')
 def index():
     return render_template('index.html')
 
 
-@app.route('/usuarios')
+@paginas_bp.route('/usuarios')
 def usuarios():
     return render_template('usuarios.html')
 
-@app.route('/inventario')
+@paginas_bp.route('/inventario')
 def inventario():
     return render_template('inventario.html')
 
-@app.route('/prestamos')
+@paginas_bp.route('/prestamos')
 def prestamos():
     return render_template('prestamos.html')
 
-@app.route('/laboratorios')
+@paginas_bp.route('/laboratorios')
 def laboratorios():
     return render_template('laboratorios.html')
 
-@app.route('/api/status')
+@paginas_bp.route('/api/status')
 def status():
     return jsonify({"status": "ok", "message": "Servidor GIL funcionando"})
 
-# Registrar rutas
-app.register_blueprint(equipos_bp)
-app.register_blueprint(recognition_bp)
+# ---- Ciclo de vida ----
+#
+# create_app() no abre cámaras, conexiones ni hilos ni carga el modelo: eso lo
+# hacen los ganchos al iniciar cada worker (después del fork, si el servidor
+# hace fork) y se deshace en los ganchos de apagado. Quien sirve la aplicación
+# llama a iniciar_worker(app) en cada proceso que atiende peticiones y a
+# apagar(app) al terminar: app.py, servidor_prefork.py y gunicorn.conf.py.
+
+def registrar_al_iniciar(app, funcion):
+    app.extensions['gil_ciclo']['al_iniciar'].append(funcion)
+
+def registrar_al_apagar(app, funcion):
+    app.extensions['gil_ciclo']['al_apagar'].append(funcion)
+
+def iniciar_worker(app):
+    """
+    Ejecutar los ganchos de inicio una vez por proceso.
+    """
+    ciclo = app.extensions['gil_ciclo']
+    if ciclo['iniciado'] == os.getpid():
+        return
+    ciclo['iniciado'] = os.getpid()
+    for funcion in ciclo['al_iniciar']:
+        funcion(app)
+
+def apagar(app):
+    """
+    Ejecutar los ganchos de apagado en orden inverso, una vez por proceso;
+    el fallo de uno no impide los demás.
+    """
+    ciclo = app.extensions['gil_ciclo']
+    if ciclo['apagado'] == os.getpid():
+        return
+    ciclo['apagado'] = os.getpid()
+    for funcion in reversed(ciclo['al_apagar']):
+        try:
+            funcion(app)
+        except Exception as e:
+            print(f"⚠ Error al apagar ({funcion.__name__}): {e}")
+
+def _aplicar_recursos(app):
+    # Hilos de TensorFlow/OpenCV y núcleos del proceso web (ver models/recursos_cpu.py)
+    gobernador.aplicar('web')
+
+def _precargar_modelo(app):
+    # Sin servidor de inferencia, cargar el modelo antes de la primera petición
+    if app.config['GIL_PRECARGAR_MODELO'] and not cliente.direccion:
+        registro.iniciar()
+
+def _detener_registro(app):
+    registro.detener()
+
+def _vaciar_sumidero(app):
+    # Escribe en MySQL los reconocimientos que siguen en la cola
+    sumidero.detener()
+
+def _detener_planificador(app):
+    planificador.detener()
+
+def _liberar_fuentes(app):
+    liberar_fuentes()
+
+def _detener_trabajos_video(app):
+    trabajos_video.detener()
+
+# ---- Socket.IO con varios workers ----
+#
+# Socket.IO guarda cada sesión (el sid de Engine.IO y sus salas) en la memoria
+# del worker que la abrió, y los workers que comparten un socket se reparten
+# las conexiones sin afinidad: el long-polling de un cliente cae en otro worker
+# y falla. Un balanceador con sesiones fijas tampoco sirve ahí, porque sólo ve
+# un puerto. Por eso, con más de un worker, Socket.IO se atiende aparte en una
+# instancia de un solo worker (p. ej. servidor_prefork.py --workers 1 en otro
+# puerto) y el proxy envía /socket.io/ a ella; los workers del pool arrancan
+# con GIL_SOCKETIO_EXTERNO=true, no atienden /socket.io/ y publican sus
+# detecciones por la cola compartida GIL_SOCKETIO_COLA (p. ej. redis://),
+# que la instancia de Socket.IO también debe usar.
+
+def configuracion_socketio():
+    return {
+        'GIL_SOCKETIO_COLA': os.getenv('GIL_SOCKETIO_COLA') or None,
+        'GIL_SOCKETIO_EXTERNO': os.getenv('GIL_SOCKETIO_EXTERNO', 'false').lower() in ('true', '1'),
+    }
+
+def comprobar_workers(workers, config=None):
+    """
+    Lanzar RuntimeError si `workers` procesos no pueden atender Socket.IO
+    con la configuración dada (ver arriba).
+    """
+    config = config or configuracion_socketio()
+    if workers > 1 and not (config['GIL_SOCKETIO_EXTERNO'] and config['GIL_SOCKETIO_COLA']):
+        raise RuntimeError(
+            f"{workers} workers sin afinidad de sesión rompen Socket.IO: usa un solo worker, o "
+            "GIL_SOCKETIO_EXTERNO=true y GIL_SOCKETIO_COLA con Socket.IO servido por una "
+            "instancia de un worker a la que el proxy envíe /socket.io/")
+
+def create_app(config=None):
+    """
+    Construir la aplicación sin efectos secundarios. `config` se mezcla sobre
+    la configuración por defecto.
+    """
+    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    # Rechazar subidas enormes antes de leerlas (ver models/ingesta_imagen.py)
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('GIL_MAX_BYTES_IMAGEN', str(25 * 1024 * 1024))) + 64 * 1024
+    app.config['GIL_PRECARGAR_MODELO'] = os.getenv('GIL_PRECARGAR_MODELO', 'false').lower() in ('true', '1')
+    # Con varios workers, Socket.IO va en otra instancia (ver comprobar_workers)
+    app.config.update(configuracion_socketio())
+    app.config.update(config or {})
+    if app.config['GIL_SOCKETIO_EXTERNO'] and not app.config['GIL_SOCKETIO_COLA']:
+        raise RuntimeError("GIL_SOCKETIO_EXTERNO necesita GIL_SOCKETIO_COLA para publicar las detecciones")
+
+    app.extensions['gil_ciclo'] = {'al_iniciar': [], 'al_apagar': [], 'iniciado': None, 'apagado': None}
+    registrar_al_iniciar(app, _aplicar_recursos)
+    registrar_al_iniciar(app, _precargar_modelo)
+    # Se ejecutan en orden inverso: primero lo que produce trabajo, al final el modelo
+    registrar_al_apagar(app, _detener_registro)
+    registrar_al_apagar(app, _vaciar_sumidero)
+    registrar_al_apagar(app, _detener_planificador)
+    registrar_al_apagar(app, _liberar_fuentes)
+    registrar_al_apagar(app, _detener_trabajos_video)
+
+    # Registrar rutas
+    app.register_blueprint(paginas_bp)
+    app.register_blueprint(equipos_bp)
+    app.register_blueprint(recognition_bp)
+    if app.config['GIL_SOCKETIO_EXTERNO']:
+        # Sólo publicar en la cola, sin atender /socket.io/ en este proceso
+        socketio.init_app(None, message_queue=app.config['GIL_SOCKETIO_COLA'])
+    else:
+        socketio.init_app(app, message_queue=app.config['GIL_SOCKETIO_COLA'])
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app = create_app()
+    iniciar_worker(app)
+    atexit.register(apagar, app)
+    socketio.run(app, debug=True)
@@ -0,0 +1,113 @@
+# Comparar la decodificación de subidas: resolución completa + resize (método
+# anterior) frente a models/ingesta_imagen (decodificación reducida).
+#
+#   cd src && python -m benchmarks.bench_ingesta --megapixeles 48
+#
+# Cada método corre en un proceso nuevo para que el pico de RSS sea propio.
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+def generar_jpeg(megapixeles, calidad=90):
+    """
+    Foto sintética con gradientes y ruido (comprime como una foto real).
+    """
+    alto = int((megapixeles * 1e6 * 3 / 4) ** 0.5)
+    ancho = int(alto * 4 / 3)
+    y, x = np.mgrid[0:alto, 0:ancho]
+    base = ((x * 255 // ancho) ^ (y * 255 // alto)).astype(np.uint8)
+    imagen = cv2.merge([base, np.roll(base, ancho // 3, axis=1), np.flipud(base)])
+    ruido = np.random.default_rng(0).integers(0, 24, imagen.shape, dtype=np.uint8)
+    imagen = cv2.add(imagen, ruido)
+    ok, buffer = cv2.imencode('.jpg', imagen, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+    return buffer.tobytes(), (ancho, alto)
+
+
+def metodo_completo(datos):
+    img = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.resize(img, (224, 224))
+
+
+def metodo_reducido(datos):
+    from models.ingesta_imagen import decodificar
+    return decodificar(datos)
+
+
+def _leer_status(campo):
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith(campo + ':'):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def pico_rss_kb():
+    """
+    Pico de RSS del proceso. VmHWM se reinicia en exec(); ru_maxrss no, y
+    heredaría el pico del proceso padre.
+    """
+    return _leer_status('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def rss_actual_kb():
+    return _leer_status('VmRSS') or pico_rss_kb()
+
+
+def _medir(metodo, datos, repeticiones, salida):
+    funcion = metodo_completo if metodo == 'completo' else metodo_reducido
+    # Importar antes de medir para no contar la carga de módulos
+    import models.ingesta_imagen  # noqa: F401
+    rss_inicial = rss_actual_kb()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(datos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    rss_pico = pico_rss_kb()
+    salida.put({
+        'metodo': metodo,
+        'mediana_ms': statistics.median(tiempos),
+        'pico_rss_mb': rss_pico / 1024,
+        'incremento_rss_mb': (rss_pico - rss_inicial) / 1024,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta de imágenes")
+    parser.add_argument('--megapixeles', type=float, default=48)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    datos, (ancho, alto) = generar_jpeg(args.megapixeles)
+    print(f"Imagen de prueba: {ancho}x{alto} ({len(datos) / 1e6:.1f} MB JPEG)")
+
+    contexto = multiprocessing.get_context('spawn')
+    resultados = []
+    for metodo in ('completo', 'reducido'):
+        cola = contexto.Queue()
+        proceso = contexto.Process(target=_medir, args=(metodo, datos, args.repeticiones, cola))
+        proceso.start()
+        resultados.append(cola.get())
+        proceso.join()
+
+    print(f"{'método':<10} {'mediana (ms)':>13} {'pico RSS (MB)':>14} {'incremento (MB)':>16}")
+    for r in resultados:
+        print(f"{r['metodo']:<10} {r['mediana_ms']:>13.1f} {r['pico_rss_mb']:>14.1f} {r['incremento_rss_mb']:>16.1f}")
+    completo, reducido = resultados
+    print(f"Latencia: {completo['mediana_ms'] / reducido['mediana_ms']:.1f}x más rápido; "
+          f"memoria: {completo['incremento_rss_mb'] - reducido['incremento_rss_mb']:.0f} MB menos de pico")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# Comparar el transporte de frames entre captura, inferencia y codificación:
+#
+#   proceso  - todo en un proceso, en serie (como el bucle de generar_frames)
+#   cola     - captura, inferencia y codificación en procesos separados,
+#              con los frames serializados por multiprocessing.Queue
+#   memoria  - los mismos procesos, con models/memoria_compartida.AnilloFrames
+#
+#   cd src && python -m benchmarks.bench_memoria_compartida --segundos 10
+#   cd src && python -m benchmarks.bench_memoria_compartida --inferencia modelo --fps 30
+#
+# --inferencia numpy reemplaza la CNN por una carga fija de CPU en NumPy para
+# medir el transporte en máquinas sin TensorFlow; --inferencia modelo usa
+# predecir_lote (modelo activo o servidor de inferencia).
+import argparse
+import multiprocessing
+import queue
+import resource
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FORMA = (480, 640, 3)
+
+
+def crear_inferencia(tipo):
+    if tipo == 'modelo':
+        from models.cliente_inferencia import predecir_lote, tamano_entrada
+        tamano = tamano_entrada()
+        return lambda frame: predecir_lote(cv2.resize(frame, tamano)[np.newaxis])
+    pesos = np.random.default_rng(0).standard_normal((224 * 3, 1024)).astype(np.float32)
+
+    def inferir(frame):
+        # ~0.3 GFLOP: del orden de una red pequeña en CPU
+        imagen = cv2.resize(frame, (224, 224)).reshape(224, -1).astype(np.float32) / 255.0
+        return imagen @ pesos
+    return inferir
+
+
+def codificar(frame, calidad=80):
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])[1]
+
+
+def _fuente(fps):
+    from models.fuentes_video import FuenteSintetica
+    return FuenteSintetica(FORMA[1], FORMA[0], fps=fps)
+
+
+# ---- Modo proceso ----
+
+def correr_en_proceso(args):
+    fuente = _fuente(args.fps)
+    inferir = crear_inferencia(args.inferencia)
+    capturados = inferidos = codificados = 0
+    limite = time.monotonic() + args.segundos
+    while time.monotonic() < limite:
+        ok, frame = fuente.leer()
+        capturados += 1
+        inferir(frame)
+        inferidos += 1
+        codificar(frame)
+        codificados += 1
+    return {'capturados': capturados, 'inferidos': inferidos, 'codificados': codificados, 'latencias': []}
+
+
+# ---- Procesos separados ----
+
+def _captura_cola(colas, fps, medir, fin, salida):
+    fuente = _fuente(fps)
+    numero = contador = 0
+    while not fin.is_set():
+        ok, frame = fuente.leer()
+        for cola in colas:
+            try:
+                cola.put_nowait((numero, time.monotonic(), frame))
+            except queue.Full:
+                pass  # el consumidor va atrasado: se descarta como haría una cámara
+        numero += 1
+        contador += medir.is_set()
+    # No esperar a vaciar en las colas los frames que ya nadie va a leer
+    for cola in colas:
+        cola.cancel_join_thread()
+    salida.put(('capturados', contador, []))
+
+
+def _consumidor_cola(cola, etapa, tipo, medir, fin, salida):
+    trabajo = crear_inferencia(tipo) if etapa == 'inferidos' else codificar
+    contador, latencias = 0, []
+    while not fin.is_set():
+        try:
+            _, momento, frame = cola.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        latencia = time.monotonic() - momento
+        trabajo(frame)
+        if medir.is_set():
+            latencias.append(latencia)
+            contador += 1
+    salida.put((etapa, contador, latencias))
+
+
+def _captura_memoria(nombre, fps, medir, fin, salida):
+    from models.memoria_compartida import AnilloFrames
+    anillo = AnilloFrames.abrir(nombre)
+    fuente = _fuente(fps)
+    contador = 0
+    while not fin.is_set():
+        ok, frame = fuente.leer()
+        anillo.publicar(frame)
+        contador += medir.is_set()
+    anillo.cerrar()
+    salida.put(('capturados', contador, []))
+
+
+def _consumidor_memoria(nombre, etapa, tipo, medir, fin, salida):
+    from models.memoria_compartida import AnilloFrames
+    anillo = AnilloFrames.abrir(nombre)
+    trabajo = crear_inferencia(tipo) if etapa == 'inferidos' else codificar
+    contador, latencias, ultimo = 0, [], -1
+    while not fin.is_set():
+        numero, vista = anillo.esperar(ultimo, timeout=0.1, mas_reciente=etapa == 'inferidos')
+        if numero is None:
+            continue
+        latencia = time.monotonic() - anillo.momento(numero)
+        trabajo(vista)
+        # Si la ranura se reescribió durante el trabajo el resultado no vale
+        if medir.is_set() and anillo.vigente(numero):
+            latencias.append(latencia)
+            contador += 1
+        ultimo = numero
+    vista = None
+    anillo.cerrar()
+    salida.put((etapa, contador, latencias))
+
+
+def correr_en_procesos(args, modo):
+    contexto = multiprocessing.get_context('spawn')
+    medir = contexto.Event()
+    fin = contexto.Event()
+    salida = contexto.Queue()
+    anillo = None
+    if modo == 'memoria':
+        from models.memoria_compartida import AnilloFrames
+        anillo = AnilloFrames.crear(FORMA, ranuras=args.ranuras)
+        procesos = [contexto.Process(target=_captura_memoria, args=(anillo.nombre, args.fps, medir, fin, salida))]
+        procesos += [contexto.Process(target=_consumidor_memoria, args=(anillo.nombre, etapa, args.inferencia,
+                                                                       medir, fin, salida))
+                     for etapa in ('inferidos', 'codificados')]
+    else:
+        colas = [contexto.Queue(maxsize=args.ranuras) for _ in range(2)]
+        procesos = [contexto.Process(target=_captura_cola, args=(colas, args.fps, medir, fin, salida))]
+        procesos += [contexto.Process(target=_consumidor_cola, args=(cola, etapa, args.inferencia, medir, fin,
+                                                                    salida))
+                     for cola, etapa in zip(colas, ('inferidos', 'codificados'))]
+    for proceso in procesos:
+        proceso.start()
+    # Dar tiempo a que los procesos importen módulos antes de medir
+    time.sleep(args.calentamiento)
+    medir.set()
+    time.sleep(args.segundos)
+    fin.set()
+    resultado = {'capturados': 0, 'inferidos': 0, 'codificados': 0, 'latencias': []}
+    for _ in procesos:
+        try:
+            etapa, contador, latencias = salida.get(timeout=10)
+        except queue.Empty:
+            print(f"⚠ {modo}: un proceso no entregó sus resultados", file=sys.stderr)
+            break
+        resultado[etapa] = contador
+        resultado['latencias'] += latencias
+    for proceso in procesos:
+        proceso.join(5)
+        if proceso.is_alive():
+            proceso.terminate()
+    if anillo is not None:
+        anillo.cerrar()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de transporte de frames entre procesos")
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--fps', type=float, default=30, help="FPS de la cámara simulada (0 = sin límite)")
+    parser.add_argument('--inferencia', choices=('numpy', 'modelo'), default='numpy')
+    parser.add_argument('--ranuras', type=int, default=8)
+    parser.add_argument('--calentamiento', type=float, default=2.0)
+    parser.add_argument('--modos', default='proceso,cola,memoria')
+    args = parser.parse_args()
+    args.fps = args.fps or None
+
+    print(f"Frames {FORMA[1]}x{FORMA[0]}, cámara a {args.fps or 'máx.'} FPS, {args.segundos:.0f} s por modo")
+    print(f"{'modo':<9} {'captura':>8} {'inferencia':>11} {'codificación':>13} "
+          f"{'lat. p50 (ms)':>14} {'CPU (s)':>8}")
+    for modo in args.modos.split(','):
+        cpu_inicial = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        if modo == 'proceso':
+            r = correr_en_proceso(args)
+        else:
+            r = correr_en_procesos(args, modo)
+        cpu_final = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = sum(f.ru_utime + f.ru_stime - i.ru_utime - i.ru_stime for i, f in zip(cpu_inicial, cpu_final))
+        latencia = statistics.median(r['latencias']) * 1000 if r['latencias'] else 0.0
+        print(f"{modo:<9} {r['capturados'] / args.segundos:>8.1f} {r['inferidos'] / args.segundos:>11.1f} "
+              f"{r['codificados'] / args.segundos:>13.1f} {latencia:>14.2f} {cpu:>8.1f}")
+    print("(FPS por etapa; la CPU de los modos con procesos incluye el calentamiento)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
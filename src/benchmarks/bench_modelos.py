@@ -0,0 +1,324 @@
+# Benchmark de cada versión registrada en modelos_ia y cada backend sobre un
+# conjunto de evaluación fijo: carga en frío, latencia de una imagen
+# (p50/p95/p99), rendimiento por lotes, memoria pico, exactitud,
+# precisión/recall al UMBRAL y calibración (ECE y Brier).
+#
+#   cd src && python -m benchmarks.bench_modelos                        # todas las versiones
+#   cd src && python -m benchmarks.bench_modelos --modelo 7 --backend proceso --backend cascada
+#   cd src && python -m benchmarks.bench_modelos --candidato 9 --tolerancia-exactitud 0.005
+#
+# El conjunto de evaluación es la validación por hash del dataset compilado
+# (la misma que usa train_cascada.py), así que no cambia entre ejecuciones
+# mientras no cambie el dataset; su huella se guarda con los resultados.
+#
+# Cada medición corre en un proceso nuevo (spawn) para que la carga sea en
+# frío de verdad y la memoria pico sea la de ese modelo. Los resultados se
+# guardan en modelos_ia.parametros_modelo['benchmark'] (salvo --sin-guardar);
+# la columna debe ser JSON o TEXT (migrate_columns en
+# database/gil_installation_script.py migra las bases antiguas). Si no se
+# pueden guardar, los resultados se muestran igual y el código de salida es 2.
+# Con --candidato, el comando termina con código 1 si la versión candidata
+# empeora frente a la base (la activa, o --base) más allá de las tolerancias.
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+BACKENDS = ('proceso', 'servidor', 'cascada')
+TAMANO_LOTE = 32
+MUESTRAS_LATENCIA = 100
+BINS_CALIBRACION = 10
+
+
+def conjunto_evaluacion(origen):
+    """
+    (dataset, índices de validación, etiquetas 0/1, huella del conjunto).
+    """
+    from models.dataset_compilado import compilar, cargar as cargar_compilado
+    from train_cascada import separar_validacion, CLASE_POSITIVA
+
+    compilar(origen)
+    dataset = cargar_compilado(origen)
+    indices = np.flatnonzero(separar_validacion(dataset.hashes))
+    etiquetas = (dataset.etiquetas[indices] == dataset.clases.index(CLASE_POSITIVA)).astype(np.float32)
+    huella = hashlib.sha1(''.join(sorted(dataset.hashes[i] for i in indices)).encode()).hexdigest()[:16]
+    return dataset, indices, etiquetas, huella
+
+
+def metricas(probabilidades, etiquetas, umbral, bins=BINS_CALIBRACION):
+    """
+    Exactitud, precisión y recall de la clase positiva al umbral, y
+    calibración: ECE (bins de igual ancho) y puntaje de Brier.
+    """
+    p = np.clip(np.asarray(probabilidades, dtype=np.float64), 0.0, 1.0)
+    y = np.asarray(etiquetas) > 0.5
+    positivo = p > umbral
+    verdaderos_positivos = int((positivo & y).sum())
+    ece = 0.0
+    bin_de = np.minimum((p * bins).astype(int), bins - 1)
+    for b in range(bins):
+        en_bin = bin_de == b
+        if en_bin.any():
+            ece += en_bin.mean() * abs(p[en_bin].mean() - y[en_bin].mean())
+    return {
+        'imagenes': int(len(p)),
+        'exactitud': float((positivo == y).mean()),
+        'precision_positiva': verdaderos_positivos / int(positivo.sum()) if positivo.any() else None,
+        'recall': verdaderos_positivos / int(y.sum()) if y.any() else None,
+        'ece': float(ece),
+        'brier': float(((p - y) ** 2).mean()),
+    }
+
+
+def _rss_pico_mb():
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _medir(tarea):
+    """
+    Tarea de un proceso nuevo: medir una versión con un backend.
+    """
+    from models.dataset_compilado import cargar as cargar_compilado
+    from models.registro_modelos import cargar_modelo, preparar_lote, resolver_ruta, UMBRAL
+
+    backend = tarea['backend']
+    rss_inicial = _rss_pico_mb()
+    inicio = time.perf_counter()
+    if backend == 'servidor':
+        from models.cliente_inferencia import ClienteInferencia, ErrorInferencia
+        cliente = ClienteInferencia(tarea['direccion'], timeout=30.0)
+        try:
+            estado = cliente.estado()
+        except ErrorInferencia as e:
+            return {'omitido': str(e)}
+        if estado.get('id_modelo') != tarea['id_modelo']:
+            return {'omitido': f"el servidor sirve el modelo {estado.get('id_modelo')}"}
+        carga_s = None
+        tamano = tuple(estado['tamano_entrada'])
+
+        def lote(imagenes):
+            return np.ravel(cliente.predecir(imagenes))
+    else:
+        if not os.path.exists(resolver_ruta(tarea['ruta'])):
+            return {'omitido': f"no existe {tarea['ruta']}"}
+        # Incluye importar TensorFlow: es lo que paga un worker al arrancar
+        cargado = cargar_modelo(tarea['id_modelo'], tarea['version'], tarea['ruta'])
+        carga_s = time.perf_counter() - inicio
+        tamano = cargado.tamano_entrada
+
+        def lote(imagenes):
+            return np.ravel(cargado.predecir(preparar_lote(imagenes)))
+
+    if backend == 'cascada':
+        from models.cascada import CascadaConfianza
+        # Sin auditoría: cada imagen cuesta lo mismo que en producción sin muestreo
+        cascada = CascadaConfianza(completo=lambda frame: float(lote(cv2.resize(frame, tamano)[np.newaxis])[0]),
+                                   fraccion_auditoria=0.0)
+        if not cascada.activa():
+            return {'omitido': "cascada inactiva o sin cabeza de histogramas"}
+
+        def una(frame):
+            return cascada.probabilidad(frame)[0]
+
+        def lote_originales(frames):
+            return np.array([una(frame) for frame in frames])
+    else:
+        def una(frame):
+            return lote(cv2.resize(frame, tamano)[np.newaxis])[0]
+
+        def lote_originales(frames):
+            return lote(np.stack([cv2.resize(frame, tamano) for frame in frames]))
+
+    # El almacén compilado está en RGB y los frames de la cámara en BGR
+    dataset = cargar_compilado(tarea['origen'])
+    frames = [cv2.cvtColor(imagen, cv2.COLOR_RGB2BGR) for imagen in np.asarray(dataset.imagenes[tarea['indices']])]
+
+    latencias = []
+    for frame in frames[:tarea['muestras_latencia']]:
+        t = time.perf_counter()
+        una(frame)
+        latencias.append((time.perf_counter() - t) * 1000)
+
+    probabilidades = []
+    t = time.perf_counter()
+    for _ in range(tarea['repeticiones']):
+        probabilidades = np.concatenate([lote_originales(frames[i:i + tarea['tamano_lote']])
+                                         for i in range(0, len(frames), tarea['tamano_lote'])])
+    duracion = time.perf_counter() - t
+
+    resultado = {
+        'carga_s': carga_s,
+        'latencia_p50_ms': float(np.percentile(latencias, 50)),
+        'latencia_p95_ms': float(np.percentile(latencias, 95)),
+        'latencia_p99_ms': float(np.percentile(latencias, 99)),
+        'imagenes_por_s': len(frames) * tarea['repeticiones'] / duracion if duracion else None,
+        'tamano_lote': tarea['tamano_lote'],
+        # Con el servidor la memoria del modelo es la de otro proceso
+        'rss_pico_mb': _rss_pico_mb(),
+        'rss_inicial_mb': rss_inicial,
+    }
+    if backend == 'cascada':
+        resultado['tasa_escalado'] = cascada.estadisticas()['tasa_escalado']
+    resultado.update(metricas(probabilidades, tarea['etiquetas'], UMBRAL))
+    return resultado
+
+
+def medir(tarea):
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+        return pool.submit(_medir, tarea).result()
+
+
+def comparar(candidato, base, tolerancias):
+    """
+    Lista de regresiones de `candidato` frente a `base` (resultados por backend).
+    """
+    fallos = []
+    for backend, r in candidato.items():
+        b = base.get(backend)
+        if not b or 'omitido' in r or 'omitido' in b:
+            continue
+        for clave in ('exactitud', 'recall', 'precision_positiva'):
+            if r[clave] is not None and b[clave] is not None and r[clave] < b[clave] - tolerancias['exactitud']:
+                fallos.append(f"{backend}: {clave} {b[clave]:.3f} -> {r[clave]:.3f}")
+        if r['ece'] > b['ece'] + tolerancias['ece']:
+            fallos.append(f"{backend}: ECE {b['ece']:.3f} -> {r['ece']:.3f}")
+        if r['latencia_p95_ms'] > b['latencia_p95_ms'] * (1 + tolerancias['latencia']):
+            fallos.append(f"{backend}: latencia p95 {b['latencia_p95_ms']:.1f} -> {r['latencia_p95_ms']:.1f} ms")
+        if r['imagenes_por_s'] and b['imagenes_por_s'] and \
+                r['imagenes_por_s'] < b['imagenes_por_s'] * (1 - tolerancias['latencia']):
+            fallos.append(f"{backend}: rendimiento {b['imagenes_por_s']:.1f} -> {r['imagenes_por_s']:.1f} img/s")
+        if backend != 'servidor' and r['rss_pico_mb'] > b['rss_pico_mb'] * (1 + tolerancias['memoria']):
+            fallos.append(f"{backend}: RSS pico {b['rss_pico_mb']:.0f} -> {r['rss_pico_mb']:.0f} MB")
+    return fallos
+
+
+def _formato(valor, patron):
+    return '-' if valor is None else format(valor, patron)
+
+
+def mostrar(fila, resultados):
+    print(f"\nModelo {fila['id_modelo']} {fila['nombre_modelo']} {fila['version_modelo']} ({fila['estado_modelo']})")
+    print(f"  {'backend':<9} {'carga s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'img/s':>8} {'RSS MB':>7} "
+          f"{'exact.':>7} {'prec.':>6} {'recall':>6} {'ECE':>6} {'Brier':>6}")
+    for backend, r in resultados.items():
+        if 'omitido' in r:
+            print(f"  {backend:<9} omitido: {r['omitido']}")
+            continue
+        print(f"  {backend:<9} {_formato(r['carga_s'], '8.2f')} {r['latencia_p50_ms']:7.1f} "
+              f"{r['latencia_p95_ms']:7.1f} {r['latencia_p99_ms']:7.1f} {_formato(r['imagenes_por_s'], '8.1f')} "
+              f"{r['rss_pico_mb']:7.0f} {r['exactitud']:7.3f} {_formato(r['precision_positiva'], '6.3f')} "
+              f"{_formato(r['recall'], '6.3f')} {r['ece']:6.3f} {r['brier']:6.3f}")
+
+
+def main():
+    from mysql.connector import Error
+    from models.registro_modelos import listar_modelos, actualizar_parametros, UMBRAL
+    from models.cliente_inferencia import DIRECCION
+    from models.cascada import RUTA_CABEZA
+    from train_cascada import train_dir
+
+    parser = argparse.ArgumentParser(description="Benchmark de las versiones de modelos_ia")
+    parser.add_argument('--modelo', type=int, action='append', help="id_modelo a medir; se puede repetir")
+    parser.add_argument('--backend', choices=BACKENDS, action='append',
+                        help="Backend a medir; se puede repetir (por defecto los disponibles)")
+    parser.add_argument('--candidato', type=int, default=None, help="Versión que no debe empeorar")
+    parser.add_argument('--base', type=int, default=None, help="Versión de referencia (por defecto la activa)")
+    parser.add_argument('--dataset', default=train_dir, help="Carpeta con una subcarpeta por clase")
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--muestras', type=int, default=MUESTRAS_LATENCIA,
+                        help="Imágenes sueltas para la latencia")
+    parser.add_argument('--repeticiones', type=int, default=1, help="Pasadas del conjunto para el rendimiento")
+    parser.add_argument('--tolerancia-exactitud', type=float, default=0.01,
+                        help="Caída aceptada de exactitud, precisión y recall")
+    parser.add_argument('--tolerancia-ece', type=float, default=0.02)
+    parser.add_argument('--tolerancia-latencia', type=float, default=0.2,
+                        help="Fracción aceptada de latencia p95 extra o de rendimiento perdido")
+    parser.add_argument('--tolerancia-memoria', type=float, default=0.2)
+    parser.add_argument('--sin-guardar', action='store_true', help="No escribir en parametros_modelo")
+    parser.add_argument('--json', default=None, help="Guardar todos los resultados en este archivo")
+    args = parser.parse_args()
+
+    backends = args.backend or (['proceso'] + (['servidor'] if DIRECCION else [])
+                                + (['cascada'] if os.path.exists(RUTA_CABEZA) else []))
+    filas = listar_modelos()
+    if not filas:
+        print("⚠ No hay modelos de reconocimiento registrados en modelos_ia")
+        return 2
+    activo = next((f for f in filas if f['estado_modelo'] == 'activo'), None)
+    id_base = args.base or (activo['id_modelo'] if activo else None)
+    ids = set(args.modelo or [f['id_modelo'] for f in filas])
+    if args.candidato is not None:
+        if id_base is None:
+            print("⚠ No hay versión activa; indique --base")
+            return 2
+        ids |= {args.candidato, id_base}
+    filas = [f for f in filas if f['id_modelo'] in ids]
+    faltantes = {args.candidato, id_base} - {f['id_modelo'] for f in filas} if args.candidato is not None else set()
+    if faltantes:
+        print(f"⚠ No existen en modelos_ia: {sorted(faltantes)}")
+        return 2
+
+    dataset, indices, etiquetas, huella = conjunto_evaluacion(args.dataset)
+    if len(indices) == 0:
+        print(f"⚠ El conjunto de evaluación de {args.dataset} está vacío")
+        return 2
+    print(f"Conjunto de evaluación: {len(indices)} imágenes ({int(etiquetas.sum())} positivas), huella {huella}")
+
+    todos = {}
+    sin_guardar = []
+    for fila in filas:
+        resultados = {}
+        for backend in backends:
+            resultados[backend] = medir({
+                'id_modelo': fila['id_modelo'], 'version': fila['version_modelo'], 'ruta': fila['ruta_archivo'],
+                'backend': backend, 'direccion': DIRECCION, 'origen': args.dataset, 'indices': indices,
+                'etiquetas': etiquetas, 'tamano_lote': args.lote, 'muestras_latencia': args.muestras,
+                'repeticiones': args.repeticiones,
+            })
+        todos[fila['id_modelo']] = resultados
+        mostrar(fila, resultados)
+        if not args.sin_guardar:
+            try:
+                actualizar_parametros(fila['id_modelo'], {'benchmark': {
+                    'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'conjunto': {'huella': huella, 'imagenes': len(indices)},
+                    'umbral': UMBRAL,
+                    'backends': resultados,
+                }})
+            except Error as e:
+                # Sin cortar el benchmark: las demás versiones y la comparación siguen
+                print(f"⚠ No se guardó el benchmark del modelo {fila['id_modelo']}: {e} "
+                      "(¿parametros_modelo sigue como BIGINT? ver migrate_columns del instalador)")
+                sin_guardar.append(fila['id_modelo'])
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'conjunto': huella, 'modelos': todos}, f, ensure_ascii=False, indent=2)
+
+    if args.candidato is None or args.candidato == id_base:
+        return 2 if sin_guardar else 0
+    tolerancias = {'exactitud': args.tolerancia_exactitud, 'ece': args.tolerancia_ece,
+                   'latencia': args.tolerancia_latencia, 'memoria': args.tolerancia_memoria}
+    fallos = comparar(todos[args.candidato], todos[id_base], tolerancias)
+    if fallos:
+        print(f"\n✗ El modelo {args.candidato} empeora frente al {id_base}:")
+        for fallo in fallos:
+            print(f"  - {fallo}")
+        return 1
+    print(f"\n✅ El modelo {args.candidato} no empeora frente al {id_base}")
+    return 2 if sin_guardar else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# Buscar el mejor reparto de CPU (models/recursos_cpu.py) para esta máquina:
+# cada combinación de hilos de TensorFlow y OpenCV corre en un proceso nuevo
+# con varios hilos de petición simultáneos, como el proceso web bajo carga, y
+# se mide el rendimiento y la latencia p50/p95 por petición.
+#
+#   cd src && python -m benchmarks.bench_recursos --segundos 5
+#   cd src && python -m benchmarks.bench_recursos --inferencia modelo --peticiones 8 --aplicar
+#   cd src && python -m benchmarks.bench_recursos --rol inferencia --nucleos 2-7
+#
+# Cada petición decodifica un JPEG de 1280x720 (ingesta_imagen.decodificar),
+# calcula las características de la cascada y corre la inferencia. Con
+# --inferencia numpy la CNN se reemplaza por una carga fija en NumPy y sólo
+# se varían los hilos de OpenCV; --inferencia modelo carga --ruta en proceso.
+#
+# Se elige, entre las combinaciones con al menos el 90% del mejor
+# rendimiento, la de menor p95. Con --aplicar se guarda en
+# configuracion_sistema.recursos_cpu para el --rol indicado.
+import argparse
+import multiprocessing
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+ANCHO, ALTO = 1280, 720
+IMAGENES = 8
+
+
+def crear_inferencia(tipo, ruta):
+    if tipo == 'modelo':
+        from models.registro_modelos import cargar_modelo, preparar_lote
+        cargado = cargar_modelo(None, 'benchmark', ruta)
+        return lambda imagen: cargado.predecir(preparar_lote(imagen[np.newaxis])), \
+            cargado.tamano_entrada
+    pesos = np.random.default_rng(0).standard_normal((224 * 3, 1024)).astype(np.float32)
+
+    def inferir(imagen):
+        # ~0.3 GFLOP: del orden de una red pequeña en CPU
+        return imagen.reshape(224, -1).astype(np.float32) / 255.0 @ pesos
+    return inferir, (224, 224)
+
+
+def _imagenes():
+    from models.fuentes_video import FuenteSintetica
+    fuente = FuenteSintetica(ANCHO, ALTO)
+    datos = []
+    for _ in range(IMAGENES):
+        _, frame = fuente.leer()
+        datos.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return datos
+
+
+def _correr(tarea):
+    """
+    Tarea de un proceso nuevo: aplicar el reparto y atender peticiones.
+    """
+    from models.cascada import caracteristicas
+    from models.ingesta_imagen import decodificar
+    from models.recursos_cpu import gobernador
+
+    gobernador.aplicar(tarea['rol'], tarea['reparto'])
+    inferir, tamano = crear_inferencia(tarea['inferencia'], tarea['ruta'])
+    datos = _imagenes()
+
+    def peticion(i):
+        imagen = decodificar(datos[i % len(datos)], tamano)
+        caracteristicas(imagen)
+        inferir(imagen)
+
+    # Calentar cada camino antes de medir
+    for i in range(3):
+        peticion(i)
+
+    latencias = [[] for _ in range(tarea['peticiones'])]
+    inicio_comun = threading.Barrier(tarea['peticiones'] + 1)
+    limite = []
+
+    def hilo(indice):
+        inicio_comun.wait()
+        i = indice
+        while time.monotonic() < limite[0]:
+            t = time.perf_counter()
+            peticion(i)
+            latencias[indice].append((time.perf_counter() - t) * 1000)
+            i += 1
+
+    hilos = [threading.Thread(target=hilo, args=(i,)) for i in range(tarea['peticiones'])]
+    for h in hilos:
+        h.start()
+    limite.append(time.monotonic() + tarea['segundos'])
+    uso = resource.getrusage(resource.RUSAGE_SELF)
+    inicio = time.perf_counter()
+    inicio_comun.wait()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+    fin = resource.getrusage(resource.RUSAGE_SELF)
+    todas = np.concatenate([np.array(l) for l in latencias if l]) if any(latencias) else np.zeros(1)
+    return {
+        'peticiones': len(todas),
+        'por_s': len(todas) / duracion,
+        'p50_ms': float(np.percentile(todas, 50)),
+        'p95_ms': float(np.percentile(todas, 95)),
+        'cpu_s': (fin.ru_utime + fin.ru_stime) - (uso.ru_utime + uso.ru_stime),
+        'estado': gobernador.estado(),
+    }
+
+
+def correr(tarea):
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+        return pool.submit(_correr, tarea).result()
+
+
+def combinaciones(total, inferencia, inter):
+    opciones = sorted({n for n in (1, 2, total // 2, total) if 1 <= n <= total})
+    hilos_tf = opciones if inferencia == 'modelo' else [1]
+    return [{'hilos_tf_intra': intra, 'hilos_tf_inter': inter, 'hilos_opencv': opencv}
+            for intra in hilos_tf for opencv in opciones]
+
+
+def elegir(filas, fraccion=0.9):
+    mejor_rendimiento = max(f['por_s'] for f in filas)
+    candidatas = [f for f in filas if f['por_s'] >= mejor_rendimiento * fraccion]
+    return min(candidatas, key=lambda f: f['p95_ms'])
+
+
+def main():
+    from models.recursos_cpu import ROLES, guardar_reparto, parsear_nucleos, nucleos_disponibles, reparto_automatico
+    from models.registro_modelos import RUTA_POR_DEFECTO
+
+    parser = argparse.ArgumentParser(description="Buscar el mejor reparto de hilos de TensorFlow y OpenCV")
+    parser.add_argument('--rol', choices=ROLES, default='web', help="Rol para el que se guarda el reparto")
+    parser.add_argument('--inferencia', choices=('numpy', 'modelo'), default='numpy')
+    parser.add_argument('--ruta', default=RUTA_POR_DEFECTO, help="Modelo Keras para --inferencia modelo")
+    parser.add_argument('--nucleos', default=None, help="Núcleos a los que fijar el proceso, p. ej. 0-3")
+    parser.add_argument('--peticiones', type=int, default=None,
+                        help="Hilos de petición simultáneos (por defecto, uno por núcleo)")
+    parser.add_argument('--inter', type=int, default=None, help="Hilos inter-op de TensorFlow")
+    parser.add_argument('--segundos', type=float, default=5.0, help="Duración de cada combinación")
+    parser.add_argument('--aplicar', action='store_true', help="Guardar el mejor reparto en configuracion_sistema")
+    args = parser.parse_args()
+
+    nucleos = parsear_nucleos(args.nucleos)
+    total = len(nucleos or nucleos_disponibles())
+    peticiones = args.peticiones or total
+    inter = args.inter or reparto_automatico(args.rol, total)['hilos_tf_inter']
+    print(f"{total} núcleos, {peticiones} hilos de petición, inferencia {args.inferencia}, "
+          f"{args.segundos:.0f} s por combinación")
+
+    filas = []
+    for reparto in combinaciones(total, args.inferencia, inter):
+        reparto['nucleos'] = nucleos
+        resultado = correr({'rol': args.rol, 'reparto': reparto, 'inferencia': args.inferencia, 'ruta': args.ruta,
+                            'peticiones': peticiones, 'segundos': args.segundos})
+        resultado['reparto'] = reparto
+        filas.append(resultado)
+        print(f"  TF {reparto['hilos_tf_intra']:>2}/{reparto['hilos_tf_inter']}  OpenCV {reparto['hilos_opencv']:>2}: "
+              f"{resultado['por_s']:7.1f} pet/s  p50 {resultado['p50_ms']:6.1f} ms  "
+              f"p95 {resultado['p95_ms']:6.1f} ms  CPU {resultado['cpu_s']:.1f} s")
+
+    mejor = elegir(filas)
+    reparto = mejor['reparto']
+    print(f"\nMejor reparto para '{args.rol}': TF intra {reparto['hilos_tf_intra']}, "
+          f"inter {reparto['hilos_tf_inter']}, OpenCV {reparto['hilos_opencv']} "
+          f"({mejor['por_s']:.1f} pet/s, p95 {mejor['p95_ms']:.1f} ms)")
+    if args.inferencia == 'numpy':
+        print("  (con --inferencia numpy los hilos de TensorFlow no se midieron)")
+    if args.aplicar:
+        if args.inferencia == 'numpy':
+            # Conservar los hilos de TensorFlow configurados o automáticos
+            from models.recursos_cpu import leer_reparto
+            reparto = dict(leer_reparto(args.rol), hilos_opencv=reparto['hilos_opencv'], nucleos=nucleos)
+        guardar_reparto(args.rol, reparto)
+        print("✅ Reparto guardado en configuracion_sistema.recursos_cpu")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# Reproducir clips grabados (o la fuente sintética) a través de generar_frames
+# de principio a fin y medir FPS sostenidos, latencia por etapa y CPU por
+# stream, sin webcam ni navegador.
+#
+#   cd src && python -m benchmarks.bench_replay --fuente archivo:../data/clips/mesa.mp4 --streams 2
+#   cd src && python -m benchmarks.bench_replay --fuente sintetica:640x480?frames=300 --sin-compuerta
+#
+# Cada stream corre en su propio hilo con su propia instancia de la fuente,
+# como varios clientes de /reconocimiento/video.
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+ETAPAS = ('lectura', 'inferencia', 'publicacion', 'codificacion')
+
+
+def correr_stream(indice, descripcion, args, resultados):
+    from models.fuentes_video import crear_fuente
+    from routes.recognition import generar_frames
+
+    etapas = {}
+    frames = 0
+    with crear_fuente(descripcion, nombre=f"replay-{indice}") as fuente:
+        inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+        for _ in generar_frames(fuente, sala=None, overlay=not args.sin_overlay, calidad=args.calidad,
+                                modo=args.modo, compuerta=not args.sin_compuerta,
+                                seguimiento=not args.sin_seguimiento, registrar=False, etapas=etapas):
+            frames += 1
+            if args.frames and frames >= args.frames:
+                break
+        duracion = time.perf_counter() - inicio
+        cpu_hilo = time.thread_time() - inicio_cpu
+    resultados[indice] = {
+        'fuente': descripcion,
+        'frames': frames,
+        'duracion_s': duracion,
+        'fps': frames / duracion if duracion else 0.0,
+        'cpu_hilo_s': cpu_hilo,
+        'etapas': {etapa: np.array(etapas.get(etapa, [0.0])) * 1000 for etapa in ETAPAS},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del stream de reconocimiento con clips grabados")
+    parser.add_argument('--fuente', action='append',
+                        help="Fuente de frames (ver models/fuentes_video.py); se puede repetir")
+    parser.add_argument('--streams', type=int, default=1, help="Streams simultáneos por fuente")
+    parser.add_argument('--frames', type=int, default=0, help="Máximo de frames por stream (0 = hasta el final)")
+    parser.add_argument('--modo', choices=('frame', 'regiones'), default='frame')
+    parser.add_argument('--calidad', type=int, default=80)
+    parser.add_argument('--sin-compuerta', action='store_true')
+    parser.add_argument('--sin-seguimiento', action='store_true')
+    parser.add_argument('--sin-overlay', action='store_true')
+    args = parser.parse_args()
+    fuentes = args.fuente or ['sintetica:640x480?frames=300']
+
+    # Cargar el modelo antes de medir
+    from models.registro_modelos import registro
+    with registro.usar():
+        pass
+
+    descripciones = [d for d in fuentes for _ in range(args.streams)]
+    resultados = [None] * len(descripciones)
+    hilos = [threading.Thread(target=correr_stream, args=(i, d, args, resultados))
+             for i, d in enumerate(descripciones)]
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    cpu_proceso = time.process_time() - inicio_cpu
+
+    print(f"{'stream':<8} {'frames':>7} {'FPS':>7} {'CPU hilo (s)':>13}  fuente")
+    for i, r in enumerate(resultados):
+        print(f"{i:<8} {r['frames']:>7} {r['fps']:>7.1f} {r['cpu_hilo_s']:>13.2f}  {r['fuente']}")
+    print()
+    print(f"{'etapa':<14} {'p50 (ms)':>9} {'p95 (ms)':>9} {'media (ms)':>11}")
+    for etapa in ETAPAS:
+        tiempos = np.concatenate([r['etapas'][etapa] for r in resultados])
+        print(f"{etapa:<14} {np.percentile(tiempos, 50):>9.2f} {np.percentile(tiempos, 95):>9.2f} "
+              f"{tiempos.mean():>11.2f}")
+    print()
+    total_frames = sum(r['frames'] for r in resultados)
+    # El CPU de los hilos de TensorFlow no se puede atribuir a un stream, así
+    # que se reparte el del proceso entre los streams
+    print(f"Total: {total_frames} frames en {duracion:.1f} s ({total_frames / duracion:.1f} FPS agregados); "
+          f"CPU del proceso {cpu_proceso:.1f} s = {cpu_proceso / duracion:.2f} núcleos, "
+          f"{cpu_proceso / len(resultados):.2f} s por stream")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# Comparar el rendimiento HTTP del servidor de desarrollo (python app.py,
+# debug=True) con el de producción (servidor_prefork.py, N workers x M hilos
+# con waitress) y, si está instalado, gunicorn con gunicorn.conf.py.
+#
+#   cd src && python -m benchmarks.bench_servidor --segundos 10
+#   cd src && GIL_SOCKETIO_EXTERNO=true GIL_SOCKETIO_COLA=redis://localhost:6379 \
+#       python -m benchmarks.bench_servidor --modo dev --modo prefork --workers 4 --hilos 8 \
+#       --ruta /reconocimiento/api/detectar --imagen ../data/entrenamiento/microscopio/001.jpg
+#
+# Cada servidor se lanza en su propio proceso en un puerto libre; la carga la
+# generan --clientes procesos con --concurrencia conexiones keep-alive cada
+# uno (en procesos aparte para que el GIL del cliente no sea el límite).
+import argparse
+import http.client
+import mimetypes
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODOS = ('dev', 'prefork', 'gunicorn')
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def servir_dev(puerto):
+    """
+    Lo mismo que `python app.py`, en otro puerto y sin el recargador.
+    """
+    from app import create_app, iniciar_worker, apagar
+    from extensiones import socketio
+    app = create_app()
+    iniciar_worker(app)
+    try:
+        # Sin terminal, Flask-SocketIO se niega a arrancar Werkzeug salvo que
+        # se le pida expresamente
+        socketio.run(app, port=puerto, debug=True, use_reloader=False,
+                     allow_unsafe_werkzeug=True)
+    finally:
+        apagar(app)
+
+
+def lanzar(modo, puerto, args):
+    if modo == 'dev':
+        comando = [sys.executable, '-m', 'benchmarks.bench_servidor', '--servir-dev', str(puerto)]
+    elif modo == 'prefork':
+        comando = [sys.executable, 'servidor_prefork.py', '--puerto', str(puerto),
+                   '--workers', str(args.workers), '--hilos', str(args.hilos)]
+    else:
+        comando = ['gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{puerto}',
+                   '-w', str(args.workers), '--threads', str(args.hilos), 'wsgi:app']
+    return subprocess.Popen(comando, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def esperar_listo(puerto, proceso, espera=120):
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            return False
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=2)
+            conexion.request('GET', '/api/status')
+            if conexion.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def detener(proceso):
+    # start_new_session: la señal llega también a los workers de ese servidor
+    try:
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait(30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proceso.pid, signal.SIGKILL)
+        proceso.wait()
+    except ProcessLookupError:
+        pass
+
+
+def cuerpo_multipart(ruta_imagen):
+    limite = 'gil-bench-limite'
+    with open(ruta_imagen, 'rb') as f:
+        datos = f.read()
+    tipo = mimetypes.guess_type(ruta_imagen)[0] or 'application/octet-stream'
+    cuerpo = (f'--{limite}\r\nContent-Disposition: form-data; name="imagen"; '
+              f'filename="{os.path.basename(ruta_imagen)}"\r\nContent-Type: {tipo}\r\n\r\n').encode()
+    cuerpo += datos + f'\r\n--{limite}--\r\n'.encode()
+    return cuerpo, {'Content-Type': f'multipart/form-data; boundary={limite}'}
+
+
+def _cliente(tarea):
+    """
+    Tarea de un proceso cliente: `concurrencia` hilos pidiendo hasta el límite.
+    """
+    cuerpo, cabeceras = cuerpo_multipart(tarea['imagen']) if tarea['imagen'] else (None, {})
+    metodo = 'POST' if cuerpo is not None else 'GET'
+    latencias, errores = [], [0]
+    lock = threading.Lock()
+
+    def hilo():
+        conexion = None
+        propias = []
+        while time.time() < tarea['limite']:
+            try:
+                if conexion is None:
+                    conexion = http.client.HTTPConnection('127.0.0.1', tarea['puerto'], timeout=30)
+                inicio = time.perf_counter()
+                conexion.request(metodo, tarea['ruta'], body=cuerpo, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                if respuesta.status >= 500:
+                    raise OSError(f"HTTP {respuesta.status}")
+                propias.append((time.perf_counter() - inicio) * 1000)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errores[0] += 1
+                if conexion is not None:
+                    conexion.close()
+                conexion = None
+        with lock:
+            latencias.extend(propias)
+
+    hilos = [threading.Thread(target=hilo) for _ in range(tarea['concurrencia'])]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return latencias, errores[0]
+
+
+def cargar(puerto, args):
+    limite = time.time() + args.segundos
+    tarea = {'puerto': puerto, 'ruta': args.ruta, 'imagen': args.imagen, 'concurrencia': args.concurrencia,
+             'limite': limite}
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.clientes, mp_context=contexto) as pool:
+        resultados = list(pool.map(_cliente, [tarea] * args.clientes))
+    latencias = np.array([l for propias, _ in resultados for l in propias])
+    errores = sum(e for _, e in resultados)
+    if len(latencias) == 0:
+        return {'peticiones': 0, 'por_s': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'errores': errores}
+    return {
+        'peticiones': len(latencias),
+        'por_s': len(latencias) / args.segundos,
+        'p50_ms': float(np.percentile(latencias, 50)),
+        'p95_ms': float(np.percentile(latencias, 95)),
+        'p99_ms': float(np.percentile(latencias, 99)),
+        'errores': errores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento HTTP: servidor de desarrollo frente a producción")
+    parser.add_argument('--modo', choices=MODOS, action='append', help="Servidor a medir; se puede repetir")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Más de uno requiere GIL_SOCKETIO_EXTERNO y GIL_SOCKETIO_COLA (ver app.py)")
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--ruta', default='/api/status')
+    parser.add_argument('--imagen', default=None, help="Enviar esta imagen por POST (campo 'imagen')")
+    parser.add_argument('--clientes', type=int, default=2, help="Procesos generadores de carga")
+    parser.add_argument('--concurrencia', type=int, default=8, help="Conexiones por proceso cliente")
+    parser.add_argument('--segundos', type=float, default=10.0)
+    parser.add_argument('--servir-dev', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir_dev is not None:
+        servir_dev(args.servir_dev)
+        return 0
+    if args.imagen:
+        args.imagen = os.path.abspath(args.imagen)
+
+    modos = args.modo or ['dev', 'prefork'] + (['gunicorn'] if shutil.which('gunicorn') else [])
+    print(f"{args.clientes} x {args.concurrencia} conexiones, {args.segundos:.0f} s, "
+          f"{'POST' if args.imagen else 'GET'} {args.ruta}")
+    filas = {}
+    for modo in modos:
+        puerto = puerto_libre()
+        proceso = lanzar(modo, puerto, args)
+        try:
+            if not esperar_listo(puerto, proceso):
+                print(f"  {modo:<9} no arrancó (código {proceso.poll()})")
+                continue
+            filas[modo] = cargar(puerto, args)
+        finally:
+            detener(proceso)
+        r = filas[modo]
+        detalle = '' if modo == 'dev' else f" ({args.workers} workers x {args.hilos} hilos)"
+        if r['peticiones'] == 0:
+            print(f"  {modo:<9} sin respuestas, {r['errores']} errores{detalle}")
+            continue
+        print(f"  {modo:<9} {r['por_s']:8.1f} pet/s  p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms  "
+              f"p99 {r['p99_ms']:6.1f} ms  errores {r['errores']}{detalle}")
+    if 'dev' in filas and filas['dev']['por_s']:
+        for modo, r in filas.items():
+            if modo != 'dev':
+                print(f"  {modo} / dev: {r['por_s'] / filas['dev']['por_s']:.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
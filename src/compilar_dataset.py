@@ -0,0 +1,30 @@
+# Compilar las imágenes de entrenamiento a un almacén uint8 listo para usar.
+#
+#   python compilar_dataset.py                       # data/entrenamiento
+#   python compilar_dataset.py --origen ../data/categorias --procesos 4
+import argparse
+import os
+import time
+
+from models.dataset_compilado import compilar, directorio_compilado
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compilar un dataset de imágenes")
+    parser.add_argument('--origen', default=os.path.join(BASE_DIR, '..', 'data', 'entrenamiento'))
+    parser.add_argument('--procesos', type=int, default=None)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resumen = compilar(args.origen, procesos=args.procesos)
+    duracion = time.perf_counter() - inicio
+
+    print(f"✅ Dataset compilado en {directorio_compilado(args.origen)} ({duracion:.1f} s)")
+    for clave, valor in resumen.items():
+        print(f"  {clave}: {valor}")
+
+
+if __name__ == '__main__':
+    main()
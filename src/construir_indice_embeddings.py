@@ -0,0 +1,57 @@
+# Reconstruir el índice de embeddings a partir de las fotos de referencia
+# guardadas en data/referencias/<id_equipo>/ (una carpeta por equipo).
+import os
+import sys
+
+import cv2
+
+from gil_database_connection import get_db_connection
+from models.indice_embeddings import IndiceEmbeddings, extraer_embeddings
+
+DIRECTORIO_REFERENCIAS = os.path.join(os.path.dirname(__file__), '..', 'data', 'referencias')
+EXTENSIONES = ('.jpg', '.jpeg', '.png')
+TAMANO_LOTE = 32
+
+
+def equipos_dados_de_baja():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id_equipo FROM equipos WHERE estado_equipo = 'dado_baja'")
+    ids = {fila[0] for fila in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return ids
+
+
+def main():
+    indice = IndiceEmbeddings()
+    # Empezar desde cero: el índice se vuelve a crear al cargarlo
+    for ruta in (indice.ruta_matriz, indice.ruta_meta):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    excluidos = equipos_dados_de_baja()
+    total = 0
+    equipos = 0
+    for carpeta in sorted(os.listdir(DIRECTORIO_REFERENCIAS)):
+        if not carpeta.isdigit() or int(carpeta) in excluidos:
+            continue
+        id_equipo = int(carpeta)
+        directorio = os.path.join(DIRECTORIO_REFERENCIAS, carpeta)
+        imagenes = []
+        for nombre in sorted(os.listdir(directorio)):
+            if nombre.lower().endswith(EXTENSIONES):
+                img = cv2.imread(os.path.join(directorio, nombre), cv2.IMREAD_COLOR)
+                if img is not None:
+                    imagenes.append(img)
+        for i in range(0, len(imagenes), TAMANO_LOTE):
+            indice.agregar(id_equipo, extraer_embeddings(imagenes[i:i + TAMANO_LOTE]))
+        total += len(imagenes)
+        equipos += 1 if imagenes else 0
+
+    print(f"✅ Índice reconstruido: {total} imágenes de {equipos} equipos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+from flask_socketio import SocketIO
+
+# Canal en tiempo real (Flask-SocketIO). Se inicializa en app.py con init_app.
+# async_mode fijo en 'threading': con eventlet instalado Flask-SocketIO lo
+# elegiría solo, y sin monkey-patch las cámaras, los hilos en segundo plano y
+# TensorFlow bloquearían su hub.
+socketio = SocketIO(cors_allowed_origins='*', async_mode='threading')
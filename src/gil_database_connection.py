@@ -1,3 +1,4 @@
+import json
 import mysql.connector
 import os
 from dotenv import load_dotenv
@@ -12,6 +13,46 @@ class DatabaseConfig:
         self.password = os.getenv('DB_PASSWORD', 'gil_password_2025')
         self.database = os.getenv('DB_NAME', 'gil_laboratorios')
 
+def get_db_connection(config=None):
+    config = config or DatabaseConfig()
+    return mysql.connector.connect(
+        host=config.host,
+        user=config.user,
+        password=config.password,
+        database=config.database,
+        port=config.port
+    )
+
+def leer_configuracion(clave, defecto=None):
+    """
+    Leer un valor de configuracion_sistema convertido según tipo_dato.
+    Devuelve `defecto` si la clave no existe o la base no está disponible.
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT valor_config, tipo_dato FROM configuracion_sistema WHERE clave_config = %s",
+                       (clave,))
+        fila = cursor.fetchone()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"⚠ No se pudo leer la configuración '{clave}': {e}")
+        return defecto
+    if fila is None or fila[0] is None:
+        return defecto
+    valor, tipo = fila
+    try:
+        if tipo == 'integer':
+            return int(valor)
+        if tipo == 'boolean':
+            return valor.strip().lower() in ('true', '1', 'si', 'sí')
+        if tipo == 'json':
+            return json.loads(valor)
+    except ValueError:
+        return defecto
+    return valor
+
 class GILSystem:
     def __init__(self, config):
         self.config = config
@@ -0,0 +1,46 @@
+# Configuración de gunicorn: N workers x M hilos (gthread) con la aplicación
+# precargada en el maestro, para compartir los módulos copy-on-write como en
+# servidor_prefork.py.
+#
+#   cd src && gunicorn -c gunicorn.conf.py wsgi:app
+#   GIL_SOCKETIO_EXTERNO=true GIL_SOCKETIO_COLA=redis://localhost:6379 GIL_WORKERS=4 GIL_HILOS=8 \
+#       gunicorn -c gunicorn.conf.py -b 0.0.0.0:8000 wsgi:app
+#
+# Un solo worker por defecto: con más, Socket.IO tiene que servirse en otra
+# instancia de un worker (ver comprobar_workers en app.py) y gunicorn se niega
+# a arrancar si no está configurado así.
+import gc
+import os
+
+bind = os.getenv('GIL_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('GIL_WORKERS', '1'))
+threads = int(os.getenv('GIL_HILOS', '8'))
+worker_class = 'gthread'
+preload_app = True
+# Los videos y el stream MJPEG mantienen la conexión abierta
+timeout = 120
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # -w en la línea de comandos reemplaza a `workers`: comprobar el valor final
+    from app import comprobar_workers
+    comprobar_workers(server.cfg.workers)
+
+
+def when_ready(server):
+    # Todo lo importado por wsgi.py queda fuera de la recolección
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from app import iniciar_worker
+    iniciar_worker(app)
+
+
+def worker_exit(server, worker):
+    from wsgi import app
+    from app import apagar
+    apagar(app)
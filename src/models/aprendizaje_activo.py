@@ -0,0 +1,118 @@
+"""
+Aprendizaje activo a partir de validacion_manual de reconocimientos_imagen.
+
+Cada reconocimiento validado a mano es una etiqueta gratis para el modelo
+binario de microscopio: 'correcto' confirma la decisión que tomó el modelo
+(confianza > UMBRAL) y 'incorrecto' la invierte, así que los 'incorrecto'
+son justamente los errores del modelo.
+
+Para que las personas validen primero lo que más enseña al modelo, la cola de
+revisión ordena los reconocimientos pendientes por incertidumbre: los de
+confianza más cercana a UMBRAL primero (muestreo por margen).
+
+El ajuste fino de la cabeza sobre estas muestras lo hace train_activo.py con
+las características cacheadas del backbone (cache_caracteristicas.py).
+"""
+import hashlib
+import os
+
+from gil_database_connection import get_db_connection
+from models.reevaluacion import ruta_imagen
+from models.registro_modelos import UMBRAL
+
+VALIDACIONES = ('correcto', 'incorrecto')
+
+
+def etiqueta_validada(confianza, validacion):
+    """
+    1.0 si la imagen tiene un microscopio según la validación, 0.0 si no.
+    """
+    acerto_positivo = float(confianza) > UMBRAL
+    return float(acerto_positivo if validacion == 'correcto' else not acerto_positivo)
+
+
+def cosechar(desde_id=0):
+    """
+    Devolver las muestras validadas cuya imagen sigue en disco, como dicts
+    con id_reconocimiento, ruta, etiqueta, confianza y validacion_manual.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id_reconocimiento, imagen_original_url, confianza_deteccion, validacion_manual
+        FROM reconocimientos_imagen
+        WHERE id_reconocimiento > %s AND validacion_manual IN ('correcto', 'incorrecto')
+          AND imagen_original_url IS NOT NULL AND confianza_deteccion IS NOT NULL
+        ORDER BY id_reconocimiento
+    """, (desde_id,))
+    muestras = []
+    for fila in cursor:
+        ruta = ruta_imagen(fila['imagen_original_url'])
+        if not os.path.exists(ruta):
+            continue
+        muestras.append({
+            'id_reconocimiento': fila['id_reconocimiento'],
+            'ruta': ruta,
+            'confianza': float(fila['confianza_deteccion']),
+            'validacion_manual': fila['validacion_manual'],
+            'etiqueta': etiqueta_validada(fila['confianza_deteccion'], fila['validacion_manual']),
+        })
+    cursor.close()
+    conn.close()
+    return muestras
+
+
+def en_reserva(id_reconocimiento, proporcion=0.2):
+    """
+    Asignación estable de una muestra cosechada al conjunto de evaluación,
+    para que la misma fila nunca se use para entrenar en otra ronda.
+    """
+    digest = hashlib.sha1(f"reconocimiento:{id_reconocimiento}".encode()).digest()
+    return digest[0] < 256 * proporcion
+
+
+def cola_revision(limite=20, id_modelo=None):
+    """
+    Reconocimientos pendientes más inciertos primero (confianza cercana a
+    UMBRAL). Con id_modelo se limitan a los puntuados por ese modelo.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    filtro_modelo = "AND id_modelo_usado = %s" if id_modelo is not None else ""
+    parametros = (UMBRAL,) + ((id_modelo,) if id_modelo is not None else ()) + (limite,)
+    cursor.execute(f"""
+        SELECT id_reconocimiento, imagen_original_url, confianza_deteccion, id_equipo_detectado,
+               id_modelo_usado, fecha_reconocimiento,
+               ABS(confianza_deteccion - %s) AS margen
+        FROM reconocimientos_imagen
+        WHERE validacion_manual = 'pendiente' AND imagen_original_url IS NOT NULL
+          AND confianza_deteccion IS NOT NULL {filtro_modelo}
+        ORDER BY margen ASC, id_reconocimiento DESC
+        LIMIT %s
+    """, parametros)
+    filas = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    for fila in filas:
+        fila['confianza_deteccion'] = float(fila['confianza_deteccion'])
+        fila['margen'] = float(fila['margen'])
+    return filas
+
+
+def registrar_validacion(id_reconocimiento, validacion):
+    """
+    Guardar la revisión de una persona. Devuelve False si la fila no existe.
+    """
+    if validacion not in VALIDACIONES:
+        raise ValueError(f"Validación no válida: {validacion}")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM reconocimientos_imagen WHERE id_reconocimiento = %s", (id_reconocimiento,))
+    existe = cursor.fetchone() is not None
+    if existe:
+        cursor.execute("UPDATE reconocimientos_imagen SET validacion_manual = %s WHERE id_reconocimiento = %s",
+                       (validacion, id_reconocimiento))
+        conn.commit()
+    cursor.close()
+    conn.close()
+    return existe
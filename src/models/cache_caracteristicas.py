@@ -0,0 +1,207 @@
+"""
+Caché en disco de las características del backbone congelado (MobileNetV2).
+
+Como el backbone no se entrena, su salida para una misma imagen y la misma
+variante de aumento es siempre igual. Se calcula una sola vez y se guarda en
+un .npy abierto como memmap; la clave de cada fila es el hash SHA-1 del
+contenido del archivo más el número de variante, así que renombrar o mover
+imágenes no invalida la caché y las imágenes nuevas se agregan sin recalcular
+las demás.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cache')
+DIMENSION = 1280
+TAMANO_LOTE = 32
+
+# Variantes de aumento deterministas: 0 es siempre la imagen original
+VARIANTES = ('original', 'espejo', 'zoom', 'brillo', 'rotacion')
+
+_backbone = None
+_backbone_lock = threading.Lock()
+
+
+def obtener_backbone():
+    """
+    MobileNetV2 congelado con global average pooling. Recibe RGB en [0, 1],
+    igual que microscopio_model.h5, para que la cabeza entrenada sobre estas
+    características se pueda montar encima sin cambiar el preprocesamiento.
+    """
+    global _backbone
+    with _backbone_lock:
+        if _backbone is None:
+            from tensorflow.keras.applications import MobileNetV2  # type: ignore
+            _backbone = MobileNetV2(weights='imagenet', include_top=False,
+                                    pooling='avg', input_shape=(224, 224, 3))
+            _backbone.trainable = False
+    return _backbone
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha1()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def aplicar_variante(imagen, variante):
+    """
+    Aplicar una variante de aumento a una imagen RGB uint8 de 224x224.
+    """
+    nombre = VARIANTES[variante]
+    if nombre == 'espejo':
+        return imagen[:, ::-1]
+    if nombre == 'zoom':
+        margen = int(224 * 0.1)
+        return cv2.resize(imagen[margen:-margen, margen:-margen], (224, 224))
+    if nombre == 'brillo':
+        return np.clip(imagen.astype(np.float32) * 1.2, 0, 255).astype(np.uint8)
+    if nombre == 'rotacion':
+        matriz = cv2.getRotationMatrix2D((112, 112), 15, 1.0)
+        return cv2.warpAffine(imagen, matriz, (224, 224), borderMode=cv2.BORDER_REFLECT)
+    return imagen
+
+
+def cargar_imagen(ruta):
+    """
+    Leer una imagen del disco como RGB uint8 de 224x224, o None si no es válida.
+    """
+    imagen = cv2.imread(ruta, cv2.IMREAD_COLOR)
+    if imagen is None:
+        return None
+    return cv2.cvtColor(cv2.resize(imagen, (224, 224), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+
+
+class CacheCaracteristicas:
+    """
+    Matriz de características (filas float32) con un índice clave -> fila.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_CACHE, dimension=DIMENSION):
+        self.directorio = directorio
+        self.ruta_matriz = os.path.join(directorio, 'caracteristicas.npy')
+        self.ruta_indice = os.path.join(directorio, 'caracteristicas_indice.json')
+        self.dimension = dimension
+        self.indice = {}
+        self.matriz = None
+
+    def cargar(self):
+        if self.matriz is not None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        if os.path.exists(self.ruta_indice) and os.path.exists(self.ruta_matriz):
+            with open(self.ruta_indice, encoding='utf-8') as f:
+                self.indice = json.load(f)
+            self.matriz = np.load(self.ruta_matriz, mmap_mode='r+')
+        else:
+            self.indice = {}
+            self.matriz = np.lib.format.open_memmap(
+                self.ruta_matriz, mode='w+', dtype=np.float32, shape=(256, self.dimension))
+            self._guardar_indice()
+
+    def _guardar_indice(self):
+        temporal = self.ruta_indice + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.indice, f)
+        os.replace(temporal, self.ruta_indice)
+
+    def _asegurar_capacidad(self, filas):
+        if filas <= self.matriz.shape[0]:
+            return
+        capacidad = max(filas, self.matriz.shape[0] * 2)
+        usadas = len(self.indice)
+        temporal = self.ruta_matriz + '.tmp.npy'
+        nueva = np.lib.format.open_memmap(temporal, mode='w+', dtype=np.float32,
+                                          shape=(capacidad, self.dimension))
+        nueva[:usadas] = self.matriz[:usadas]
+        nueva.flush()
+        del nueva
+        self.matriz._mmap.close()
+        os.replace(temporal, self.ruta_matriz)
+        self.matriz = np.load(self.ruta_matriz, mmap_mode='r+')
+
+    @staticmethod
+    def clave(hash_contenido, variante):
+        return f"{hash_contenido}:{variante}"
+
+    def actualizar(self, rutas, variantes=1, cargador=cargar_imagen):
+        """
+        Calcular las características que falten para las rutas dadas.
+        Devuelve la lista de hashes (None para archivos ilegibles).
+        """
+        hashes = [hash_archivo(r) for r in rutas]
+        return self._completar(hashes, lambda i: cargador(rutas[i]), variantes)
+
+    def actualizar_compilado(self, dataset, variantes=1):
+        """
+        Igual que actualizar() pero leyendo del almacén de dataset_compilado,
+        donde las imágenes ya están decodificadas y los hashes calculados.
+        """
+        return self._completar(list(dataset.hashes), lambda i: dataset.imagenes[i], variantes)
+
+    def _completar(self, hashes, cargar_posicion, variantes):
+        self.cargar()
+        pendientes = []
+        vistos = set()
+        for posicion, h in enumerate(hashes):
+            if h in vistos:
+                continue
+            vistos.add(h)
+            faltantes = [v for v in range(variantes) if self.clave(h, v) not in self.indice]
+            if faltantes:
+                pendientes.append((posicion, h, faltantes))
+
+        if pendientes:
+            print(f"🔄 Calculando características de {len(pendientes)} imágenes nuevas")
+            backbone = obtener_backbone()
+            lote, claves = [], []
+
+            def procesar_lote():
+                salida = backbone.predict(np.stack(lote).astype(np.float32) / 255.0, verbose=0)
+                inicio = len(self.indice)
+                self._asegurar_capacidad(inicio + len(claves))
+                self.matriz[inicio:inicio + len(claves)] = salida
+                for desplazamiento, clave in enumerate(claves):
+                    self.indice[clave] = inicio + desplazamiento
+                lote.clear()
+                claves.clear()
+
+            for posicion, h, faltantes in pendientes:
+                imagen = cargar_posicion(posicion)
+                if imagen is None:
+                    hashes = [None if x == h else x for x in hashes]
+                    continue
+                for v in faltantes:
+                    lote.append(aplicar_variante(np.asarray(imagen), v))
+                    claves.append(self.clave(h, v))
+                    if len(lote) >= TAMANO_LOTE:
+                        procesar_lote()
+            if lote:
+                procesar_lote()
+            self.matriz.flush()
+            self._guardar_indice()
+        return hashes
+
+    def obtener(self, hashes, variantes=1):
+        """
+        Devolver (X, posiciones): las características de cada hash y variante, y
+        la posición en `hashes` a la que corresponde cada fila de X.
+        """
+        self.cargar()
+        filas, posiciones = [], []
+        for posicion, h in enumerate(hashes):
+            if h is None:
+                continue
+            for v in range(variantes):
+                fila = self.indice.get(self.clave(h, v))
+                if fila is not None:
+                    filas.append(fila)
+                    posiciones.append(posicion)
+        return np.asarray(self.matriz[filas]), np.array(posiciones, dtype=np.int64)
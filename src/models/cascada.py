@@ -0,0 +1,233 @@
+"""
+Cascada de confianza para detectar_equipo.
+
+La mayoría de las fotos son casos claros (un microscopio en primer plano o
+una mesa vacía) y no necesitan MobileNetV2 a 224x224. La primera etapa es una
+regresión logística sobre histogramas de color (HSV) y de bordes (orientación
+del gradiente y densidad de Canny) calculados a 128 px, que cuesta un par
+de milisegundos en CPU. Sólo cuando su probabilidad cae dentro de la banda
+de incertidumbre [inferior, superior] se escala al modelo completo.
+
+La banda se lee de configuracion_sistema ('cascada_banda_incertidumbre',
+JSON {"inferior": .., "superior": ..}) y se puede activar o desactivar con
+'cascada_activa'; ambas se releen cada INTERVALO_CONFIG segundos. La cabeza
+barata se entrena con train_cascada.py, que además imprime la tabla de tasa
+de escalado frente a precisión y latencia para elegir la banda.
+
+Una fracción GIL_CASCADA_AUDITORIA de las respuestas de la etapa barata se
+verifica también con el modelo completo para medir en producción cuánto se
+aleja la cascada del modelo completo.
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from gil_database_connection import leer_configuracion
+from models.registro_modelos import DIRECTORIO_MODELOS, UMBRAL
+
+RUTA_CABEZA = os.path.join(DIRECTORIO_MODELOS, 'cascada_histogramas.npz')
+LADO = 128
+BINS_HSV = (8, 4, 4)
+BINS_ORIENTACION = 9
+BANDA_POR_DEFECTO = (0.15, 0.85)
+INTERVALO_CONFIG = float(os.getenv('GIL_CASCADA_INTERVALO', '60'))
+FRACCION_AUDITORIA = float(os.getenv('GIL_CASCADA_AUDITORIA', '0.02'))
+
+
+def caracteristicas(frame):
+    """
+    Vector de histogramas de un frame BGR: color HSV 8x4x4, orientación del
+    gradiente ponderada por magnitud y fracción de bordes de Canny. Se usa la
+    raíz cuadrada de cada histograma normalizado (distancia de Hellinger).
+    """
+    imagen = cv2.resize(frame, (LADO, LADO), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
+    color = cv2.calcHist([hsv], [0, 1, 2], None, list(BINS_HSV), [0, 180, 0, 256, 0, 256]).ravel()
+    color /= color.sum() or 1.0
+
+    gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    gx = cv2.Sobel(gris, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gris, cv2.CV_32F, 0, 1, ksize=3)
+    magnitud, angulo = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+    # Orientación sin signo (0-180) para que un borde y su inverso cuenten igual
+    bins = (np.mod(angulo, 180.0) * (BINS_ORIENTACION / 180.0)).astype(np.int32).ravel()
+    orientacion = np.bincount(np.minimum(bins, BINS_ORIENTACION - 1), weights=magnitud.ravel(),
+                              minlength=BINS_ORIENTACION).astype(np.float32)
+    orientacion /= orientacion.sum() or 1.0
+
+    bordes = np.count_nonzero(cv2.Canny(gris, 80, 160)) / gris.size
+    return np.concatenate([np.sqrt(color), np.sqrt(orientacion), [np.sqrt(bordes)]]).astype(np.float32)
+
+
+def sigmoide(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+class CabezaHistogramas:
+    """
+    Regresión logística sobre caracteristicas() estandarizadas.
+    """
+
+    def __init__(self, media, escala, pesos, sesgo):
+        self.media = media
+        self.escala = escala
+        self.pesos = pesos
+        self.sesgo = float(sesgo)
+
+    @classmethod
+    def entrenar(cls, X, y, epochs=300, tasa=0.5, l2=1e-3):
+        """
+        Descenso de gradiente por lotes completos con clases balanceadas.
+        """
+        media = X.mean(axis=0)
+        escala = X.std(axis=0) + 1e-6
+        Z = (X - media) / escala
+        positivos = max(1.0, float(y.sum()))
+        negativos = max(1.0, float(len(y) - y.sum()))
+        peso_muestra = np.where(y > 0.5, len(y) / (2 * positivos), len(y) / (2 * negativos))
+        pesos = np.zeros(X.shape[1], dtype=np.float64)
+        sesgo = 0.0
+        for _ in range(epochs):
+            error = (sigmoide(Z @ pesos + sesgo) - y) * peso_muestra
+            pesos -= tasa * (Z.T @ error / len(y) + l2 * pesos)
+            sesgo -= tasa * error.mean()
+        return cls(media.astype(np.float32), escala.astype(np.float32), pesos.astype(np.float32), sesgo)
+
+    def predecir(self, X):
+        return sigmoide(((np.atleast_2d(X) - self.media) / self.escala) @ self.pesos + self.sesgo)
+
+    def guardar(self, ruta=RUTA_CABEZA):
+        np.savez(ruta, media=self.media, escala=self.escala, pesos=self.pesos, sesgo=self.sesgo)
+
+    @classmethod
+    def cargar(cls, ruta=RUTA_CABEZA):
+        with np.load(ruta) as datos:
+            return cls(datos['media'], datos['escala'], datos['pesos'], datos['sesgo'])
+
+
+class CascadaConfianza:
+    """
+    Etapa barata primero; el modelo completo (`completo(frame)` ->
+    probabilidad) sólo para los frames dentro de la banda de incertidumbre.
+    """
+
+    def __init__(self, completo, ruta=RUTA_CABEZA, intervalo=INTERVALO_CONFIG,
+                 fraccion_auditoria=FRACCION_AUDITORIA):
+        self.completo = completo
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.fraccion_auditoria = fraccion_auditoria
+        self.cabeza = None
+        self.cabeza_cargada = False
+        self.banda = BANDA_POR_DEFECTO
+        self.activa_config = True
+        self.config_leida = None
+        self.lock = threading.Lock()
+        self.contador_auditoria = 0
+        self.frames = 0
+        self.escalados = 0
+        self.tiempo_barato = 0.0
+        self.tiempo_completo = 0.0
+        self.auditados = 0
+        self.coincidencias = 0
+
+    def _actualizar(self):
+        """
+        Releer la banda y cargar la cabeza cada `intervalo` segundos. Sólo un
+        hilo lee y sin tener el lock: una base lenta o caída no detiene a las
+        peticiones, que siguen con los valores anteriores.
+        """
+        with self.lock:
+            ahora = time.monotonic()
+            if self.config_leida is not None and ahora - self.config_leida < self.intervalo:
+                return
+            self.config_leida = ahora
+            cargar_cabeza = not self.cabeza_cargada
+            self.cabeza_cargada = True
+
+        banda = leer_configuracion('cascada_banda_incertidumbre')
+        activa = leer_configuracion('cascada_activa', True)
+        cabeza = None
+        if cargar_cabeza:
+            if os.path.exists(self.ruta):
+                cabeza = CabezaHistogramas.cargar(self.ruta)
+            else:
+                print(f"⚠ No existe {self.ruta}; la cascada queda desactivada (ver train_cascada.py)")
+
+        with self.lock:
+            try:
+                inferior, superior = float(banda['inferior']), float(banda['superior'])
+                if 0.0 <= inferior <= superior <= 1.0:
+                    self.banda = (inferior, superior)
+            except (TypeError, KeyError, ValueError):
+                pass
+            self.activa_config = activa
+            if cabeza is not None:
+                self.cabeza = cabeza
+
+    def activa(self):
+        self._actualizar()
+        with self.lock:
+            return self.activa_config and self.cabeza is not None
+
+    def probabilidad(self, frame, completo=None):
+        """
+        Devolver (probabilidad, escalado). `completo` reemplaza al modelo
+        completo en esta llamada (el stream en vivo lo pasa por el planificador
+        de inferencia); si devuelve None (sin turno para el modelo), la
+        probabilidad también es None.
+        """
+        completo = completo or self.completo
+        if not self.activa():
+            return completo(frame), True
+        inicio = time.perf_counter()
+        barata = float(self.cabeza.predecir(caracteristicas(frame))[0])
+        medio = time.perf_counter()
+        inferior, superior = self.banda
+        escalar = inferior <= barata <= superior
+        auditar = False
+        if not escalar:
+            with self.lock:
+                self.contador_auditoria += 1
+                if self.contador_auditoria * self.fraccion_auditoria >= 1:
+                    self.contador_auditoria = 0
+                    auditar = True
+        completa = completo(frame) if escalar or auditar else None
+        fin = time.perf_counter()
+        if escalar and completa is None:
+            return None, True
+        with self.lock:
+            self.frames += 1
+            self.tiempo_barato += medio - inicio
+            if escalar:
+                self.escalados += 1
+                self.tiempo_completo += fin - medio
+            elif auditar and completa is not None:
+                self.auditados += 1
+                self.coincidencias += int((barata > UMBRAL) == (completa > UMBRAL))
+        return (completa, True) if escalar else (barata, False)
+
+    def estadisticas(self):
+        with self.lock:
+            directos = self.frames - self.escalados
+            barato_ms = self.tiempo_barato * 1000 / self.frames if self.frames else None
+            completo_ms = self.tiempo_completo * 1000 / self.escalados if self.escalados else None
+            tasa = self.escalados / self.frames if self.frames else None
+            return {
+                'activa': self.activa_config and self.cabeza is not None,
+                'banda': {'inferior': self.banda[0], 'superior': self.banda[1]},
+                'frames': self.frames,
+                'escalados': self.escalados,
+                'resueltos_barato': directos,
+                'tasa_escalado': tasa,
+                'barato_ms': barato_ms,
+                'completo_ms': completo_ms,
+                'latencia_media_ms': (barato_ms + tasa * completo_ms
+                                      if barato_ms is not None and completo_ms is not None else barato_ms),
+                # Respuestas baratas verificadas con el modelo completo
+                'auditados': self.auditados,
+                'concordancia': self.coincidencias / self.auditados if self.auditados else None,
+            }
@@ -0,0 +1,209 @@
+"""
+Cliente del servidor de inferencia (servidor_inferencia.py).
+
+Si GIL_INFERENCIA_DIRECCION está definida ('unix:/ruta.sock' o
+'tcp:127.0.0.1:8765'), los workers web no cargan TensorFlow: envían las
+imágenes al servidor, que tiene el modelo una sola vez y junta las peticiones
+de todos los workers en micro-lotes. Si el servidor no responde dentro de
+GIL_INFERENCIA_TIMEOUT segundos se usa el modelo en proceso (registro) y no
+se vuelve a intentar con el servidor durante ESPERA_REINTENTO segundos.
+
+Protocolo: cada mensaje es una cabecera JSON y un bloque de bytes opcional,
+precedidos por sus longitudes ('>II'). Los lotes viajan como arreglos NumPy
+crudos (uint8 de 0 a 255 o float32 ya normalizado) con su forma y dtype en la
+cabecera. Los lotes van siempre en BGR, el orden de OpenCV; el proceso que
+tiene el modelo los convierte a RGB (registro_modelos.preparar_lote).
+"""
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.registro_modelos import preparar_lote, registro
+
+DIRECCION = os.getenv('GIL_INFERENCIA_DIRECCION')
+TIEMPO_ESPERA = float(os.getenv('GIL_INFERENCIA_TIMEOUT', '2.0'))
+ESPERA_REINTENTO = 10.0
+CABECERA = struct.Struct('>II')
+
+
+class ErrorInferencia(Exception):
+    pass
+
+
+def abrir_socket(direccion, timeout=None):
+    tipo, _, destino = direccion.partition(':')
+    if tipo == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(destino)
+    elif tipo == 'tcp':
+        host, _, puerto = destino.rpartition(':')
+        sock = socket.create_connection((host or '127.0.0.1', int(puerto)), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        raise ValueError(f"Dirección de inferencia no válida: {direccion}")
+    return sock
+
+
+def _recibir_exacto(sock, n):
+    partes = bytearray()
+    while len(partes) < n:
+        bloque = sock.recv(min(n - len(partes), 1 << 20))
+        if not bloque:
+            raise ConnectionError("Conexión cerrada")
+        partes += bloque
+    return bytes(partes)
+
+
+def enviar_mensaje(sock, cabecera, datos=b''):
+    texto = json.dumps(cabecera).encode('utf-8')
+    sock.sendall(CABECERA.pack(len(texto), len(datos)) + texto)
+    if datos:
+        sock.sendall(datos)
+
+
+def recibir_mensaje(sock):
+    largo_cabecera, largo_datos = CABECERA.unpack(_recibir_exacto(sock, CABECERA.size))
+    cabecera = json.loads(_recibir_exacto(sock, largo_cabecera))
+    datos = _recibir_exacto(sock, largo_datos) if largo_datos else b''
+    return cabecera, datos
+
+
+def arreglo_a_mensaje(arreglo):
+    arreglo = np.ascontiguousarray(arreglo)
+    return {'forma': list(arreglo.shape), 'dtype': str(arreglo.dtype)}, arreglo.tobytes()
+
+
+def mensaje_a_arreglo(cabecera, datos):
+    return np.frombuffer(datos, dtype=cabecera['dtype']).reshape(cabecera['forma'])
+
+
+class ClienteInferencia:
+    """
+    Una conexión persistente por hilo. Los errores de red abren el circuito
+    durante ESPERA_REINTENTO segundos para no pagar el timeout en cada frame.
+    """
+
+    def __init__(self, direccion=DIRECCION, timeout=TIEMPO_ESPERA):
+        self.direccion = direccion
+        self.timeout = timeout
+        self.local = threading.local()
+        self.fallo_hasta = 0.0
+        self.id_modelo = None
+        self.version = None
+        self._tamano = None
+        self._ejecutor = None
+
+    def disponible(self):
+        return bool(self.direccion) and time.monotonic() >= self.fallo_hasta
+
+    def _socket(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is None:
+            sock = self.local.sock = abrir_socket(self.direccion, self.timeout)
+        return sock
+
+    def _cerrar(self):
+        sock = getattr(self.local, 'sock', None)
+        self.local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _llamar(self, cabecera, datos=b''):
+        try:
+            sock = self._socket()
+            enviar_mensaje(sock, cabecera, datos)
+            respuesta, datos = recibir_mensaje(sock)
+        except (OSError, ValueError) as e:
+            # socket.timeout es un OSError
+            self._cerrar()
+            self.fallo_hasta = time.monotonic() + ESPERA_REINTENTO
+            raise ErrorInferencia(f"Servidor de inferencia no disponible: {e}") from e
+        if not respuesta.get('ok'):
+            raise ErrorInferencia(respuesta.get('error', 'Error en el servidor de inferencia'))
+        self.id_modelo = respuesta.get('id_modelo', self.id_modelo)
+        self.version = respuesta.get('version', self.version)
+        return respuesta, datos
+
+    def predecir(self, lote):
+        cabecera, datos = arreglo_a_mensaje(lote)
+        respuesta, datos = self._llamar({'op': 'predecir', **cabecera}, datos)
+        return mensaje_a_arreglo(respuesta, datos)
+
+    def predecir_async(self, lote):
+        """
+        Enviar un lote sin bloquear; devuelve un concurrent.futures.Future.
+        """
+        if self._ejecutor is None:
+            self._ejecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cliente-inferencia')
+        return self._ejecutor.submit(self.predecir, lote)
+
+    def estado(self):
+        respuesta, _ = self._llamar({'op': 'estado'})
+        self._tamano = tuple(respuesta['tamano_entrada'])
+        return respuesta
+
+    def recargar(self):
+        respuesta, _ = self._llamar({'op': 'recargar'})
+        return respuesta
+
+    def tamano_entrada(self):
+        if self._tamano is None:
+            self.estado()
+        return self._tamano
+
+
+cliente = ClienteInferencia()
+
+
+def predecir_en_proceso(lote):
+    """
+    Predecir con el modelo del registro en este proceso. `lote` es BGR, como
+    lo entrega OpenCV; preparar_lote lo pasa al RGB del entrenamiento.
+    """
+    lote = preparar_lote(lote)
+    with registro.usar() as activo:
+        prediccion = activo.predecir(lote)
+    registro.enviar_sombra(lote, prediccion)
+    return prediccion
+
+
+def predecir_lote(lote):
+    """
+    Predecir un lote BGR (N, alto, ancho, 3) en el servidor de inferencia si
+    está configurado y responde; si no, en proceso.
+    """
+    if cliente.disponible():
+        try:
+            return cliente.predecir(lote)
+        except ErrorInferencia as e:
+            print(f"⚠ {e}; usando el modelo en proceso")
+    return predecir_en_proceso(lote)
+
+
+def tamano_entrada():
+    """
+    (ancho, alto) de entrada del modelo activo.
+    """
+    if cliente.disponible():
+        try:
+            return cliente.tamano_entrada()
+        except ErrorInferencia:
+            pass
+    with registro.usar() as activo:
+        return activo.tamano_entrada
+
+
+def id_modelo_activo():
+    if cliente.direccion and cliente.id_modelo is not None:
+        return cliente.id_modelo
+    return registro.estado()['id_modelo']
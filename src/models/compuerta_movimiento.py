@@ -0,0 +1,167 @@
+"""
+Compuerta de movimiento para el video en vivo.
+
+La cámara del laboratorio casi siempre ve la misma mesa sin cambios, así que
+correr la CNN en cada frame es CPU desperdiciada. Antes de inferir se reduce
+el frame a unos 64 px en escala de grises (muestreo y promedio en NumPy) y
+se compara con el frame en el que se infirió por última vez. Sólo se vuelve a
+inferir si cambió una fracción suficiente de píxeles o si pasó el intervalo
+de refresco; en otro caso se reutiliza el último resultado.
+
+Las diferencias de brillo global (auto-exposición de la cámara) se restan
+antes de contar píxeles cambiados para que no disparen la inferencia.
+
+Varios clientes de la misma cámara comparten la compuerta. El lock sólo
+protege la decisión y las métricas: el modelo corre fuera de él, y mientras
+un cliente infiere los demás reutilizan el último resultado en vez de
+esperarlo o repetir la misma inferencia.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+UMBRAL_CAMBIO = float(os.getenv('GIL_MOVIMIENTO_UMBRAL', '0.02'))
+INTERVALO_REFRESCO = float(os.getenv('GIL_MOVIMIENTO_REFRESCO', '5.0'))
+UMBRAL_PIXEL = 20
+LADO_REDUCIDO = 64
+PESOS_GRIS = np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR
+
+
+def reducir(frame, lado=LADO_REDUCIDO):
+    """
+    Frame BGR -> gris float32 de ~lado px. Se muestrea una rejilla del doble
+    de resolución y se promedian bloques de 2x2, que quita buena parte del
+    ruido del sensor sin recorrer el frame completo.
+    """
+    paso = max(1, max(frame.shape[:2]) // (lado * 2))
+    muestra = frame[paso // 2::paso, paso // 2::paso]
+    alto = muestra.shape[0] // 2 * 2
+    ancho = muestra.shape[1] // 2 * 2
+    muestra = muestra[:alto, :ancho].astype(np.float32)
+    gris = muestra @ PESOS_GRIS if muestra.ndim == 3 else muestra
+    return (gris[0::2, 0::2] + gris[1::2, 0::2] + gris[0::2, 1::2] + gris[1::2, 1::2]) * 0.25
+
+
+class CompuertaMovimiento:
+    """
+    Decide frame a frame si hay que correr el modelo o reutilizar el último
+    resultado, y lleva las métricas de frames omitidos y CPU ahorrada.
+    """
+
+    def __init__(self, umbral=UMBRAL_CAMBIO, refresco=INTERVALO_REFRESCO,
+                 umbral_pixel=UMBRAL_PIXEL, lado=LADO_REDUCIDO):
+        self.umbral = umbral
+        self.refresco = refresco
+        self.umbral_pixel = umbral_pixel
+        self.lado = lado
+        self.referencia = None
+        self.ultimo_resultado = None
+        self.ultima_inferencia = 0.0
+        self.ultima_puntuacion = None
+        self.en_curso = False
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.inferencias = 0
+        self.tiempo_compuerta = 0.0
+        self.tiempo_inferencia = 0.0
+        self.cpu_inferencia = 0.0
+
+    def puntuar(self, reducido):
+        """
+        Fracción de píxeles que cambiaron respecto a la referencia (0..1).
+        """
+        if self.referencia is None or self.referencia.shape != reducido.shape:
+            return 1.0
+        diferencia = reducido - self.referencia
+        diferencia -= diferencia.mean()
+        return float(np.count_nonzero(np.abs(diferencia) > self.umbral_pixel)) / diferencia.size
+
+    def evaluar(self, frame, inferir, corrio_modelo=None):
+        """
+        Devolver (resultado, inferido). `inferir()` sólo se llama si la
+        escena cambió o venció el refresco, y si ningún otro cliente está
+        infiriendo ya; si no, o si `inferir()` devuelve None, se devuelve el
+        último resultado. `corrio_modelo(resultado)` indica si el modelo se
+        ejecutó de verdad (el seguimiento puede resolver el frame sin él);
+        sólo esas llamadas cuentan como inferencias en las métricas.
+        """
+        with self.lock:
+            inicio = time.perf_counter()
+            reducido = reducir(frame, self.lado)
+            puntuacion = self.puntuar(reducido)
+            self.ultima_puntuacion = puntuacion
+            self.frames += 1
+            vencido = time.monotonic() - self.ultima_inferencia >= self.refresco
+            self.tiempo_compuerta += time.perf_counter() - inicio
+            if (puntuacion < self.umbral and not vencido) or self.en_curso:
+                return self.ultimo_resultado, False
+            self.en_curso = True
+
+        try:
+            inicio, inicio_cpu = time.perf_counter(), time.process_time()
+            resultado = inferir()
+            duracion = time.perf_counter() - inicio
+            # process_time incluye los hilos de TensorFlow del proceso (y los
+            # de otros clientes que inferían a la vez: es una estimación)
+            duracion_cpu = time.process_time() - inicio_cpu
+        finally:
+            with self.lock:
+                self.en_curso = False
+
+        if resultado is None:
+            # No se pudo inferir (p. ej. sin turno en el planificador): la
+            # referencia se mantiene para reintentar en el siguiente frame
+            with self.lock:
+                return self.ultimo_resultado, False
+        modelo = corrio_modelo(resultado) if corrio_modelo is not None else True
+        with self.lock:
+            if modelo:
+                self.tiempo_inferencia += duracion
+                self.cpu_inferencia += duracion_cpu
+                self.inferencias += 1
+                # El refresco cuenta desde la última vez que corrió el modelo
+                self.ultima_inferencia = time.monotonic()
+            self.referencia = reducido
+            self.ultimo_resultado = resultado
+        return resultado, True
+
+    def estadisticas(self):
+        with self.lock:
+            omitidos = self.frames - self.inferencias
+            costo_ms = self.tiempo_inferencia * 1000 / self.inferencias if self.inferencias else None
+            cpu_ms = self.cpu_inferencia * 1000 / self.inferencias if self.inferencias else None
+            return {
+                'frames': self.frames,
+                'inferencias': self.inferencias,
+                'omitidos': omitidos,
+                'ratio_omitidos': omitidos / self.frames if self.frames else 0.0,
+                'ultima_puntuacion': self.ultima_puntuacion,
+                'compuerta_ms': self.tiempo_compuerta * 1000 / self.frames if self.frames else None,
+                'inferencia_ms': costo_ms,
+                'inferencia_cpu_ms': cpu_ms,
+                # Estimado: frames omitidos por el costo medio de una inferencia
+                'cpu_ahorrado_s': omitidos * cpu_ms / 1000 if cpu_ms is not None else 0.0,
+            }
+
+
+_compuertas = {}
+_compuertas_lock = threading.Lock()
+
+
+def compuerta_para(clave):
+    """
+    Compuerta compartida por fuente de video (varios clientes de la misma
+    cámara reutilizan la misma inferencia).
+    """
+    with _compuertas_lock:
+        if clave not in _compuertas:
+            _compuertas[clave] = CompuertaMovimiento()
+        return _compuertas[clave]
+
+
+def estadisticas_compuertas():
+    with _compuertas_lock:
+        compuertas = dict(_compuertas)
+    return {clave: compuerta.estadisticas() for clave, compuerta in compuertas.items()}
@@ -0,0 +1,205 @@
+"""
+Almacén de imágenes de entrenamiento ya decodificadas y redimensionadas.
+
+compilar() recorre una carpeta con una subcarpeta por clase, valida y
+deduplica las imágenes por hash de contenido, las decodifica y redimensiona
+una sola vez en un pool de procesos, y escribe:
+
+    imagenes.npy     arreglo uint8 (N, alto, ancho, 3) en RGB
+    manifiesto.json  etiquetas, rutas de origen y hash de cada fila
+
+En compilaciones posteriores sólo se decodifican los archivos nuevos o
+modificados; el resto de filas se copia del almacén anterior.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+EXTENSIONES = ('.jpg', '.jpeg', '.png')
+TAMANO = (224, 224)
+LADO_MINIMO = 32
+
+
+class DatasetCompiladoError(Exception):
+    pass
+
+
+def directorio_compilado(origen):
+    nombre = os.path.basename(os.path.normpath(origen))
+    return os.path.join(DIRECTORIO_DATOS, 'compilado', nombre)
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha1()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _decodificar(ruta, tamano):
+    """
+    Tarea del pool: devolver (ruta, imagen RGB uint8 redimensionada, error).
+    """
+    datos = np.fromfile(ruta, dtype=np.uint8)
+    imagen = cv2.imdecode(datos, cv2.IMREAD_COLOR)
+    if imagen is None:
+        return ruta, None, "no se pudo decodificar"
+    alto, ancho = imagen.shape[:2]
+    if min(alto, ancho) < LADO_MINIMO:
+        return ruta, None, f"imagen demasiado pequeña ({ancho}x{alto})"
+    imagen = cv2.resize(imagen, tamano, interpolation=cv2.INTER_AREA)
+    return ruta, cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB), None
+
+
+def _listar(origen):
+    archivos = []
+    for clase in sorted(os.listdir(origen)):
+        carpeta = os.path.join(origen, clase)
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            if nombre.lower().endswith(EXTENSIONES):
+                archivos.append((os.path.join(clase, nombre), clase))
+    return archivos
+
+
+def _leer_anterior(destino):
+    ruta_manifiesto = os.path.join(destino, 'manifiesto.json')
+    ruta_imagenes = os.path.join(destino, 'imagenes.npy')
+    if not (os.path.exists(ruta_manifiesto) and os.path.exists(ruta_imagenes)):
+        return {'entradas': [], 'archivos': {}}, None
+    with open(ruta_manifiesto, encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    return manifiesto, np.load(ruta_imagenes, mmap_mode='r')
+
+
+def compilar(origen, destino=None, procesos=None, tamano=TAMANO):
+    """
+    Compilar (o actualizar) el almacén de `origen`. Devuelve un resumen.
+    """
+    destino = destino or directorio_compilado(origen)
+    os.makedirs(destino, exist_ok=True)
+    anterior, imagenes_anteriores = _leer_anterior(destino)
+    if anterior.get('tamano') and tuple(anterior['tamano']) != tuple(tamano):
+        anterior, imagenes_anteriores = {'entradas': [], 'archivos': {}}, None
+    fila_anterior = {e['hash']: e['fila'] for e in anterior['entradas']}
+
+    # 1. Hash de cada archivo; se reutiliza si mtime y tamaño no cambiaron
+    archivos = {}
+    por_hash = {}
+    for relativa, clase in _listar(origen):
+        ruta = os.path.join(origen, relativa)
+        estado = os.stat(ruta)
+        previo = anterior['archivos'].get(relativa)
+        if previo and previo['mtime'] == estado.st_mtime and previo['tamano'] == estado.st_size:
+            h = previo['hash']
+        else:
+            h = hash_archivo(ruta)
+        archivos[relativa] = {'mtime': estado.st_mtime, 'tamano': estado.st_size, 'hash': h}
+        por_hash.setdefault(h, []).append((relativa, clase))
+
+    # 2. Deduplicar; un mismo contenido con dos etiquetas distintas se descarta
+    entradas, conflictos = [], []
+    for h, ocurrencias in por_hash.items():
+        clases = {clase for _, clase in ocurrencias}
+        if len(clases) > 1:
+            conflictos.append({'hash': h, 'rutas': [r for r, _ in ocurrencias]})
+            continue
+        entradas.append({'hash': h, 'etiqueta': ocurrencias[0][1],
+                         'rutas': [r for r, _ in ocurrencias]})
+
+    # 3. Decodificar en paralelo sólo los contenidos que no estaban compilados
+    nuevas = [e for e in entradas if e['hash'] not in fila_anterior]
+    decodificadas, invalidas = {}, []
+    if nuevas:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            tareas = [pool.submit(_decodificar, os.path.join(origen, e['rutas'][0]), tamano)
+                      for e in nuevas]
+            for entrada, tarea in zip(nuevas, tareas):
+                _, imagen, error = tarea.result()
+                if error:
+                    invalidas.append({'rutas': entrada['rutas'], 'error': error})
+                else:
+                    decodificadas[entrada['hash']] = imagen
+    entradas = [e for e in entradas if e['hash'] in fila_anterior or e['hash'] in decodificadas]
+    entradas.sort(key=lambda e: (e['etiqueta'], e['rutas'][0]))
+
+    # 4. Escribir el nuevo almacén junto al anterior y reemplazarlo al final
+    temporal = os.path.join(destino, 'imagenes.tmp.npy')
+    salida = np.lib.format.open_memmap(temporal, mode='w+', dtype=np.uint8,
+                                       shape=(len(entradas), tamano[1], tamano[0], 3))
+    for fila, entrada in enumerate(entradas):
+        if entrada['hash'] in decodificadas:
+            salida[fila] = decodificadas[entrada['hash']]
+        else:
+            salida[fila] = imagenes_anteriores[fila_anterior[entrada['hash']]]
+        entrada['fila'] = fila
+    salida.flush()
+    del salida
+    del imagenes_anteriores
+    os.replace(temporal, os.path.join(destino, 'imagenes.npy'))
+
+    manifiesto = {
+        'origen': os.path.abspath(origen),
+        'tamano': list(tamano),
+        'clases': sorted({e['etiqueta'] for e in entradas}),
+        'entradas': entradas,
+        'archivos': archivos,
+        'invalidas': invalidas,
+        'conflictos': conflictos,
+    }
+    temporal = os.path.join(destino, 'manifiesto.tmp.json')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, os.path.join(destino, 'manifiesto.json'))
+
+    return {
+        'imagenes': len(entradas),
+        'nuevas': len(decodificadas),
+        'reutilizadas': len(entradas) - len(decodificadas),
+        'duplicados': sum(len(e['rutas']) - 1 for e in entradas),
+        'invalidas': len(invalidas),
+        'conflictos': len(conflictos),
+    }
+
+
+class DatasetCompilado:
+    """
+    Acceso de sólo lectura a un almacén compilado. `imagenes` es un memmap,
+    así que leer un lote no decodifica nada ni carga todo en memoria.
+    """
+
+    def __init__(self, destino):
+        ruta_manifiesto = os.path.join(destino, 'manifiesto.json')
+        if not os.path.exists(ruta_manifiesto):
+            raise DatasetCompiladoError(f"No existe un dataset compilado en {destino}")
+        with open(ruta_manifiesto, encoding='utf-8') as f:
+            self.manifiesto = json.load(f)
+        self.imagenes = np.load(os.path.join(destino, 'imagenes.npy'), mmap_mode='r')
+        self.entradas = self.manifiesto['entradas']
+        self.clases = self.manifiesto['clases']
+        self.hashes = [e['hash'] for e in self.entradas]
+        self.etiquetas = np.array([self.clases.index(e['etiqueta']) for e in self.entradas],
+                                  dtype=np.int64)
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def lotes(self, tamano_lote=32, indices=None):
+        """
+        Recorrer (imagenes_uint8, etiquetas) por lotes en el orden de `indices`.
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        for inicio in range(0, len(indices), tamano_lote):
+            seleccion = np.sort(indices[inicio:inicio + tamano_lote])
+            yield np.asarray(self.imagenes[seleccion]), self.etiquetas[seleccion]
+
+
+def cargar(origen):
+    return DatasetCompilado(directorio_compilado(origen))
@@ -0,0 +1,217 @@
+"""
+Detección por regiones: varios equipos etiquetados con su caja por frame.
+
+1. Se generan propuestas de región baratas: una rejilla multiescala fija o,
+   si opencv-contrib está instalado, selective search en modo rápido sobre
+   una copia reducida del frame.
+2. Todos los recortes se clasifican en una sola pasada por lotes del modelo.
+3. Se aplica non-max suppression (cv2.dnn.NMSBoxes).
+
+El número de recortes se ajusta a un presupuesto de latencia en CPU usando el
+costo por recorte medido en las llamadas anteriores. Para que esa medición
+sobreviva entre peticiones, /api/detectar usa un detector compartido por
+(propuestas, modo_modelo) de detector_para().
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from models.registro_modelos import UMBRAL
+from models.cliente_inferencia import predecir_lote, tamano_entrada
+
+PRESUPUESTO_MS = float(os.getenv('GIL_DETECCION_PRESUPUESTO_MS', '250'))
+ESCALAS_REJILLA = (1.0, 0.6, 0.4)
+SOLAPE_REJILLA = 0.5
+IOU_NMS = 0.3
+MIN_RECORTES = 4
+MAX_RECORTES = 64
+PROPUESTAS = ('rejilla', 'selective_search')
+MODOS_MODELO = ('binario', 'categorias')
+
+
+def propuestas_rejilla(ancho, alto, escalas=ESCALAS_REJILLA, solape=SOLAPE_REJILLA, limite=None):
+    """
+    Ventanas cuadradas a varias escalas, de la más grande a la más pequeña.
+    Con `limite`, se reparte entre las escalas y dentro de cada una se toman
+    ventanas espaciadas por todo el frame (no sólo las primeras filas).
+    """
+    por_escala = []
+    lado_base = min(ancho, alto)
+    for escala in escalas:
+        lado = int(lado_base * escala)
+        paso = max(1, int(lado * (1 - solape)))
+        xs = list(range(0, max(1, ancho - lado + 1), paso))
+        ys = list(range(0, max(1, alto - lado + 1), paso))
+        # Asegurar que la última ventana toque el borde
+        if xs[-1] != ancho - lado:
+            xs.append(ancho - lado)
+        if ys[-1] != alto - lado:
+            ys.append(alto - lado)
+        por_escala.append([[x, y, lado, lado] for y in ys for x in xs])
+    if limite is None or sum(len(c) for c in por_escala) <= limite:
+        return [caja for cajas in por_escala for caja in cajas]
+
+    # Cuota pareja por escala; lo que no usa una escala con pocas ventanas
+    # pasa a las demás
+    cuotas = [0] * len(por_escala)
+    restante = limite
+    orden = sorted(range(len(por_escala)), key=lambda i: len(por_escala[i]))
+    for posicion, i in enumerate(orden):
+        cuotas[i] = min(len(por_escala[i]), restante // (len(orden) - posicion))
+        restante -= cuotas[i]
+    cajas = []
+    for cajas_escala, cuota in zip(por_escala, cuotas):
+        if cuota == 0:
+            continue
+        indices = np.linspace(0, len(cajas_escala) - 1, cuota).round().astype(int)
+        cajas.extend(cajas_escala[i] for i in indices)
+    return cajas
+
+
+def propuestas_selective_search(frame, max_regiones, ancho_trabajo=320, lado_minimo=0.15):
+    """
+    Propuestas con selective search (opencv-contrib). Devuelve None si no
+    está disponible.
+    """
+    if not hasattr(cv2, 'ximgproc'):
+        return None
+    alto, ancho = frame.shape[:2]
+    escala = ancho_trabajo / ancho
+    reducido = cv2.resize(frame, (ancho_trabajo, int(alto * escala)))
+    ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
+    ss.setBaseImage(reducido)
+    ss.switchToSelectiveSearchFast()
+    minimo = lado_minimo * min(reducido.shape[:2])
+    cajas = []
+    for x, y, w, h in ss.process():
+        if w < minimo or h < minimo:
+            continue
+        cajas.append([int(x / escala), int(y / escala), int(w / escala), int(h / escala)])
+        if len(cajas) >= max_regiones:
+            break
+    return cajas
+
+
+class DetectorRegiones:
+    """
+    Clasifica recortes del frame en lote y devuelve cajas etiquetadas.
+
+    modo_modelo='binario' usa el modelo activo del registro (microscopio);
+    modo_modelo='categorias' usa el modelo multiclase de train_categorias.py.
+    `predecir(lote_uint8)` reemplaza a predecir_lote para el modelo binario
+    (el stream en vivo la pasa por el planificador de inferencia).
+    """
+
+    def __init__(self, presupuesto_ms=PRESUPUESTO_MS, propuestas='rejilla', modo_modelo='binario',
+                 umbral=None, iou=IOU_NMS, predecir=None):
+        self.presupuesto_ms = presupuesto_ms
+        self.propuestas = propuestas
+        self.modo_modelo = modo_modelo
+        self.umbral = umbral if umbral is not None else (UMBRAL if modo_modelo == 'binario' else 0.6)
+        self.iou = iou
+        self.predecir = predecir
+        # Costo medio (EMA) por recorte y costo fijo por llamada, en ms
+        self.costo_recorte_ms = None
+        self.costo_fijo_ms = 0.0
+        self.ultima_latencia_ms = None
+        # El detector se comparte entre peticiones (detector_para)
+        self.lock = threading.Lock()
+
+    def max_recortes(self, presupuesto_ms=None):
+        with self.lock:
+            costo_recorte_ms, costo_fijo_ms = self.costo_recorte_ms, self.costo_fijo_ms
+        if costo_recorte_ms is None:
+            return MIN_RECORTES * 4
+        presupuesto_ms = presupuesto_ms if presupuesto_ms is not None else self.presupuesto_ms
+        disponible = presupuesto_ms - costo_fijo_ms
+        return int(min(MAX_RECORTES, max(MIN_RECORTES, disponible / costo_recorte_ms)))
+
+    def generar_propuestas(self, frame, presupuesto_ms=None):
+        limite = self.max_recortes(presupuesto_ms)
+        cajas = None
+        if self.propuestas == 'selective_search':
+            cajas = propuestas_selective_search(frame, limite)
+        if cajas is None:
+            cajas = propuestas_rejilla(frame.shape[1], frame.shape[0], limite=limite)
+        return cajas[:limite]
+
+    def _clasificar(self, recortes):
+        """
+        Devolver (etiquetas, confianzas) para un lote de recortes BGR.
+        """
+        if self.modo_modelo == 'categorias':
+            from models.recognition import cargar_modelo_categorias
+            modelo, clases = cargar_modelo_categorias()
+            lote = np.stack([cv2.cvtColor(r, cv2.COLOR_BGR2RGB) for r in recortes]).astype(np.float32) / 255.0
+            probabilidades = modelo.predict(lote, verbose=0)
+            mejores = probabilidades.argmax(axis=1)
+            etiquetas = [clases[i]['nombre_categoria'] for i in mejores]
+            return etiquetas, probabilidades[np.arange(len(mejores)), mejores]
+        predecir = self.predecir or predecir_lote
+        return ['microscopio'] * len(recortes), predecir(np.stack(recortes))[:, 0]
+
+    def _tamano_entrada(self):
+        if self.modo_modelo == 'categorias':
+            from models.recognition import cargar_modelo_categorias
+            _, alto, ancho, _ = cargar_modelo_categorias()[0].input_shape
+            return (ancho, alto)
+        return tamano_entrada()
+
+    def detectar(self, frame, presupuesto_ms=None):
+        """
+        Devolver [{'etiqueta', 'confianza', 'caja': [x, y, ancho, alto]}].
+        `presupuesto_ms` reemplaza el presupuesto del detector sólo en esta llamada.
+        """
+        inicio = time.perf_counter()
+        cajas = self.generar_propuestas(frame, presupuesto_ms)
+        tamano = self._tamano_entrada()
+        recortes = [cv2.resize(frame[y:y + h, x:x + w], tamano, interpolation=cv2.INTER_AREA)
+                    for x, y, w, h in cajas]
+        antes_modelo = time.perf_counter()
+        etiquetas, confianzas = self._clasificar(recortes)
+        fin = time.perf_counter()
+
+        # Actualizar el modelo de costo para ajustar el siguiente frame
+        costo_recorte = (fin - antes_modelo) * 1000 / len(cajas)
+        with self.lock:
+            self.costo_fijo_ms = (antes_modelo - inicio) * 1000 * 0.5 + self.costo_fijo_ms * 0.5
+            if self.costo_recorte_ms is None:
+                self.costo_recorte_ms = costo_recorte
+            else:
+                self.costo_recorte_ms = 0.8 * self.costo_recorte_ms + 0.2 * costo_recorte
+
+        # NMS por etiqueta
+        detecciones = []
+        for etiqueta in set(etiquetas):
+            indices = [i for i, e in enumerate(etiquetas) if e == etiqueta and confianzas[i] > self.umbral]
+            if not indices:
+                continue
+            conservados = cv2.dnn.NMSBoxes([cajas[i] for i in indices],
+                                           [float(confianzas[i]) for i in indices],
+                                           self.umbral, self.iou)
+            for k in np.array(conservados).flatten():
+                i = indices[int(k)]
+                detecciones.append({'etiqueta': etiqueta, 'confianza': float(confianzas[i]),
+                                    'caja': [int(v) for v in cajas[i]]})
+        detecciones.sort(key=lambda d: -d['confianza'])
+        self.ultima_latencia_ms = (time.perf_counter() - inicio) * 1000
+        return detecciones
+
+
+_detectores = {}
+_detectores_lock = threading.Lock()
+
+
+def detector_para(propuestas='rejilla', modo_modelo='binario'):
+    """
+    Detector compartido por (propuestas, modo_modelo): el costo por recorte
+    medido en una petición limita los recortes de las siguientes.
+    """
+    clave = (propuestas, modo_modelo)
+    with _detectores_lock:
+        if clave not in _detectores:
+            _detectores[clave] = DetectorRegiones(propuestas=propuestas, modo_modelo=modo_modelo)
+        return _detectores[clave]
@@ -0,0 +1,232 @@
+"""
+Persistencia asíncrona de los reconocimientos en reconocimientos_imagen.
+
+Las rutas sólo encolan eventos; un hilo en segundo plano guarda las imágenes
+en uploads/ y escribe las filas en inserciones de varias filas, cada
+INTERVALO_ESCRITURA segundos o cuando se juntan TAMANO_LOTE eventos. Los
+eventos del video en vivo se muestrean y se descartan si repiten la misma
+detección de la misma fuente dentro de una ventana de tiempo, para no
+escribir una fila por frame. Si una fila inválida hace fallar el INSERT de
+varias filas, el lote se reintenta fila por fila para no perder las demás.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import cv2
+
+from gil_database_connection import get_db_connection
+
+DIRECTORIO_UPLOADS = os.path.join(os.path.dirname(__file__), '..', '..', 'uploads')
+TAMANO_LOTE = int(os.getenv('GIL_EVENTOS_LOTE', '100'))
+INTERVALO_ESCRITURA = float(os.getenv('GIL_EVENTOS_INTERVALO', '2.0'))
+MAX_COLA = int(os.getenv('GIL_EVENTOS_MAX_COLA', '5000'))
+VENTANA_DEDUPLICACION = float(os.getenv('GIL_EVENTOS_VENTANA', '10.0'))
+MUESTREO_STREAM = int(os.getenv('GIL_EVENTOS_MUESTREO', '5'))
+
+SQL_INSERTAR = """
+    INSERT INTO reconocimientos_imagen (id_equipo_detectado, imagen_original_url, confianza_deteccion,
+                                        coordenadas_deteccion, id_modelo_usado, procesado_por_usuario)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+class EventoReconocimiento:
+    __slots__ = ('id_equipo', 'confianza', 'coordenadas', 'id_modelo', 'id_usuario',
+                 'imagen', 'datos_imagen', 'imagen_url')
+
+    def __init__(self, confianza, id_equipo=None, coordenadas=None, id_modelo=None,
+                 id_usuario=None, imagen=None, datos_imagen=None, imagen_url=None):
+        self.id_equipo = id_equipo
+        self.confianza = confianza
+        self.coordenadas = coordenadas
+        self.id_modelo = id_modelo
+        self.id_usuario = id_usuario
+        # Para guardar en uploads/: un frame BGR o los bytes del archivo subido
+        self.imagen = imagen
+        self.datos_imagen = datos_imagen
+        self.imagen_url = imagen_url
+
+
+class SumideroEventos:
+    """
+    Cola acotada de eventos con escritura por lotes en segundo plano.
+    """
+
+    def __init__(self, tamano_lote=TAMANO_LOTE, intervalo=INTERVALO_ESCRITURA, max_cola=MAX_COLA,
+                 ventana=VENTANA_DEDUPLICACION, muestreo=MUESTREO_STREAM):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.ventana = ventana
+        self.muestreo = max(1, muestreo)
+        self.cola = queue.Queue(maxsize=max_cola)
+        self.hilo = None
+        self.hilo_lock = threading.Lock()
+        self.detenido = threading.Event()
+        self.ultimos_stream = {}
+        self.contadores_stream = {}
+        self.stream_lock = threading.Lock()
+        # Los actualizan las rutas y el hilo escritor a la vez
+        self.contadores = {'encolados': 0, 'escritos': 0, 'descartados_cola': 0,
+                           'muestreados': 0, 'duplicados': 0, 'errores': 0, 'reintentos_fila': 0}
+        self.contadores_lock = threading.Lock()
+
+    def _contar(self, clave, cantidad=1):
+        with self.contadores_lock:
+            self.contadores[clave] += cantidad
+
+    def estadisticas(self):
+        with self.contadores_lock:
+            return dict(self.contadores)
+
+    def iniciar(self):
+        with self.hilo_lock:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, name='eventos-reconocimiento', daemon=True)
+                self.hilo.start()
+                atexit.register(self.detener)
+
+    def registrar(self, evento):
+        """
+        Encolar un evento sin bloquear. Devuelve False si la cola está llena.
+        """
+        self.iniciar()
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            self._contar('descartados_cola')
+            return False
+        self._contar('encolados')
+        return True
+
+    def registrar_stream(self, fuente, etiqueta, evento_factory):
+        """
+        Registrar una detección del video en vivo aplicando muestreo y
+        deduplicación. `evento_factory` sólo se llama si el evento se acepta,
+        así el frame se copia únicamente cuando de verdad se va a guardar.
+        """
+        ahora = time.monotonic()
+        clave = (fuente, etiqueta)
+        with self.stream_lock:
+            contador = self.contadores_stream.get(fuente, 0) + 1
+            self.contadores_stream[fuente] = contador
+            if contador % self.muestreo:
+                self._contar('muestreados')
+                return False
+            ultimo = self.ultimos_stream.get(clave)
+            if ultimo is not None and ahora - ultimo < self.ventana:
+                self._contar('duplicados')
+                return False
+            self.ultimos_stream[clave] = ahora
+        return self.registrar(evento_factory())
+
+    def _bucle(self):
+        pendientes = []
+        ultima_escritura = time.monotonic()
+        while True:
+            espera = max(0.0, self.intervalo - (time.monotonic() - ultima_escritura))
+            try:
+                pendientes.append(self.cola.get(timeout=espera))
+            except queue.Empty:
+                pass
+            vencido = time.monotonic() - ultima_escritura >= self.intervalo
+            if pendientes and (len(pendientes) >= self.tamano_lote or vencido or self.detenido.is_set()):
+                self._escribir(pendientes)
+                pendientes = []
+            if vencido:
+                ultima_escritura = time.monotonic()
+            if self.detenido.is_set() and self.cola.empty() and not pendientes:
+                return
+
+    def _guardar_imagen(self, evento):
+        if evento.imagen_url or (evento.imagen is None and evento.datos_imagen is None):
+            return evento.imagen_url
+        os.makedirs(DIRECTORIO_UPLOADS, exist_ok=True)
+        nombre = f"{uuid.uuid4().hex}.jpg"
+        ruta = os.path.join(DIRECTORIO_UPLOADS, nombre)
+        if evento.datos_imagen is not None:
+            with open(ruta, 'wb') as f:
+                f.write(evento.datos_imagen)
+        else:
+            cv2.imwrite(ruta, evento.imagen)
+        return f"uploads/{nombre}"
+
+    def _escribir(self, eventos):
+        filas = []
+        propias = []
+        for evento in eventos:
+            try:
+                url = self._guardar_imagen(evento)
+            except OSError as e:
+                print(f"⚠ No se pudo guardar la imagen del reconocimiento: {e}")
+                url = None
+            # Imágenes escritas aquí: se borran si su fila no llega a la base
+            propias.append(url if url and url != evento.imagen_url else None)
+            filas.append((
+                evento.id_equipo,
+                url,
+                round(float(evento.confianza), 2) if evento.confianza is not None else None,
+                json.dumps(evento.coordenadas) if evento.coordenadas is not None else None,
+                evento.id_modelo,
+                evento.id_usuario,
+            ))
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            self._contar('errores', len(filas))
+            print(f"⚠ Sin conexión para guardar {len(filas)} reconocimientos: {e}")
+            self._descartar_imagenes(propias)
+            return
+        cursor = conn.cursor()
+        try:
+            # mysql-connector convierte executemany de un INSERT en una sola
+            # sentencia INSERT ... VALUES (...), (...), ...
+            cursor.executemany(SQL_INSERTAR, filas)
+            conn.commit()
+            self._contar('escritos', len(filas))
+        except Exception as e:
+            conn.rollback()
+            # Una fila inválida rechaza todo el INSERT: reintentar fila por
+            # fila para conservar las demás
+            print(f"⚠ Error guardando {len(filas)} reconocimientos ({e}); se reintenta fila por fila")
+            self._contar('reintentos_fila')
+            self._escribir_por_fila(conn, cursor, filas, propias)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _escribir_por_fila(self, conn, cursor, filas, propias):
+        for fila, imagen in zip(filas, propias):
+            try:
+                cursor.execute(SQL_INSERTAR, fila)
+                conn.commit()
+                self._contar('escritos')
+            except Exception as e:
+                conn.rollback()
+                self._contar('errores')
+                print(f"⚠ Reconocimiento descartado ({e})")
+                self._descartar_imagenes([imagen])
+
+    def _descartar_imagenes(self, urls):
+        for url in urls:
+            if not url:
+                continue
+            try:
+                os.remove(os.path.join(DIRECTORIO_UPLOADS, os.path.basename(url)))
+            except OSError:
+                pass
+
+    def detener(self, timeout=10):
+        """
+        Escribir lo pendiente y terminar el hilo.
+        """
+        self.detenido.set()
+        if self.hilo is not None:
+            self.hilo.join(timeout)
+
+
+sumidero = SumideroEventos()
@@ -0,0 +1,304 @@
+"""
+Fuentes de frames para el video en vivo.
+
+generar_frames ya no abre cv2.VideoCapture(0) directamente: lee de una
+FuenteFrames, que puede ser una webcam, un archivo de video, una carpeta de
+imágenes, una URL RTSP o un generador sintético. Cada fuente se describe con
+una cadena:
+
+    webcam:0                 (o sólo "0")
+    archivo:/ruta/clip.mp4   (archivo:...?bucle=1&tiempo_real=1)
+    carpeta:/ruta/frames     (carpeta:...?fps=15&bucle=1)
+    rtsp://camara.local/stream
+    sintetica:640x480        (sintetica:640x480?frames=300&fps=30)
+
+La fuente de cada laboratorio y cámara se configura en configuracion_sistema
+(clave 'fuentes_video', JSON {"<id_laboratorio>": {"<camara>": "<fuente>"}})
+o en la variable GIL_FUENTES_VIDEO con el mismo JSON. Sin configuración se
+usa la webcam con el índice de la cámara.
+"""
+import glob
+import json
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from urllib.parse import parse_qs
+
+import cv2
+import numpy as np
+
+from gil_database_connection import leer_configuracion
+
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.bmp')
+ESPERA_RECONEXION = 2.0
+
+
+class FuenteFrames(ABC):
+    """
+    Interfaz común: leer() -> (ok, frame BGR) y liberar().
+    """
+    nombre = 'fuente'
+
+    @abstractmethod
+    def leer(self):
+        """
+        Devolver (ok, frame BGR); ok es False cuando la fuente terminó.
+        """
+
+    def liberar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+
+    def __iter__(self):
+        while True:
+            ok, frame = self.leer()
+            if not ok:
+                return
+            yield frame
+
+
+class _Ritmo:
+    """
+    Espaciar las lecturas a `fps` frames por segundo (None = sin límite).
+    """
+
+    def __init__(self, fps):
+        self.intervalo = 1.0 / fps if fps else 0.0
+        self.siguiente = None
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        ahora = time.monotonic()
+        if self.siguiente is not None and self.siguiente > ahora:
+            time.sleep(self.siguiente - ahora)
+        self.siguiente = max(ahora, self.siguiente or ahora) + self.intervalo
+
+
+class FuenteCaptura(FuenteFrames):
+    """
+    Webcam o archivo de video a través de cv2.VideoCapture.
+    """
+
+    def __init__(self, origen, nombre=None, bucle=False, tiempo_real=False):
+        self.origen = origen
+        self.nombre = nombre or str(origen)
+        self.bucle = bucle
+        self.captura = cv2.VideoCapture(origen)
+        fps = self.captura.get(cv2.CAP_PROP_FPS) if tiempo_real else None
+        self.ritmo = _Ritmo(fps if fps and fps > 0 else None)
+
+    def leer(self):
+        self.ritmo.esperar()
+        ok, frame = self.captura.read()
+        if not ok and self.bucle:
+            self.captura.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.captura.read()
+        return ok, frame
+
+    def liberar(self):
+        self.captura.release()
+
+
+class FuenteRTSP(FuenteFrames):
+    """
+    Cámara IP. Si la conexión se cae se reintenta hasta `reintentos` veces.
+    """
+
+    def __init__(self, url, reintentos=5):
+        self.url = url
+        self.nombre = url
+        self.reintentos = reintentos
+        self.captura = None
+        self._conectar()
+
+    def _conectar(self):
+        if self.captura is not None:
+            self.captura.release()
+        self.captura = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        # Quedarse con el frame más reciente en lugar de acumular retraso
+        self.captura.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def leer(self):
+        for intento in range(self.reintentos + 1):
+            ok, frame = self.captura.read()
+            if ok:
+                return ok, frame
+            if intento < self.reintentos:
+                time.sleep(ESPERA_RECONEXION)
+                self._conectar()
+        return False, None
+
+    def liberar(self):
+        if self.captura is not None:
+            self.captura.release()
+
+
+class FuenteCarpeta(FuenteFrames):
+    """
+    Imágenes de una carpeta en orden alfabético.
+    """
+
+    def __init__(self, ruta, fps=None, bucle=False):
+        self.nombre = ruta
+        self.rutas = sorted(r for r in glob.glob(os.path.join(ruta, '*'))
+                            if r.lower().endswith(EXTENSIONES_IMAGEN))
+        self.bucle = bucle
+        self.posicion = 0
+        self.ritmo = _Ritmo(fps)
+
+    def leer(self):
+        while self.rutas:
+            if self.posicion >= len(self.rutas):
+                if not self.bucle:
+                    return False, None
+                self.posicion = 0
+            ruta = self.rutas[self.posicion]
+            self.posicion += 1
+            frame = cv2.imread(ruta)
+            if frame is not None:
+                self.ritmo.esperar()
+                return True, frame
+        return False, None
+
+
+class FuenteSintetica(FuenteFrames):
+    """
+    Mesa de laboratorio sintética: fondo fijo con ruido de sensor y un objeto
+    que entra, se queda quieto y sale. Determinista para una misma semilla,
+    útil para probar y medir el stream sin cámara.
+    """
+
+    def __init__(self, ancho=640, alto=480, frames=None, fps=None, semilla=0, nombre='sintetica'):
+        self.nombre = nombre
+        self.ancho = ancho
+        self.alto = alto
+        self.frames = frames
+        self.ritmo = _Ritmo(fps)
+        self.rng = np.random.default_rng(semilla)
+        y, x = np.mgrid[0:alto, 0:ancho]
+        base = (60 + 40 * np.sin(x / 37.0) * np.cos(y / 53.0)).astype(np.uint8)
+        self.fondo = cv2.merge([base, base + 10, base + 20])
+        lado = min(ancho, alto) // 3
+        self.objeto = self.rng.integers(90, 255, (lado, lado, 3), dtype=np.uint8)
+        self.indice = 0
+
+    def _posicion(self):
+        # Ciclo de 150 frames: entra (50), quieto (50), sale (50)
+        fase = self.indice % 150
+        recorrido = self.ancho // 2
+        if fase < 50:
+            return int(fase / 50 * recorrido)
+        if fase < 100:
+            return recorrido
+        return int(recorrido + (fase - 100) / 50 * recorrido)
+
+    def leer(self):
+        if self.frames is not None and self.indice >= self.frames:
+            return False, None
+        self.ritmo.esperar()
+        frame = self.fondo.copy()
+        lado = self.objeto.shape[0]
+        x = min(self._posicion(), self.ancho - lado)
+        y = (self.alto - lado) // 2
+        frame[y:y + lado, x:x + lado] = self.objeto
+        ruido = self.rng.integers(0, 6, frame.shape, dtype=np.uint8)
+        self.indice += 1
+        return True, cv2.add(frame, ruido)
+
+
+def crear_fuente(descripcion, nombre=None):
+    """
+    Construir una fuente a partir de su cadena de configuración.
+    """
+    descripcion = str(descripcion).strip()
+    if descripcion.isdigit():
+        descripcion = f"webcam:{descripcion}"
+    if descripcion.lower().startswith(('rtsp://', 'rtsps://', 'http://', 'https://')):
+        return FuenteRTSP(descripcion)
+    tipo, _, resto = descripcion.partition(':')
+    ruta, _, consulta = resto.partition('?')
+    opciones = {k: v[-1] for k, v in parse_qs(consulta).items()}
+    bucle = opciones.get('bucle') == '1'
+    fps = float(opciones['fps']) if 'fps' in opciones else None
+    if tipo == 'webcam':
+        return FuenteCaptura(int(ruta or 0), nombre=nombre or descripcion)
+    if tipo == 'archivo':
+        return FuenteCaptura(ruta, nombre=nombre or ruta, bucle=bucle,
+                             tiempo_real=opciones.get('tiempo_real') == '1')
+    if tipo == 'carpeta':
+        return FuenteCarpeta(ruta, fps=fps, bucle=bucle)
+    if tipo == 'sintetica':
+        ancho, _, alto = (ruta or '640x480').partition('x')
+        frames = int(opciones['frames']) if 'frames' in opciones else None
+        return FuenteSintetica(int(ancho), int(alto), frames=frames, fps=fps,
+                               semilla=int(opciones.get('semilla', 0)), nombre=nombre or descripcion)
+    raise ValueError(f"Fuente de video no reconocida: {descripcion}")
+
+
+class FuenteCompartida(FuenteFrames):
+    """
+    Varios clientes del mismo laboratorio/cámara leen del mismo dispositivo;
+    las lecturas se serializan con un lock.
+    """
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self.nombre = fuente.nombre
+        self.lock = threading.Lock()
+        self.agotada = False
+
+    def leer(self):
+        with self.lock:
+            ok, frame = self.fuente.leer()
+            self.agotada = self.agotada or not ok
+            return ok, frame
+
+    def liberar(self):
+        with self.lock:
+            self.fuente.liberar()
+
+
+def descripcion_configurada(id_laboratorio, camara):
+    """
+    Cadena de la fuente configurada para un laboratorio y cámara.
+    """
+    entorno = os.getenv('GIL_FUENTES_VIDEO')
+    configuracion = json.loads(entorno) if entorno else leer_configuracion('fuentes_video', {})
+    return (configuracion or {}).get(str(id_laboratorio), {}).get(str(camara), f"webcam:{camara}")
+
+
+_fuentes = {}
+_fuentes_lock = threading.Lock()
+
+
+def obtener_fuente(id_laboratorio, camara):
+    """
+    Fuente compartida del laboratorio y cámara, abierta en el primer uso.
+    """
+    clave = (id_laboratorio, camara)
+    with _fuentes_lock:
+        if clave in _fuentes and _fuentes[clave].agotada:
+            # La cámara se desconectó o el archivo terminó: reabrir
+            _fuentes.pop(clave).liberar()
+        if clave not in _fuentes:
+            descripcion = descripcion_configurada(id_laboratorio, camara)
+            _fuentes[clave] = FuenteCompartida(crear_fuente(descripcion))
+        return _fuentes[clave]
+
+
+def liberar_fuentes():
+    """
+    Cerrar todas las fuentes abiertas (al apagar el servidor).
+    """
+    with _fuentes_lock:
+        fuentes = list(_fuentes.values())
+        _fuentes.clear()
+    for fuente in fuentes:
+        fuente.liberar()
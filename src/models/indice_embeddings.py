@@ -0,0 +1,235 @@
+"""
+Índice de embeddings para reconocer el equipo concreto (instancia) en una foto.
+
+Cada foto de referencia de un equipo se convierte en el vector global-pooled
+de MobileNetV2 (1280 valores), normalizado a norma 1. Los vectores se guardan
+en una matriz float32 en disco abierta con np.memmap, de modo que cargar el
+índice al arrancar sólo mapea el archivo. Las consultas top-k por similitud
+coseno son un único producto matriz-vector.
+
+Varios workers comparten los archivos: las altas y bajas se hacen con un
+bloqueo de archivo (embeddings.lock) y releyendo antes los metadatos, y cada
+proceso vuelve a abrir la matriz cuando otro reescribió los metadatos.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso en el servidor de desarrollo
+    fcntl = None
+
+import cv2
+import numpy as np
+
+DIRECTORIO_INDICE = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'indices')
+DIMENSION = 1280
+CAPACIDAD_INICIAL = 1024
+SIMILITUD_MINIMA = 0.80
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def obtener_extractor():
+    """
+    Cargar (una sola vez) MobileNetV2 sin cabeza y con global average pooling.
+    """
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2  # type: ignore
+            _extractor = MobileNetV2(weights='imagenet', include_top=False,
+                                     pooling='avg', input_shape=(224, 224, 3))
+    return _extractor
+
+
+def extraer_embeddings(imagenes):
+    """
+    Calcular embeddings normalizados para una lista de imágenes BGR.
+    """
+    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input  # type: ignore
+    lote = np.stack([
+        cv2.cvtColor(cv2.resize(img, (224, 224)), cv2.COLOR_BGR2RGB) for img in imagenes
+    ]).astype(np.float32)
+    vectores = obtener_extractor().predict(preprocess_input(lote), verbose=0)
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    return (vectores / np.maximum(normas, 1e-12)).astype(np.float32)
+
+
+class IndiceEmbeddings:
+    """
+    Matriz de embeddings en disco con altas y bajas incrementales.
+
+    Las filas eliminadas se marcan con id -1 y se ponen a cero; el índice se
+    compacta cuando más de la mitad de las filas están eliminadas.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_INDICE, dimension=DIMENSION):
+        self.directorio = directorio
+        self.ruta_matriz = os.path.join(directorio, 'embeddings.f32')
+        self.ruta_meta = os.path.join(directorio, 'embeddings_meta.json')
+        self.ruta_bloqueo = os.path.join(directorio, 'embeddings.lock')
+        self.dimension = dimension
+        self.matriz = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.version_meta = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _bloqueo_archivo(self):
+        """
+        Exclusión entre procesos para las escrituras (dentro de self.lock).
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(self.ruta_bloqueo, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _version_en_disco(self):
+        try:
+            estado = os.stat(self.ruta_meta)
+        except FileNotFoundError:
+            return None
+        return (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+
+    def cargar(self, bloqueado=False):
+        """
+        Abrir el índice, o volver a abrirlo si otro proceso lo modificó.
+        `bloqueado` indica que el llamador ya tiene el bloqueo de archivo.
+        """
+        if self.matriz is not None and self._version_en_disco() == self.version_meta:
+            return
+        if not bloqueado:
+            # La matriz y los metadatos se leen juntos, sin escrituras a medias
+            with self._bloqueo_archivo():
+                return self.cargar(bloqueado=True)
+        version = self._version_en_disco()
+        if version is not None and os.path.exists(self.ruta_matriz):
+            with open(self.ruta_meta, encoding='utf-8') as f:
+                meta = json.load(f)
+            if self.matriz is not None:
+                self.matriz._mmap.close()
+            self.dimension = meta['dimension']
+            self.ids = np.array(meta['ids'], dtype=np.int64)
+            self.matriz = np.memmap(self.ruta_matriz, dtype=np.float32, mode='r+',
+                                    shape=(meta['capacidad'], self.dimension))
+            self.version_meta = version
+        else:
+            self.matriz = np.memmap(self.ruta_matriz, dtype=np.float32, mode='w+',
+                                    shape=(CAPACIDAD_INICIAL, self.dimension))
+            self._guardar_meta()
+
+    def _guardar_meta(self):
+        temporal = self.ruta_meta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dimension': self.dimension,
+                'capacidad': int(self.matriz.shape[0]),
+                'ids': self.ids.tolist(),
+            }, f)
+        os.replace(temporal, self.ruta_meta)
+        self.version_meta = self._version_en_disco()
+
+    def _redimensionar(self, capacidad, filas):
+        """
+        Reescribir la matriz con otra capacidad conservando las filas dadas.
+        """
+        datos = np.array(self.matriz[filas])
+        temporal = self.ruta_matriz + '.tmp'
+        nueva = np.memmap(temporal, dtype=np.float32, mode='w+',
+                          shape=(capacidad, self.dimension))
+        nueva[:len(datos)] = datos
+        nueva.flush()
+        del nueva
+        self.matriz._mmap.close()
+        os.replace(temporal, self.ruta_matriz)
+        self.matriz = np.memmap(self.ruta_matriz, dtype=np.float32, mode='r+',
+                                shape=(capacidad, self.dimension))
+
+    def agregar(self, id_equipo, vectores):
+        """
+        Añadir uno o varios embeddings (ya normalizados) de un equipo.
+        """
+        vectores = np.atleast_2d(np.asarray(vectores, dtype=np.float32))
+        with self.lock, self._bloqueo_archivo():
+            # Releer dentro del bloqueo: otro worker pudo agregar filas
+            self.cargar(bloqueado=True)
+            usados = len(self.ids)
+            necesarios = usados + len(vectores)
+            if necesarios > self.matriz.shape[0]:
+                capacidad = max(necesarios, self.matriz.shape[0] * 2)
+                self._redimensionar(capacidad, np.arange(usados))
+            self.matriz[usados:necesarios] = vectores
+            self.matriz.flush()
+            self.ids = np.concatenate([self.ids, np.full(len(vectores), id_equipo, dtype=np.int64)])
+            self._guardar_meta()
+
+    def eliminar_equipo(self, id_equipo):
+        with self.lock, self._bloqueo_archivo():
+            self.cargar(bloqueado=True)
+            filas = np.flatnonzero(self.ids == id_equipo)
+            if len(filas) == 0:
+                return
+            self.matriz[filas] = 0.0
+            self.ids[filas] = -1
+            vivas = np.flatnonzero(self.ids >= 0)
+            if len(vivas) < len(self.ids) // 2:
+                self._redimensionar(max(CAPACIDAD_INICIAL, len(vivas) * 2), vivas)
+                self.ids = self.ids[vivas]
+            else:
+                self.matriz.flush()
+            self._guardar_meta()
+
+    def buscar_vector(self, vector, k=5):
+        """
+        Devolver [(id_equipo, similitud)] de los k equipos más parecidos.
+        Un equipo con varias fotos puntúa con su mejor foto.
+        """
+        with self.lock:
+            self.cargar()
+            usados = len(self.ids)
+            if usados == 0:
+                return []
+            similitudes = np.asarray(self.matriz[:usados]) @ np.asarray(vector, dtype=np.float32)
+            ids = self.ids.copy()
+        similitudes[ids < 0] = -np.inf
+        # Se toman más candidatos que k porque un equipo puede tener varias filas
+        candidatos = min(usados, k * 4)
+        mejores = np.argpartition(-similitudes, candidatos - 1)[:candidatos]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        resultado = []
+        vistos = set()
+        for fila in mejores:
+            id_equipo = int(ids[fila])
+            if id_equipo < 0 or id_equipo in vistos:
+                continue
+            vistos.add(id_equipo)
+            resultado.append((id_equipo, float(similitudes[fila])))
+            if len(resultado) >= k:
+                break
+        return resultado
+
+    def buscar(self, imagen, k=5):
+        # Con el índice vacío no vale la pena cargar MobileNetV2
+        if self.total() == 0:
+            return []
+        return self.buscar_vector(extraer_embeddings([imagen])[0], k)
+
+    def agregar_imagenes(self, id_equipo, imagenes):
+        self.agregar(id_equipo, extraer_embeddings(imagenes))
+
+    def total(self):
+        with self.lock:
+            self.cargar()
+            return int((self.ids >= 0).sum())
+
+
+indice_embeddings = IndiceEmbeddings()
@@ -0,0 +1,259 @@
+"""
+Índice de hashes perceptuales para identificar equipos concretos del inventario.
+
+Cada foto de referencia de un equipo se reduce a un dHash de 64 bits (16
+caracteres hexadecimales). La columna equipos.imagen_hash (VARCHAR(64)) guarda
+hasta cuatro hashes concatenados, uno por foto de referencia. Los hashes se
+cargan en un BK-tree en memoria que responde consultas por distancia de
+Hamming en tiempo sublineal.
+
+Cada worker tiene su propio árbol: cada INTERVALO_REVISION segundos se compara
+una firma de la columna en MySQL y, si otro proceso agregó referencias, el
+árbol se recarga.
+"""
+import os
+import threading
+import time
+
+import cv2
+
+from gil_database_connection import get_db_connection
+
+LONGITUD_HASH = 16          # caracteres hexadecimales por hash (64 bits)
+MAX_HASHES_POR_EQUIPO = 4   # 64 caracteres / 16
+RADIO_POR_DEFECTO = 10      # bits distintos tolerados entre foto y referencia
+INTERVALO_REVISION = float(os.getenv('GIL_INDICE_HASH_INTERVALO', '30'))
+
+FILTRO_REFERENCIAS = """
+    imagen_hash IS NOT NULL AND imagen_hash <> '' AND estado_equipo <> 'dado_baja'
+"""
+
+
+def calcular_hash(imagen):
+    """
+    Calcular el dHash de 64 bits de una imagen BGR o en escala de grises.
+    """
+    if imagen.ndim == 3:
+        imagen = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    reducida = cv2.resize(imagen, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (reducida[:, 1:] > reducida[:, :-1]).flatten()
+    valor = 0
+    for bit in bits:
+        valor = (valor << 1) | int(bit)
+    return valor
+
+
+def hash_a_texto(valor):
+    return f"{valor:0{LONGITUD_HASH}x}"
+
+
+def texto_a_hashes(texto):
+    """
+    Separar el contenido de equipos.imagen_hash en hashes de 64 bits.
+    """
+    if not texto:
+        return []
+    texto = texto.strip()
+    return [int(texto[i:i + LONGITUD_HASH], 16)
+            for i in range(0, len(texto) - LONGITUD_HASH + 1, LONGITUD_HASH)]
+
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    BK-tree sobre distancia de Hamming. Cada nodo guarda un hash y los
+    id_equipo asociados; los hijos se indexan por su distancia al nodo.
+    """
+
+    def __init__(self):
+        self.raiz = None
+        self.total = 0
+
+    def insertar(self, valor, id_equipo):
+        if self.raiz is None:
+            self.raiz = [valor, {id_equipo}, {}]
+            self.total += 1
+            return
+        nodo = self.raiz
+        while True:
+            d = distancia_hamming(valor, nodo[0])
+            if d == 0:
+                nodo[1].add(id_equipo)
+                return
+            hijo = nodo[2].get(d)
+            if hijo is None:
+                nodo[2][d] = [valor, {id_equipo}, {}]
+                self.total += 1
+                return
+            nodo = hijo
+
+    def eliminar(self, valor, id_equipo):
+        """
+        Quitar un id_equipo de un hash. El nodo se conserva (vacío) para no
+        romper la estructura; se descarta en la próxima reconstrucción.
+        """
+        nodo = self.raiz
+        while nodo is not None:
+            d = distancia_hamming(valor, nodo[0])
+            if d == 0:
+                nodo[1].discard(id_equipo)
+                return
+            nodo = nodo[2].get(d)
+
+    def buscar(self, valor, radio):
+        """
+        Devolver [(distancia, id_equipo)] con distancia <= radio, ordenado.
+        """
+        if self.raiz is None:
+            return []
+        resultados = []
+        pendientes = [self.raiz]
+        while pendientes:
+            nodo = pendientes.pop()
+            d = distancia_hamming(valor, nodo[0])
+            if d <= radio:
+                resultados.extend((d, id_equipo) for id_equipo in nodo[1])
+            # Desigualdad triangular: sólo los hijos en [d - radio, d + radio]
+            for distancia_hijo, hijo in nodo[2].items():
+                if d - radio <= distancia_hijo <= d + radio:
+                    pendientes.append(hijo)
+        resultados.sort()
+        return resultados
+
+
+class IndiceHashEquipos:
+    """
+    Índice en memoria de los hashes de referencia de todos los equipos.
+    """
+
+    def __init__(self, intervalo=INTERVALO_REVISION):
+        self.arbol = BKTree()
+        self.hashes_por_equipo = {}
+        self.lock = threading.Lock()
+        self.cargado = False
+        self.intervalo = intervalo
+        self.firma = None
+        self.revisado = 0.0
+
+    @staticmethod
+    def _firma(cursor):
+        cursor.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT(id_equipo, ':', imagen_hash))), 0)
+            FROM equipos WHERE {FILTRO_REFERENCIAS}
+        """)
+        cantidad, suma = cursor.fetchone()
+        return int(cantidad), int(suma)
+
+    def cargar(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id_equipo, imagen_hash FROM equipos WHERE {FILTRO_REFERENCIAS}")
+        filas = cursor.fetchall()
+        firma = self._firma(cursor)
+        cursor.close()
+        conn.close()
+
+        arbol = BKTree()
+        hashes_por_equipo = {}
+        for id_equipo, texto in filas:
+            hashes = texto_a_hashes(texto)
+            hashes_por_equipo[id_equipo] = hashes
+            for valor in hashes:
+                arbol.insertar(valor, id_equipo)
+
+        with self.lock:
+            self.arbol = arbol
+            self.hashes_por_equipo = hashes_por_equipo
+            self.firma = firma
+            self.revisado = time.monotonic()
+            self.cargado = True
+
+    def asegurar_cargado(self):
+        if not self.cargado:
+            self.cargar()
+            return
+        if time.monotonic() - self.revisado < self.intervalo:
+            return
+        self.revisado = time.monotonic()
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            firma = self._firma(cursor)
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            print(f"⚠ No se pudo revisar el índice de hashes: {e}")
+            return
+        if firma != self.firma:
+            # Otro worker agregó o cambió referencias
+            self.cargar()
+
+    def buscar(self, imagen, radio=RADIO_POR_DEFECTO, limite=5):
+        """
+        Buscar los equipos más parecidos a la imagen.
+        Devuelve [(id_equipo, distancia)] sin repetir equipos.
+        """
+        self.asegurar_cargado()
+        valor = calcular_hash(imagen)
+        with self.lock:
+            coincidencias = self.arbol.buscar(valor, radio)
+        resultado = []
+        vistos = set()
+        for distancia, id_equipo in coincidencias:
+            if id_equipo in vistos:
+                continue
+            vistos.add(id_equipo)
+            resultado.append((id_equipo, distancia))
+            if len(resultado) >= limite:
+                break
+        return resultado
+
+    def agregar_referencia(self, id_equipo, imagen):
+        """
+        Registrar una foto de referencia de un equipo y persistir su hash.
+        Se conservan las MAX_HASHES_POR_EQUIPO referencias más recientes.
+        Devuelve None si el equipo no existe.
+        """
+        valor = calcular_hash(imagen)
+        # Leer y escribir la fila bloqueada: dos altas simultáneas (de este u
+        # otro worker) no pueden pisarse la lista de hashes
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT imagen_hash FROM equipos WHERE id_equipo = %s FOR UPDATE", (id_equipo,))
+            fila = cursor.fetchone()
+            if fila is None:
+                conn.rollback()
+                return None
+            hashes = texto_a_hashes(fila[0])
+            if valor not in hashes:
+                hashes = (hashes + [valor])[-MAX_HASHES_POR_EQUIPO:]
+                cursor.execute("UPDATE equipos SET imagen_hash = %s WHERE id_equipo = %s",
+                               (''.join(hash_a_texto(h) for h in hashes), id_equipo))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        self.asegurar_cargado()
+        with self.lock:
+            for antiguo in self.hashes_por_equipo.get(id_equipo, []):
+                self.arbol.eliminar(antiguo, id_equipo)
+            self.hashes_por_equipo[id_equipo] = hashes
+            for h in hashes:
+                self.arbol.insertar(h, id_equipo)
+        return hash_a_texto(valor)
+
+    def eliminar_equipo(self, id_equipo):
+        with self.lock:
+            for valor in self.hashes_por_equipo.pop(id_equipo, []):
+                self.arbol.eliminar(valor, id_equipo)
+
+
+indice_hash = IndiceHashEquipos()
@@ -0,0 +1,184 @@
+"""
+Ingesta de imágenes subidas con memoria acotada.
+
+En lugar de leer el archivo completo sin límite y decodificarlo a resolución
+completa para luego reducirlo a 224x224, se:
+
+1. lee el stream por bloques con un tamaño máximo en bytes,
+2. obtienen las dimensiones de la cabecera (JPEG/PNG) sin decodificar y se
+   rechazan imágenes con demasiados píxeles,
+3. decodifica con IMREAD_REDUCED_COLOR_2/4/8 (libjpeg decodifica a 1/2, 1/4
+   u 1/8 directamente) eligiendo el mayor factor que aún deja >= 224 px,
+4. aplica la orientación EXIF y se reduce a 224x224.
+"""
+import os
+import struct
+
+import cv2
+import numpy as np
+
+MAX_BYTES = int(os.getenv('GIL_MAX_BYTES_IMAGEN', str(25 * 1024 * 1024)))
+MAX_PIXELES = int(os.getenv('GIL_MAX_PIXELES_IMAGEN', str(100_000_000)))
+TAMANO_BLOQUE = 64 * 1024
+TAMANO_MODELO = (224, 224)
+
+FLAGS_REDUCCION = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class ImagenInvalida(Exception):
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def leer_limitado(stream, max_bytes=MAX_BYTES):
+    """
+    Leer un stream por bloques sin pasar de max_bytes.
+    """
+    datos = bytearray()
+    while True:
+        bloque = stream.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        datos += bloque
+        if len(datos) > max_bytes:
+            raise ImagenInvalida(f"La imagen supera el máximo de {max_bytes // (1024 * 1024)} MB", 413)
+    if not datos:
+        raise ImagenInvalida("El archivo está vacío")
+    return bytes(datos)
+
+
+def _segmentos_jpeg(datos):
+    """
+    Recorrer los segmentos de la cabecera JPEG como (marcador, inicio, fin).
+    """
+    i = 2
+    n = len(datos)
+    while i + 4 <= n:
+        if datos[i] != 0xFF:
+            return
+        marcador = datos[i + 1]
+        if marcador == 0xFF:
+            i += 1
+            continue
+        if marcador in (0xD8, 0x01) or 0xD0 <= marcador <= 0xD7:
+            i += 2
+            continue
+        longitud = struct.unpack('>H', datos[i + 2:i + 4])[0]
+        yield marcador, i + 4, i + 2 + longitud
+        if marcador == 0xDA:  # inicio de los datos comprimidos
+            return
+        i += 2 + longitud
+
+
+def dimensiones_cabecera(datos):
+    """
+    Devolver (formato, ancho, alto) leyendo sólo la cabecera, o (None, None, None).
+    """
+    if datos[:2] == b'\xff\xd8':
+        for marcador, inicio, _ in _segmentos_jpeg(datos):
+            # SOF0..SOF15 excepto DHT (C4), JPG (C8) y DAC (CC)
+            if 0xC0 <= marcador <= 0xCF and marcador not in (0xC4, 0xC8, 0xCC):
+                alto, ancho = struct.unpack('>HH', datos[inicio + 1:inicio + 5])
+                return 'jpeg', ancho, alto
+        return 'jpeg', None, None
+    if datos[:8] == b'\x89PNG\r\n\x1a\n' and datos[12:16] == b'IHDR':
+        ancho, alto = struct.unpack('>II', datos[16:24])
+        return 'png', ancho, alto
+    return None, None, None
+
+
+def orientacion_exif(datos):
+    """
+    Leer la etiqueta Orientation (0x0112) del EXIF de un JPEG. 1 si no hay.
+    """
+    if datos[:2] != b'\xff\xd8':
+        return 1
+    for marcador, inicio, fin in _segmentos_jpeg(datos):
+        if marcador != 0xE1 or datos[inicio:inicio + 6] != b'Exif\x00\x00':
+            continue
+        tiff = datos[inicio + 6:fin]
+        if len(tiff) < 8:
+            return 1
+        orden = '<' if tiff[:2] == b'II' else '>'
+        desplazamiento = struct.unpack(orden + 'I', tiff[4:8])[0]
+        if desplazamiento + 2 > len(tiff):
+            return 1
+        entradas = struct.unpack(orden + 'H', tiff[desplazamiento:desplazamiento + 2])[0]
+        for k in range(entradas):
+            p = desplazamiento + 2 + 12 * k
+            if p + 12 > len(tiff):
+                break
+            etiqueta = struct.unpack(orden + 'H', tiff[p:p + 2])[0]
+            if etiqueta == 0x0112:
+                valor = struct.unpack(orden + 'H', tiff[p + 8:p + 10])[0]
+                return valor if 1 <= valor <= 8 else 1
+        return 1
+    return 1
+
+
+def aplicar_orientacion(imagen, orientacion):
+    if orientacion == 2:
+        return cv2.flip(imagen, 1)
+    if orientacion == 3:
+        return cv2.rotate(imagen, cv2.ROTATE_180)
+    if orientacion == 4:
+        return cv2.flip(imagen, 0)
+    if orientacion == 5:
+        return cv2.flip(cv2.rotate(imagen, cv2.ROTATE_90_CLOCKWISE), 1)
+    if orientacion == 6:
+        return cv2.rotate(imagen, cv2.ROTATE_90_CLOCKWISE)
+    if orientacion == 7:
+        return cv2.flip(cv2.rotate(imagen, cv2.ROTATE_90_COUNTERCLOCKWISE), 1)
+    if orientacion == 8:
+        return cv2.rotate(imagen, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return imagen
+
+
+def elegir_reduccion(ancho, alto, lado_minimo=min(TAMANO_MODELO)):
+    """
+    Mayor factor de reducción de libjpeg que deja el lado menor >= lado_minimo.
+    """
+    if not ancho or not alto:
+        return 1, cv2.IMREAD_COLOR
+    for factor, flag in FLAGS_REDUCCION:
+        if min(ancho, alto) // factor >= lado_minimo:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def decodificar(datos, tamano=TAMANO_MODELO, max_pixeles=MAX_PIXELES, conservar_aspecto=False):
+    """
+    Decodificar bytes de imagen a una imagen BGR uint8 de `tamano`. Con
+    conservar_aspecto, `tamano` es la caja máxima y no se deforma la imagen.
+    """
+    formato, ancho, alto = dimensiones_cabecera(datos)
+    if ancho and alto and ancho * alto > max_pixeles:
+        raise ImagenInvalida(f"La imagen tiene demasiados píxeles ({ancho}x{alto})", 413)
+    flag = cv2.IMREAD_COLOR
+    if formato == 'jpeg':
+        _, flag = elegir_reduccion(ancho, alto, min(tamano))
+    # La orientación se aplica a mano para que sea la misma con o sin reducción
+    imagen = cv2.imdecode(np.frombuffer(datos, np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if imagen is None:
+        raise ImagenInvalida("Imagen no válida")
+    if formato is None and imagen.shape[0] * imagen.shape[1] > max_pixeles:
+        raise ImagenInvalida("La imagen tiene demasiados píxeles", 413)
+    imagen = aplicar_orientacion(imagen, orientacion_exif(datos))
+    if conservar_aspecto:
+        alto, ancho = imagen.shape[:2]
+        escala = min(tamano[0] / ancho, tamano[1] / alto, 1.0)
+        tamano = (max(1, round(ancho * escala)), max(1, round(alto * escala)))
+    return cv2.resize(imagen, tamano, interpolation=cv2.INTER_AREA)
+
+
+def leer_imagen(stream, tamano=TAMANO_MODELO, conservar_aspecto=False):
+    """
+    Leer y decodificar una imagen subida. Devuelve (bytes_originales, imagen).
+    """
+    datos = leer_limitado(stream)
+    return datos, decodificar(datos, tamano, conservar_aspecto=conservar_aspecto)
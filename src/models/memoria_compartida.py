@@ -0,0 +1,163 @@
+"""
+Anillo de frames en memoria compartida entre procesos.
+
+Separar captura, inferencia y codificación en procesos evita que compitan por
+el GIL con los hilos de TensorFlow, pero pasar cada frame por una
+multiprocessing.Queue lo serializa y copia dos veces. Aquí el proceso de
+captura escribe los frames en un anillo de ranuras de tamaño fijo dentro de
+multiprocessing.shared_memory y los lectores los ven como vistas NumPy sin
+copiar.
+
+Cada ranura lleva un número de secuencia tipo seqlock: impar mientras se
+escribe, par (2 * número_de_frame + 2) cuando está completa. Un lector toma
+la vista, la usa y comprueba con vigente() que la ranura no se reescribió
+mientras tanto; con `ranuras` ranuras tiene ranuras - 1 frames de margen.
+Hay un solo escritor por anillo.
+
+Disposición: cabecera int64 [magia, ranuras, alto, ancho, canales, último],
+secuencias uint64[ranuras], tiempos float64[ranuras] y los frames
+uint8[ranuras, alto, ancho, canales].
+"""
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIA = 0x47494C46  # 'GILF'
+CAMPOS_CABECERA = 6
+ESPERA_SONDEO = 0.0005
+
+
+def _tamano_total(ranuras, forma):
+    alto, ancho, canales = forma
+    return (CAMPOS_CABECERA * 8 + ranuras * 8 + ranuras * 8
+            + ranuras * alto * ancho * canales)
+
+
+class AnilloFrames:
+
+    def __init__(self, memoria, propietario):
+        self.memoria = memoria
+        self.propietario = propietario
+        buf = memoria.buf
+        self.cabecera = np.ndarray((CAMPOS_CABECERA,), np.int64, buf, 0)
+        if self.cabecera[0] != MAGIA:
+            raise ValueError(f"{memoria.name} no es un anillo de frames")
+        self.ranuras, alto, ancho, canales = (int(v) for v in self.cabecera[1:5])
+        self.forma = (alto, ancho, canales)
+        desplazamiento = CAMPOS_CABECERA * 8
+        self.secuencias = np.ndarray((self.ranuras,), np.uint64, buf, desplazamiento)
+        desplazamiento += self.ranuras * 8
+        self.tiempos = np.ndarray((self.ranuras,), np.float64, buf, desplazamiento)
+        desplazamiento += self.ranuras * 8
+        self.frames = np.ndarray((self.ranuras, alto, ancho, canales), np.uint8, buf, desplazamiento)
+
+    @classmethod
+    def crear(cls, forma, ranuras=8, nombre=None):
+        """
+        Crear el anillo para frames de forma (alto, ancho, canales).
+        """
+        memoria = shared_memory.SharedMemory(name=nombre, create=True, size=_tamano_total(ranuras, forma))
+        cabecera = np.ndarray((CAMPOS_CABECERA,), np.int64, memoria.buf, 0)
+        cabecera[:] = (MAGIA, ranuras, *forma, -1)
+        anillo = cls(memoria, propietario=True)
+        anillo.secuencias[:] = 0
+        return anillo
+
+    @classmethod
+    def abrir(cls, nombre):
+        # Sólo el creador debe borrar el segmento. Antes de Python 3.13 no
+        # existe track=False y el resource_tracker lo borraría al salir
+        # cualquier proceso que sólo lo abrió, así que no se registra
+        try:
+            memoria = shared_memory.SharedMemory(name=nombre, track=False)
+        except TypeError:
+            from multiprocessing import resource_tracker
+            registrar = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                memoria = shared_memory.SharedMemory(name=nombre)
+            finally:
+                resource_tracker.register = registrar
+        return cls(memoria, propietario=False)
+
+    @property
+    def nombre(self):
+        return self.memoria.name
+
+    # ---- Escritor ----
+
+    def publicar(self, frame):
+        """
+        Copiar un frame a la siguiente ranura. Devuelve su número.
+        """
+        numero = int(self.cabecera[5]) + 1
+        ranura = numero % self.ranuras
+        self.secuencias[ranura] = 2 * numero + 1      # escribiendo
+        self.frames[ranura] = frame
+        self.tiempos[ranura] = time.monotonic()
+        self.secuencias[ranura] = 2 * numero + 2      # completo
+        self.cabecera[5] = numero
+        return numero
+
+    # ---- Lectores ----
+
+    def ultimo(self):
+        """
+        Número del último frame publicado (-1 si todavía no hay).
+        """
+        return int(self.cabecera[5])
+
+    def leer(self, numero):
+        """
+        Vista (sin copia) del frame `numero`, o None si ya se reescribió o
+        todavía se está escribiendo.
+        """
+        if numero < 0:
+            return None
+        ranura = numero % self.ranuras
+        if int(self.secuencias[ranura]) != 2 * numero + 2:
+            return None
+        return self.frames[ranura]
+
+    def vigente(self, numero):
+        """
+        True si la ranura del frame `numero` no se reescribió: los datos
+        leídos de su vista son consistentes.
+        """
+        return int(self.secuencias[numero % self.ranuras]) == 2 * numero + 2
+
+    def momento(self, numero):
+        return float(self.tiempos[numero % self.ranuras])
+
+    def esperar(self, despues_de, timeout=1.0, mas_reciente=True):
+        """
+        Esperar un frame posterior a `despues_de`. Con mas_reciente se salta
+        a lo último publicado (inferencia en tiempo real); si no, se entrega
+        el siguiente en orden mientras siga en el anillo (codificador).
+        Devuelve (numero, vista) o (None, None) al vencer el timeout.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            ultimo = self.ultimo()
+            if ultimo > despues_de:
+                numero = ultimo if mas_reciente else max(despues_de + 1, ultimo - self.ranuras + 2)
+                vista = self.leer(numero)
+                if vista is not None:
+                    return numero, vista
+            if time.monotonic() >= limite:
+                return None, None
+            time.sleep(ESPERA_SONDEO)
+
+    def cerrar(self):
+        # Soltar las vistas antes de cerrar el segmento
+        self.cabecera = self.secuencias = self.tiempos = self.frames = None
+        self.memoria.close()
+        if self.propietario:
+            self.memoria.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
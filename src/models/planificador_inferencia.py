@@ -0,0 +1,275 @@
+"""
+Planificador de inferencia para varias cámaras.
+
+Cada laboratorio tiene su cámara y su stream, pero el modelo es uno solo. En
+lugar de que cada stream llame al modelo por su cuenta, los streams entregan
+sus imágenes al planificador, que las junta en un solo lote entre cámaras y
+las pasa a un grupo compartido de hilos de inferencia (que a su vez usan el
+servidor de inferencia si está configurado, ver cliente_inferencia.py).
+
+Cada stream tiene un presupuesto de FPS de inferencia y una prioridad. Antes
+de inferir el stream pide turno con admitir(); si todavía no le toca, reusa
+su último resultado y el video sigue en tiempo real. Cuando la CPU se satura
+(el tiempo de respuesta, espera en cola más inferencia, supera
+LATENCIA_MAXIMA) la escala global de muestreo baja y los FPS efectivos de
+los streams se reducen, menos cuanto mayor es su prioridad:
+fps_efectivo = fps * escala ** (1 / prioridad).
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from models.cliente_inferencia import predecir_lote, tamano_entrada
+
+TRABAJADORES = int(os.getenv('GIL_PLANIFICADOR_TRABAJADORES', '2'))
+MAX_LOTE = int(os.getenv('GIL_PLANIFICADOR_MAX_LOTE', '32'))
+VENTANA_LOTE = float(os.getenv('GIL_PLANIFICADOR_VENTANA_MS', '5')) / 1000
+LATENCIA_MAXIMA = float(os.getenv('GIL_PLANIFICADOR_LATENCIA_MS', '150')) / 1000
+FPS_POR_DEFECTO = float(os.getenv('GIL_PLANIFICADOR_FPS', '5'))
+ESCALA_MINIMA = 0.1
+TIEMPO_ESPERA = 5.0
+
+
+class ErrorPlanificador(Exception):
+    """
+    Falló el lote en el que iba la petición; la causa original queda en __cause__.
+    """
+
+
+def unificar_lotes(lotes):
+    """
+    Juntar lotes de varios clientes en uno solo. Si todos son uint8 se
+    conservan así; si alguno viene en float32 ya normalizado, los uint8 se
+    pasan a float32 en [0, 1] antes de concatenar, porque preparar_lote
+    sólo divide por 255 cuando el lote completo es uint8.
+    """
+    if all(lote.dtype == np.uint8 for lote in lotes):
+        return np.concatenate(lotes)
+    return np.concatenate([lote.astype(np.float32) / 255.0 if lote.dtype == np.uint8
+                           else lote.astype(np.float32, copy=False) for lote in lotes])
+
+
+class _Peticion:
+    __slots__ = ('clave', 'lote', 'prioridad', 'llegada', 'resultado', 'error', 'listo')
+
+    def __init__(self, clave, lote, prioridad):
+        self.clave = clave
+        self.lote = lote
+        self.prioridad = prioridad
+        self.llegada = time.monotonic()
+        self.resultado = None
+        self.error = None
+        self.listo = threading.Event()
+
+
+class _Stream:
+    __slots__ = ('fps', 'prioridad', 'clientes', 'ultimo_turno', 'servidos', 'omitidos', 'espera_total')
+
+    def __init__(self, fps, prioridad):
+        self.fps = fps
+        self.prioridad = prioridad
+        self.clientes = 0
+        self.ultimo_turno = 0.0
+        self.servidos = 0
+        self.omitidos = 0
+        self.espera_total = 0.0
+
+
+class PlanificadorInferencia:
+
+    def __init__(self, trabajadores=TRABAJADORES, max_lote=MAX_LOTE, ventana=VENTANA_LOTE,
+                 latencia_maxima=LATENCIA_MAXIMA, predecir=predecir_lote):
+        self.trabajadores = max(1, trabajadores)
+        self.funcion_predecir = predecir
+        self.max_lote = max_lote
+        self.ventana = ventana
+        self.latencia_maxima = latencia_maxima
+        self.streams = {}
+        self.pendientes = []
+        self.condicion = threading.Condition()
+        self.hilos = []
+        self.detenido = False
+        self.escala = 1.0
+        self.respuesta_media = 0.0
+        self.lotes = 0
+        self.imagenes = 0
+
+    # ---- Streams y presupuestos ----
+
+    def registrar_stream(self, clave, fps=FPS_POR_DEFECTO, prioridad=1):
+        """
+        Registrar (o actualizar) un stream. Varios clientes de la misma
+        cámara comparten el presupuesto.
+        """
+        with self.condicion:
+            stream = self.streams.get(clave)
+            if stream is None:
+                stream = self.streams[clave] = _Stream(fps, max(1, prioridad))
+            else:
+                stream.fps, stream.prioridad = fps, max(1, prioridad)
+            stream.clientes += 1
+
+    def cancelar_stream(self, clave):
+        with self.condicion:
+            stream = self.streams.get(clave)
+            if stream is not None:
+                stream.clientes -= 1
+                if stream.clientes <= 0:
+                    del self.streams[clave]
+
+    def fps_efectivo(self, stream):
+        return stream.fps * self.escala ** (1.0 / stream.prioridad)
+
+    def admitir(self, clave):
+        """
+        True si al stream le toca inferir según su presupuesto de FPS.
+        """
+        ahora = time.monotonic()
+        with self.condicion:
+            stream = self.streams.get(clave)
+            if stream is None:
+                return True
+            if ahora - stream.ultimo_turno < 1.0 / self.fps_efectivo(stream):
+                stream.omitidos += 1
+                return False
+            stream.ultimo_turno = ahora
+            return True
+
+    # ---- Inferencia ----
+
+    def iniciar(self):
+        with self.condicion:
+            if self.hilos:
+                return
+            self.detenido = False
+            self.hilos = [threading.Thread(target=self._bucle, name=f'planificador-{i}', daemon=True)
+                          for i in range(self.trabajadores)]
+            for hilo in self.hilos:
+                hilo.start()
+
+    def predecir(self, clave, lote, timeout=TIEMPO_ESPERA):
+        """
+        Predecir un lote (N, alto, ancho, 3) uint8, agrupado con los de otras
+        cámaras. Bloquea sólo a este stream.
+        """
+        self.iniciar()
+        with self.condicion:
+            stream = self.streams.get(clave)
+            peticion = _Peticion(clave, lote, stream.prioridad if stream else 1)
+            self.pendientes.append(peticion)
+            self.condicion.notify()
+        if not peticion.listo.wait(timeout):
+            with self.condicion:
+                if peticion in self.pendientes:
+                    self.pendientes.remove(peticion)
+            raise TimeoutError(f"Inferencia sin respuesta en {timeout} s")
+        if peticion.error is not None:
+            raise peticion.error
+        return peticion.resultado
+
+    def probabilidad(self, clave, frame):
+        """
+        Probabilidad de microscopio de un frame BGR, o None si al stream no
+        le toca inferir en este frame.
+        """
+        if not self.admitir(clave):
+            return None
+        import cv2
+        imagen = cv2.resize(frame, tamano_entrada())[np.newaxis]
+        return float(self.predecir(clave, imagen)[0][0])
+
+    def _tomar_lote(self):
+        """
+        Esperar peticiones y juntar hasta max_lote imágenes, primero las de
+        mayor prioridad y luego por orden de llegada.
+        """
+        with self.condicion:
+            while not self.pendientes and not self.detenido:
+                self.condicion.wait()
+            if self.detenido:
+                return []
+            # Dar unos milisegundos a que lleguen frames de otras cámaras
+            limite = time.monotonic() + self.ventana
+            while sum(len(p.lote) for p in self.pendientes) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self.condicion.wait(restante)
+            self.pendientes.sort(key=lambda p: (-p.prioridad, p.llegada))
+            lote, total = [], 0
+            while self.pendientes and (not lote or total + len(self.pendientes[0].lote) <= self.max_lote):
+                peticion = self.pendientes.pop(0)
+                lote.append(peticion)
+                total += len(peticion.lote)
+            return lote
+
+    def _ajustar_escala(self, respuesta):
+        # Media exponencial del tiempo de respuesta; bajar rápido, subir despacio
+        self.respuesta_media = 0.8 * self.respuesta_media + 0.2 * respuesta
+        if self.respuesta_media > self.latencia_maxima:
+            self.escala = max(ESCALA_MINIMA, self.escala * 0.8)
+        elif self.respuesta_media < self.latencia_maxima / 2 and self.escala < 1.0:
+            self.escala = min(1.0, self.escala * 1.05 + 0.01)
+
+    def _bucle(self):
+        while True:
+            peticiones = self._tomar_lote()
+            if not peticiones:
+                return
+            inicio = time.monotonic()
+            try:
+                predicciones = self.funcion_predecir(unificar_lotes([p.lote for p in peticiones]))
+                desde = 0
+                for p in peticiones:
+                    p.resultado = predicciones[desde:desde + len(p.lote)]
+                    desde += len(p.lote)
+            except Exception as e:
+                # Una excepción propia por petición: cada hilo que espera la
+                # relanza con su traceback
+                for p in peticiones:
+                    p.error = ErrorPlanificador(f"Falló el lote de inferencia ({len(peticiones)} peticiones): {e}")
+                    p.error.__cause__ = e
+            fin = time.monotonic()
+            with self.condicion:
+                for p in peticiones:
+                    stream = self.streams.get(p.clave)
+                    if stream is not None:
+                        stream.servidos += 1
+                        stream.espera_total += inicio - p.llegada
+                self._ajustar_escala(max(fin - p.llegada for p in peticiones))
+                self.lotes += 1
+                self.imagenes += sum(len(p.lote) for p in peticiones)
+            for p in peticiones:
+                p.listo.set()
+
+    def detener(self, timeout=5):
+        with self.condicion:
+            self.detenido = True
+            self.condicion.notify_all()
+            hilos, self.hilos = self.hilos, []
+        for hilo in hilos:
+            hilo.join(timeout)
+
+    def estadisticas(self):
+        with self.condicion:
+            return {
+                'escala': self.escala,
+                'respuesta_media_ms': self.respuesta_media * 1000,
+                'lotes': self.lotes,
+                'lote_medio': self.imagenes / self.lotes if self.lotes else None,
+                'pendientes': len(self.pendientes),
+                'streams': {clave: {
+                    'fps': s.fps,
+                    'fps_efectivo': self.fps_efectivo(s),
+                    'prioridad': s.prioridad,
+                    'clientes': s.clientes,
+                    'servidos': s.servidos,
+                    'omitidos': s.omitidos,
+                    'espera_media_ms': s.espera_total * 1000 / s.servidos if s.servidos else None,
+                } for clave, s in self.streams.items()},
+            }
+
+
+planificador = PlanificadorInferencia()
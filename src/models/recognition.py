@@ -1,19 +1,63 @@
 import cv2
 import numpy as np
-from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions # type: ignore
-from tensorflow.keras.preprocessing.image import img_to_array # type: ignore
-from tensorflow.keras.models import load_model # type: ignore
 
+import json
 import os
-model_path = os.path.join(os.path.dirname(__file__), 'microscopio_model.h5')
-model = load_model(model_path)
+import threading
+
+from models.registro_modelos import UMBRAL
+from models.cliente_inferencia import predecir_lote, tamano_entrada
+from models.cascada import CascadaConfianza
+
+def probabilidad_equipo(frame):
+    """
+    Probabilidad cruda de microscopio, sin aplicar UMBRAL (el seguimiento
+    temporal necesita también las confianzas bajas).
+    """
+    # El modelo activo lo tiene el servidor de inferencia (si está configurado)
+    # o el registro de este proceso, y puede cambiar sin reiniciar
+    imagen = np.expand_dims(cv2.resize(frame, tamano_entrada()), axis=0)
+    return float(predecir_lote(imagen)[0][0])
+
+# Etapa barata sobre histogramas; el modelo completo sólo en la banda incierta
+cascada = CascadaConfianza(completo=probabilidad_equipo)
+
 def detectar_equipo(frame):
-    imagen = cv2.resize(frame, (224, 224))
-    imagen = img_to_array(imagen)
-    imagen = np.expand_dims(imagen, axis=0)
-    imagen = imagen / 255.0  # Normalizar
-    pred = model.predict(imagen)[0][0]
-    if pred > 0.3:
+    pred, _ = cascada.probabilidad(frame)
+    if pred > UMBRAL:
         return "microscopio", pred
     else:
-        return None, None
\ No newline at end of file
+        return None, None
+
+# Modelo multiclase por categorías (train_categorias.py), cargado bajo demanda
+categorias_model_path = os.path.join(os.path.dirname(__file__), 'categorias_model.h5')
+categorias_labels_path = os.path.join(os.path.dirname(__file__), 'categorias_model.json')
+_categorias = None
+_categorias_lock = threading.Lock()
+
+def cargar_modelo_categorias():
+    global _categorias
+    with _categorias_lock:
+        if _categorias is None:
+            from tensorflow.keras.models import load_model  # type: ignore
+            with open(categorias_labels_path, encoding='utf-8') as f:
+                clases = json.load(f)
+            _categorias = (load_model(categorias_model_path), clases)
+    return _categorias
+
+def clasificar_categorias(frame, top_k=3):
+    """
+    Devolver las top_k categorías más probables con su confianza.
+    """
+    modelo, clases = cargar_modelo_categorias()
+    # El modelo se entrenó con imágenes RGB (tf.io.decode_image)
+    imagen = cv2.cvtColor(cv2.resize(frame, (224, 224)), cv2.COLOR_BGR2RGB)
+    imagen = np.expand_dims(imagen.astype(np.float32) / 255.0, axis=0)
+    probabilidades = modelo.predict(imagen, verbose=0)[0]
+    mejores = np.argsort(-probabilidades)[:top_k]
+    return [{
+        "id_categoria": clases[i]['id_categoria'],
+        "nombre_categoria": clases[i]['nombre_categoria'],
+        "codigo_categoria": clases[i]['codigo_categoria'],
+        "confianza": float(probabilidades[i]),
+    } for i in mejores]
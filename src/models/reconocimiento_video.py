@@ -0,0 +1,406 @@
+"""
+Reconocimiento sobre videos grabados (recorridos de inventario por bodegas).
+
+El video se recorre con cv2.VideoCapture sin cargarlo en memoria:
+
+1. Muestreo: se toma un frame cada `muestreo` segundos de video; los demás
+   sólo se avanzan con grab(), sin decodificarlos a imagen.
+2. Cambio de escena: cada frame muestreado se reduce como en la compuerta de
+   movimiento y, si la escena no cambió respecto al último frame inferido (y
+   no pasaron `refresco` segundos de video), se reutiliza su resultado.
+3. Inferencia por lotes: los frames que sí cambian se acumulan hasta
+   `tamano_lote` y se predicen juntos con predecir_lote.
+4. Agregación: las muestras positivas consecutivas (tolerando `max_hueco`
+   muestras negativas) forman una aparición. Cada aparición se identifica con
+   un equipo por votación del índice de hashes sobre sus frames y, si no hay
+   votos, con el índice de embeddings sobre su frame de mayor confianza.
+
+La memoria queda acotada sin importar la duración: como mucho un lote de
+frames pendientes, una miniatura por aparición abierta, un contador por
+equipo identificado y las primeras MAX_APARICIONES apariciones del detalle.
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from models.cliente_inferencia import predecir_lote, tamano_entrada
+from models.compuerta_movimiento import CompuertaMovimiento, reducir
+from models.indice_hash import indice_hash
+from models.registro_modelos import UMBRAL
+
+MUESTREO_SEGUNDOS = float(os.getenv('GIL_VIDEO_MUESTREO', '0.5'))
+UMBRAL_ESCENA = float(os.getenv('GIL_VIDEO_UMBRAL_ESCENA', '0.05'))
+REFRESCO_SEGUNDOS = 5.0
+TAMANO_LOTE = 16
+MAX_HUECO = 2
+MAX_APARICIONES = 200
+LADO_MINIATURA = 320
+FPS_POR_DEFECTO = 30.0
+MAX_BYTES_VIDEO = int(os.getenv('GIL_MAX_BYTES_VIDEO', str(1024 * 1024 * 1024)))
+TAMANO_BLOQUE = 1024 * 1024
+MAX_TRABAJOS = 50
+
+
+def _miniatura(frame, lado=LADO_MINIATURA):
+    alto, ancho = frame.shape[:2]
+    escala = lado / max(alto, ancho)
+    if escala >= 1:
+        return frame.copy()
+    return cv2.resize(frame, (round(ancho * escala), round(alto * escala)), interpolation=cv2.INTER_AREA)
+
+
+class _Aparicion:
+    __slots__ = ('inicio', 'fin', 'muestras', 'confianza_max', 'mejor_frame', 'votos', 'hueco')
+
+    def __init__(self, segundo):
+        self.inicio = segundo
+        self.fin = segundo
+        self.muestras = 0
+        self.confianza_max = 0.0
+        self.mejor_frame = None
+        self.votos = Counter()
+        self.hueco = 0
+
+
+class ResumenVideo:
+    """
+    Acumula las apariciones cerradas en un resumen de inventario.
+    """
+
+    def __init__(self, max_apariciones=MAX_APARICIONES):
+        self.max_apariciones = max_apariciones
+        self.apariciones = []
+        self.total_apariciones = 0
+        self.sin_identificar = 0
+        self.equipos = {}
+
+    def agregar(self, aparicion, id_equipo, metodo):
+        self.total_apariciones += 1
+        if len(self.apariciones) < self.max_apariciones:
+            self.apariciones.append({
+                'inicio_s': round(aparicion.inicio, 2),
+                'fin_s': round(aparicion.fin, 2),
+                'muestras': aparicion.muestras,
+                'confianza_max': round(aparicion.confianza_max, 4),
+                'id_equipo': id_equipo,
+                'identificacion': metodo,
+            })
+        if id_equipo is None:
+            self.sin_identificar += 1
+            return
+        equipo = self.equipos.setdefault(id_equipo, {
+            'apariciones': 0, 'primera_vez_s': aparicion.inicio, 'ultima_vez_s': aparicion.fin,
+            'confianza_max': 0.0})
+        equipo['apariciones'] += 1
+        equipo['ultima_vez_s'] = aparicion.fin
+        equipo['confianza_max'] = max(equipo['confianza_max'], aparicion.confianza_max)
+
+
+class ReconocedorVideo:
+    """
+    Recorre un video y devuelve su resumen; `progreso(dict)` se llama tras
+    cada lote para informar el avance.
+    """
+
+    def __init__(self, muestreo=MUESTREO_SEGUNDOS, umbral_escena=UMBRAL_ESCENA, refresco=REFRESCO_SEGUNDOS,
+                 tamano_lote=TAMANO_LOTE, max_hueco=MAX_HUECO, umbral=UMBRAL, embeddings=True, predecir=None):
+        self.muestreo = muestreo
+        self.umbral_escena = umbral_escena
+        self.refresco = refresco
+        self.tamano_lote = tamano_lote
+        self.max_hueco = max_hueco
+        self.umbral = umbral
+        self.embeddings = embeddings
+        self.predecir = predecir or predecir_lote
+
+    # ---- Identificación de apariciones ----
+
+    def _identificar(self, aparicion):
+        if aparicion.votos:
+            return aparicion.votos.most_common(1)[0][0], 'hash'
+        if self.embeddings and aparicion.mejor_frame is not None:
+            from models.indice_embeddings import indice_embeddings, SIMILITUD_MINIMA
+            try:
+                coincidencias = indice_embeddings.buscar(aparicion.mejor_frame, k=1)
+            except Exception as e:
+                print(f"⚠ No se pudo consultar el índice de embeddings: {e}")
+                self.embeddings = False
+                return None, None
+            if coincidencias and coincidencias[0][1] >= SIMILITUD_MINIMA:
+                return coincidencias[0][0], 'embeddings'
+        return None, None
+
+    def _observar(self, abierta, segundo, confianza, frame, resumen):
+        """
+        Incorporar una muestra a la aparición abierta; devuelve la aparición
+        que queda abierta (o None).
+        """
+        if confianza is not None and confianza > self.umbral:
+            if abierta is None:
+                abierta = _Aparicion(segundo)
+            abierta.fin = segundo
+            abierta.muestras += 1
+            abierta.hueco = 0
+            if frame is not None:
+                coincidencias = indice_hash.buscar(frame, limite=1)
+                if coincidencias:
+                    abierta.votos[coincidencias[0][0]] += 1
+                if confianza > abierta.confianza_max or abierta.mejor_frame is None:
+                    abierta.mejor_frame = frame
+            abierta.confianza_max = max(abierta.confianza_max, confianza)
+            return abierta
+        if abierta is not None:
+            abierta.hueco += 1
+            if abierta.hueco > self.max_hueco:
+                resumen.agregar(abierta, *self._identificar(abierta))
+                return None
+        return abierta
+
+    # ---- Recorrido ----
+
+    def procesar(self, ruta, progreso=None):
+        captura = cv2.VideoCapture(ruta)
+        if not captura.isOpened():
+            raise ValueError(f"No se pudo abrir el video {os.path.basename(ruta)}")
+        fps = captura.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else FPS_POR_DEFECTO
+        total_frames = int(captura.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        paso = max(1, round(fps * self.muestreo))
+        tamano = tamano_entrada()
+
+        compuerta = CompuertaMovimiento(umbral=self.umbral_escena)
+        resumen = ResumenVideo()
+        estado = {'frames': 0, 'muestreados': 0, 'inferidos': 0, 'reutilizados': 0,
+                  'total_frames': total_frames, 'fps_video': fps}
+        # Muestras en orden: [segundo, miniatura, 'inferir' | 'reutilizar', entrada
+        # del modelo]; resolver() reemplaza el tercer campo por la confianza.
+        # Las que reutilizan el último resultado esperan a que se resuelva su lote
+        pendientes = []
+        ultima_confianza = None
+        ultimo_inferido = None
+        abierta = None
+        inicio = time.perf_counter()
+
+        def resolver():
+            nonlocal abierta, ultima_confianza
+            por_inferir = [p for p in pendientes if p[2] == 'inferir']
+            if por_inferir:
+                lote = np.stack([p[3] for p in por_inferir])
+                probabilidades = np.ravel(self.predecir(lote))
+                for p, probabilidad in zip(por_inferir, probabilidades):
+                    p[2] = float(probabilidad)
+                estado['inferidos'] += len(por_inferir)
+            for p in pendientes:
+                if p[2] == 'reutilizar':
+                    p[2] = ultima_confianza
+                else:
+                    ultima_confianza = p[2]
+                abierta = self._observar(abierta, p[0], p[2], p[1], resumen)
+            pendientes.clear()
+            if progreso is not None:
+                progreso(dict(estado, segundos=estado['frames'] / fps,
+                              apariciones=resumen.total_apariciones,
+                              procesamiento_s=time.perf_counter() - inicio))
+
+        try:
+            while True:
+                if estado['frames'] % paso:
+                    # Avanzar sin decodificar
+                    if not captura.grab():
+                        break
+                    estado['frames'] += 1
+                    continue
+                ok, frame = captura.read()
+                if not ok:
+                    break
+                segundo = estado['frames'] / fps
+                estado['frames'] += 1
+                estado['muestreados'] += 1
+
+                reducido = reducir(frame)
+                cambio = compuerta.puntuar(reducido)
+                vencido = ultimo_inferido is None or segundo - ultimo_inferido >= self.refresco
+                if cambio < self.umbral_escena and not vencido:
+                    estado['reutilizados'] += 1
+                    pendientes.append([segundo, None, 'reutilizar', None])
+                else:
+                    compuerta.referencia = reducido
+                    ultimo_inferido = segundo
+                    pendientes.append([segundo, _miniatura(frame), 'inferir', cv2.resize(frame, tamano)])
+                if sum(1 for p in pendientes if p[2] == 'inferir') >= self.tamano_lote:
+                    resolver()
+            resolver()
+            if abierta is not None:
+                resumen.agregar(abierta, *self._identificar(abierta))
+        finally:
+            captura.release()
+
+        return {
+            'duracion_s': round(estado['frames'] / fps, 2),
+            'fps_video': fps,
+            'frames': estado['frames'],
+            'muestreados': estado['muestreados'],
+            'inferidos': estado['inferidos'],
+            'reutilizados': estado['reutilizados'],
+            'procesamiento_s': round(time.perf_counter() - inicio, 2),
+            'apariciones': resumen.apariciones,
+            'total_apariciones': resumen.total_apariciones,
+            'sin_identificar': resumen.sin_identificar,
+            'equipos': [dict(datos, id_equipo=id_equipo) for id_equipo, datos in resumen.equipos.items()],
+        }
+
+
+def cruzar_inventario(resumen, id_laboratorio=None):
+    """
+    Completar el resumen con los datos de `equipos` y, si se indica el
+    laboratorio, listar los microscopios registrados allí que no aparecieron.
+    """
+    from gil_database_connection import get_db_connection
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        encontrados = resumen['equipos']
+        ids = [equipo['id_equipo'] for equipo in encontrados]
+        if ids:
+            marcadores = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"""
+                SELECT id_equipo, codigo_interno, nombre_equipo, id_laboratorio, estado_equipo, ubicacion_especifica
+                FROM equipos WHERE id_equipo IN ({marcadores})
+            """, ids)
+            filas = {fila['id_equipo']: fila for fila in cursor.fetchall()}
+            encontrados = [{**filas.get(equipo['id_equipo'], {}), **equipo} for equipo in encontrados]
+            if id_laboratorio is not None:
+                # Equipos vistos fuera del laboratorio donde están registrados
+                for equipo in encontrados:
+                    equipo['en_laboratorio'] = equipo.get('id_laboratorio') == id_laboratorio
+        faltantes = []
+        if id_laboratorio is not None:
+            cursor.execute("""
+                SELECT e.id_equipo, e.codigo_interno, e.nombre_equipo, e.estado_equipo, e.ubicacion_especifica
+                FROM equipos e LEFT JOIN categorias_equipos c ON c.id_categoria = e.id_categoria
+                WHERE e.id_laboratorio = %s AND e.estado_equipo NOT IN ('prestado', 'dado_baja')
+                  AND (c.codigo_categoria = 'MICRO' OR e.nombre_equipo LIKE %s)
+            """, (id_laboratorio, '%microscopio%'))
+            faltantes = [fila for fila in cursor.fetchall() if fila['id_equipo'] not in ids]
+    finally:
+        cursor.close()
+        conn.close()
+    resumen = dict(resumen, equipos=encontrados, faltantes=faltantes)
+    if id_laboratorio is not None:
+        resumen['id_laboratorio'] = id_laboratorio
+    return resumen
+
+
+class VideoInvalido(Exception):
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def guardar_temporal(stream, max_bytes=MAX_BYTES_VIDEO, sufijo='.mp4'):
+    """
+    Copiar el video subido a un archivo temporal por bloques (OpenCV necesita
+    una ruta) sin pasar de max_bytes. Devuelve la ruta.
+    """
+    descriptor, ruta = tempfile.mkstemp(prefix='gil_video_', suffix=sufijo)
+    total = 0
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            while True:
+                bloque = stream.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                total += len(bloque)
+                if total > max_bytes:
+                    raise VideoInvalido(f"El video supera el máximo de {max_bytes // (1024 * 1024)} MB", 413)
+                f.write(bloque)
+        if total == 0:
+            raise VideoInvalido("El archivo está vacío")
+    except Exception:
+        os.unlink(ruta)
+        raise
+    return ruta
+
+
+class TrabajosVideo:
+    """
+    Procesa los videos subidos de a uno en segundo plano (la CPU la comparten
+    con el video en vivo) y guarda el estado de los últimos MAX_TRABAJOS.
+    """
+
+    def __init__(self, max_trabajos=MAX_TRABAJOS):
+        self.max_trabajos = max_trabajos
+        self.trabajos = OrderedDict()
+        self.lock = threading.Lock()
+        self.ejecutor = None
+        self.en_cola = {}
+
+    def encolar(self, ruta, id_laboratorio=None, borrar=True, **opciones):
+        id_trabajo = uuid.uuid4().hex
+        with self.lock:
+            if self.ejecutor is None:
+                self.ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reconocimiento-video')
+            self.trabajos[id_trabajo] = {'id_trabajo': id_trabajo, 'estado': 'en_cola', 'progreso': None,
+                                         'resumen': None, 'error': None}
+            while len(self.trabajos) > self.max_trabajos:
+                self.trabajos.popitem(last=False)
+            self.en_cola[id_trabajo] = (ruta, borrar)
+            self.ejecutor.submit(self._procesar, id_trabajo, ruta, id_laboratorio, borrar, opciones)
+        return id_trabajo
+
+    def _actualizar(self, id_trabajo, **cambios):
+        with self.lock:
+            trabajo = self.trabajos.get(id_trabajo)
+            if trabajo is not None:
+                trabajo.update(cambios)
+
+    def _procesar(self, id_trabajo, ruta, id_laboratorio, borrar, opciones):
+        with self.lock:
+            if self.en_cola.pop(id_trabajo, None) is None:
+                return  # cancelado por detener()
+        self._actualizar(id_trabajo, estado='procesando')
+        try:
+            reconocedor = ReconocedorVideo(**opciones)
+            resumen = reconocedor.procesar(ruta, lambda p: self._actualizar(id_trabajo, progreso=p))
+            try:
+                resumen = cruzar_inventario(resumen, id_laboratorio)
+            except Exception as e:
+                print(f"⚠ No se pudo cruzar el resumen del video con equipos: {e}")
+            self._actualizar(id_trabajo, estado='terminado', resumen=resumen)
+        except Exception as e:
+            self._actualizar(id_trabajo, estado='error', error=str(e))
+        finally:
+            if borrar and os.path.exists(ruta):
+                os.unlink(ruta)
+
+    def detener(self):
+        """
+        Cancelar los trabajos en cola (borrando sus videos temporales) sin
+        esperar al que está en curso.
+        """
+        with self.lock:
+            ejecutor, self.ejecutor = self.ejecutor, None
+            cancelados, self.en_cola = self.en_cola, {}
+            for id_trabajo in cancelados:
+                if id_trabajo in self.trabajos:
+                    self.trabajos[id_trabajo]['estado'] = 'cancelado'
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=False, cancel_futures=True)
+        for ruta, borrar in cancelados.values():
+            if borrar and os.path.exists(ruta):
+                os.unlink(ruta)
+
+    def consultar(self, id_trabajo):
+        with self.lock:
+            trabajo = self.trabajos.get(id_trabajo)
+            return dict(trabajo) if trabajo is not None else None
+
+
+trabajos_video = TrabajosVideo()
@@ -0,0 +1,193 @@
+"""
+Reparto de CPU entre TensorFlow, OpenCV y los hilos web.
+
+Los pools intra/inter-op de TensorFlow y el de OpenCV usan por defecto todos
+los núcleos, en la misma máquina donde los hilos de Flask atienden
+peticiones; con carga se pisan entre sí y la latencia se dispara. Aquí se
+dimensionan todos desde una sola configuración, por rol de proceso:
+
+    'web'         proceso Flask: decodifica imágenes en cada hilo de petición
+                  y, sin servidor de inferencia, también corre el modelo
+    'inferencia'  servidor_inferencia.py: sólo el modelo, opcionalmente
+                  fijado a un conjunto de núcleos
+
+La configuración es configuracion_sistema.recursos_cpu (JSON con una entrada
+por rol: hilos_tf_intra, hilos_tf_inter, hilos_opencv, nucleos). La variable
+GIL_RECURSOS_CPU, con el mismo JSON, la reemplaza (útil sin base de datos).
+Lo que falte se reparte automáticamente según los núcleos disponibles.
+benchmarks/bench_recursos.py busca el mejor reparto para una máquina y puede
+guardarlo.
+
+Los hilos de TensorFlow sólo se pueden fijar antes de que inicialice su
+runtime, por eso `gobernador.aplicar()` va al arrancar el proceso y
+cargar_modelo llama a `gobernador.preparar_tensorflow()` antes de importarlo.
+"""
+import json
+import os
+import sys
+import threading
+
+import cv2
+
+from gil_database_connection import get_db_connection, leer_configuracion
+
+ROLES = ('web', 'inferencia')
+CLAVES = ('hilos_tf_intra', 'hilos_tf_inter', 'hilos_opencv', 'nucleos')
+
+
+def nucleos_disponibles():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parsear_nucleos(valor):
+    """
+    '0-3,6' o [0, 1, 2] -> lista ordenada de núcleos; None o '' -> None.
+    """
+    if valor in (None, '', []):
+        return None
+    if isinstance(valor, (list, tuple)):
+        return sorted({int(n) for n in valor})
+    nucleos = set()
+    for parte in str(valor).split(','):
+        inicio, _, fin = parte.strip().partition('-')
+        nucleos.update(range(int(inicio), int(fin or inicio) + 1))
+    return sorted(nucleos)
+
+
+def reparto_automatico(rol, total=None):
+    """
+    Reparto por defecto para `total` núcleos. OpenCV queda en un hilo: en el
+    proceso web el paralelismo ya lo dan los hilos de petición.
+    """
+    total = total or len(nucleos_disponibles())
+    return {
+        'hilos_tf_intra': max(1, total // 2) if rol == 'web' else max(1, total - 1),
+        'hilos_tf_inter': 1 if total < 8 else 2,
+        'hilos_opencv': 1,
+        'nucleos': None,
+    }
+
+
+def leer_reparto(rol):
+    """
+    Reparto efectivo de `rol`: lo configurado (GIL_RECURSOS_CPU o
+    configuracion_sistema) y el reparto automático para lo que falte.
+    """
+    if rol not in ROLES:
+        raise ValueError(f"Rol no válido: {rol}")
+    configuracion = None
+    entorno = os.getenv('GIL_RECURSOS_CPU')
+    if entorno:
+        try:
+            configuracion = json.loads(entorno)
+        except ValueError:
+            print("⚠ GIL_RECURSOS_CPU no es un JSON válido; se ignora")
+    if configuracion is None:
+        configuracion = leer_configuracion('recursos_cpu', {})
+    propio = configuracion.get(rol) if isinstance(configuracion, dict) else None
+    propio = propio if isinstance(propio, dict) else {}
+    nucleos = parsear_nucleos(propio.get('nucleos'))
+    reparto = reparto_automatico(rol, len(nucleos) if nucleos else None)
+    reparto.update({clave: propio[clave] for clave in CLAVES if propio.get(clave) is not None})
+    reparto['nucleos'] = nucleos
+    return reparto
+
+
+def guardar_reparto(rol, reparto):
+    """
+    Escribir el reparto de `rol` en configuracion_sistema.recursos_cpu.
+    """
+    actual = leer_configuracion('recursos_cpu', {})
+    actual = actual if isinstance(actual, dict) else {}
+    actual[rol] = {clave: reparto.get(clave) for clave in CLAVES}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE configuracion_sistema SET valor_config = %s WHERE clave_config = 'recursos_cpu'",
+                   (json.dumps(actual),))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return actual
+
+
+def fijar_nucleos(nucleos):
+    """
+    Fijar todos los hilos del proceso a `nucleos`. En Linux la afinidad es
+    por hilo, así que se aplica a cada hilo ya creado; los nuevos la heredan.
+    """
+    if not nucleos or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        hilos = [int(t) for t in os.listdir('/proc/self/task')]
+    except OSError:
+        hilos = [0]
+    for hilo in hilos:
+        try:
+            os.sched_setaffinity(hilo, nucleos)
+        except OSError:
+            # El hilo pudo terminar entre listar y fijar
+            pass
+    return True
+
+
+class GobernadorRecursos:
+    """
+    Reparto de CPU aplicado en este proceso, según su rol.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rol = None
+        self.reparto = None
+        self.tensorflow = None
+
+    def aplicar(self, rol='web', reparto=None):
+        with self.lock:
+            self.rol = rol
+            self.reparto = dict(reparto) if reparto is not None else leer_reparto(rol)
+            self.reparto['nucleos'] = parsear_nucleos(self.reparto.get('nucleos'))
+            fijar_nucleos(self.reparto['nucleos'])
+            cv2.setNumThreads(int(self.reparto['hilos_opencv']))
+            if 'tensorflow' not in sys.modules:
+                # Leídas por TensorFlow y oneDNN al importarse
+                os.environ['TF_NUM_INTRAOP_THREADS'] = str(self.reparto['hilos_tf_intra'])
+                os.environ['TF_NUM_INTEROP_THREADS'] = str(self.reparto['hilos_tf_inter'])
+                os.environ['OMP_NUM_THREADS'] = str(self.reparto['hilos_tf_intra'])
+        if 'tensorflow' in sys.modules:
+            self.preparar_tensorflow()
+        return self.reparto
+
+    def preparar_tensorflow(self):
+        """
+        Fijar los hilos de TensorFlow antes de su primer uso (idempotente).
+        """
+        if self.reparto is None:
+            self.aplicar()
+        with self.lock:
+            if self.tensorflow is not None:
+                return self.tensorflow
+            import tensorflow as tf  # type: ignore
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(int(self.reparto['hilos_tf_intra']))
+                tf.config.threading.set_inter_op_parallelism_threads(int(self.reparto['hilos_tf_inter']))
+                self.tensorflow = 'aplicado'
+            except RuntimeError as e:
+                # El runtime ya estaba inicializado (p. ej. un script que importó TF antes)
+                print(f"⚠ No se pudieron fijar los hilos de TensorFlow: {e}")
+                self.tensorflow = 'ya_inicializado'
+            return self.tensorflow
+
+    def estado(self):
+        with self.lock:
+            return {
+                'rol': self.rol,
+                'reparto': self.reparto,
+                'tensorflow': self.tensorflow,
+                'opencv_hilos': cv2.getNumThreads(),
+                'nucleos_disponibles': nucleos_disponibles(),
+            }
+
+
+gobernador = GobernadorRecursos()
@@ -0,0 +1,259 @@
+"""
+Reevaluación por lotes de reconocimientos_imagen tras activar otro modelo.
+
+Se recorren las filas con imagen guardada que se registraron con otro
+id_modelo_usado (o que siguen con validacion_manual = 'pendiente') en
+páginas por id_reconocimiento, sin cargar la tabla en memoria. Las imágenes
+de cada página se leen y decodifican (ya reducidas al tamaño del modelo) en
+un pool de procesos; la inferencia se hace en este proceso, o en el servidor
+de inferencia si está configurado, en lotes de `tamano_lote`. TensorFlow no
+se puede usar con seguridad después de un fork, así que los procesos del pool
+sólo decodifican y se crean con spawn.
+
+Las confianzas nuevas se escriben por página en una sola sentencia
+(INSERT ... ON DUPLICATE KEY UPDATE sobre la clave primaria). Tras cada
+página se guarda un punto de control en data/reevaluacion/ con el último id
+procesado y el reporte acumulado, así que un trabajo interrumpido continúa
+donde quedó.
+
+El reporte compara la versión anterior de cada fila con la nueva: matriz de
+acuerdo al UMBRAL, diferencia media de confianza, ejemplos de filas que
+cambian de decisión y, para las filas validadas a mano, la precisión de cada
+modelo.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gil_database_connection import get_db_connection
+from models.eventos_reconocimiento import DIRECTORIO_UPLOADS
+from models.ingesta_imagen import decodificar, ImagenInvalida, MAX_BYTES
+from models.registro_modelos import UMBRAL
+
+DIRECTORIO_CONTROL = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'reevaluacion')
+TAMANO_PAGINA = 500
+TAMANO_LOTE = 32
+MAX_EJEMPLOS = 20
+
+SQL_PAGINA = """
+    SELECT id_reconocimiento, imagen_original_url, confianza_deteccion, id_modelo_usado, validacion_manual
+    FROM reconocimientos_imagen
+    WHERE id_reconocimiento > %s AND imagen_original_url IS NOT NULL
+      AND (id_modelo_usado IS NULL OR id_modelo_usado <> %s OR validacion_manual = 'pendiente')
+    ORDER BY id_reconocimiento
+    LIMIT %s
+"""
+
+SQL_ACTUALIZAR = """
+    INSERT INTO reconocimientos_imagen (id_reconocimiento, confianza_deteccion, id_modelo_usado, validacion_manual)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE confianza_deteccion = VALUES(confianza_deteccion),
+                            id_modelo_usado = VALUES(id_modelo_usado),
+                            validacion_manual = VALUES(validacion_manual)
+"""
+
+
+def ruta_imagen(url):
+    """
+    imagen_original_url ('uploads/<archivo>') -> ruta en disco.
+    """
+    if os.path.isabs(url):
+        return url
+    return os.path.join(DIRECTORIO_UPLOADS, '..', url)
+
+
+def _leer(tarea):
+    """
+    Tarea del pool: (id_reconocimiento, imagen BGR uint8 o None, error).
+    """
+    id_reconocimiento, url, tamano = tarea
+    try:
+        ruta = ruta_imagen(url)
+        if os.path.getsize(ruta) > MAX_BYTES:
+            return id_reconocimiento, None, "imagen demasiado grande"
+        with open(ruta, 'rb') as f:
+            return id_reconocimiento, decodificar(f.read(), tuple(tamano)), None
+    except (OSError, ImagenInvalida) as e:
+        return id_reconocimiento, None, str(e)
+
+
+def validacion_para(fila, nueva):
+    """
+    validacion_manual se refiere a la decisión guardada: si la nueva
+    confianza cambia la decisión, la validación se invierte para que siga
+    describiendo la misma verdad (ver aprendizaje_activo.etiqueta_validada).
+    """
+    validacion = fila['validacion_manual']
+    anterior = fila['confianza_deteccion']
+    if validacion not in ('correcto', 'incorrecto') or anterior is None:
+        return validacion
+    if (float(anterior) > UMBRAL) == (nueva > UMBRAL):
+        return validacion
+    return 'incorrecto' if validacion == 'correcto' else 'correcto'
+
+
+def reporte_vacio():
+    return {
+        'procesadas': 0,
+        'sin_imagen': 0,
+        # Acuerdo a UMBRAL entre la confianza guardada y la nueva
+        'ambos_positivo': 0, 'ambos_negativo': 0, 'positivo_a_negativo': 0, 'negativo_a_positivo': 0,
+        'sin_confianza_anterior': 0,
+        'diferencia_total': 0.0,
+        'por_modelo_anterior': {},
+        # Filas validadas a mano: 'correcto' confirma la decisión anterior
+        'validadas': 0, 'aciertos_anterior': 0, 'aciertos_nuevo': 0,
+        'ejemplos_cambio': [],
+    }
+
+
+def acumular(reporte, fila, nueva):
+    reporte['procesadas'] += 1
+    anterior = fila['confianza_deteccion']
+    clave_modelo = str(fila['id_modelo_usado'])
+    por_modelo = reporte['por_modelo_anterior'].setdefault(clave_modelo, {'filas': 0, 'coincidencias': 0})
+    por_modelo['filas'] += 1
+    positivo_nuevo = nueva > UMBRAL
+    if anterior is None:
+        reporte['sin_confianza_anterior'] += 1
+        return
+    anterior = float(anterior)
+    positivo_anterior = anterior > UMBRAL
+    reporte['diferencia_total'] += abs(nueva - anterior)
+    if positivo_anterior == positivo_nuevo:
+        por_modelo['coincidencias'] += 1
+        reporte['ambos_positivo' if positivo_nuevo else 'ambos_negativo'] += 1
+    else:
+        reporte['positivo_a_negativo' if positivo_anterior else 'negativo_a_positivo'] += 1
+        if len(reporte['ejemplos_cambio']) < MAX_EJEMPLOS:
+            reporte['ejemplos_cambio'].append({
+                'id_reconocimiento': fila['id_reconocimiento'], 'anterior': anterior,
+                'nueva': round(nueva, 4), 'validacion_manual': fila['validacion_manual']})
+    if fila['validacion_manual'] in ('correcto', 'incorrecto'):
+        verdadero = positivo_anterior if fila['validacion_manual'] == 'correcto' else not positivo_anterior
+        reporte['validadas'] += 1
+        reporte['aciertos_anterior'] += int(positivo_anterior == verdadero)
+        reporte['aciertos_nuevo'] += int(positivo_nuevo == verdadero)
+
+
+def resumir(reporte):
+    """
+    Agregar los porcentajes al reporte acumulado.
+    """
+    comparadas = reporte['procesadas'] - reporte['sin_confianza_anterior']
+    acuerdos = reporte['ambos_positivo'] + reporte['ambos_negativo']
+    return dict(
+        reporte,
+        acuerdo=acuerdos / comparadas if comparadas else None,
+        diferencia_media=reporte['diferencia_total'] / comparadas if comparadas else None,
+        precision_anterior=reporte['aciertos_anterior'] / reporte['validadas'] if reporte['validadas'] else None,
+        precision_nuevo=reporte['aciertos_nuevo'] / reporte['validadas'] if reporte['validadas'] else None,
+    )
+
+
+class Reevaluacion:
+    """
+    Un trabajo de reevaluación hacia el modelo `id_modelo`, reanudable.
+    """
+
+    def __init__(self, id_modelo, predecir, tamano, procesos=None, tamano_pagina=TAMANO_PAGINA,
+                 tamano_lote=TAMANO_LOTE, escribir=True, directorio=DIRECTORIO_CONTROL):
+        self.id_modelo = id_modelo
+        self.predecir = predecir
+        self.tamano = tamano
+        self.procesos = procesos
+        self.tamano_pagina = tamano_pagina
+        self.tamano_lote = tamano_lote
+        self.escribir = escribir
+        # Un reporte sin escritura no debe marcar filas como ya reevaluadas
+        sufijo = '' if escribir else '_reporte'
+        self.ruta_control = os.path.join(directorio, f"modelo_{id_modelo}{sufijo}.json")
+        self.ultimo_id = 0
+        self.reporte = reporte_vacio()
+
+    # ---- Punto de control ----
+
+    def cargar_control(self):
+        if os.path.exists(self.ruta_control):
+            with open(self.ruta_control, encoding='utf-8') as f:
+                control = json.load(f)
+            self.ultimo_id = control['ultimo_id']
+            self.reporte = control['reporte']
+            return True
+        return False
+
+    def guardar_control(self, terminado=False):
+        os.makedirs(os.path.dirname(self.ruta_control), exist_ok=True)
+        temporal = self.ruta_control + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'id_modelo': self.id_modelo, 'ultimo_id': self.ultimo_id, 'terminado': terminado,
+                       'reporte': self.reporte}, f)
+        os.replace(temporal, self.ruta_control)
+
+    # ---- Recorrido ----
+
+    def _pagina(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(SQL_PAGINA, (self.ultimo_id, self.id_modelo, self.tamano_pagina))
+        filas = cursor.fetchall()
+        cursor.close()
+        return filas
+
+    def _inferir(self, imagenes):
+        return np.concatenate([np.ravel(self.predecir(np.stack(imagenes[i:i + self.tamano_lote])))
+                               for i in range(0, len(imagenes), self.tamano_lote)])
+
+    def _escribir(self, conn, actualizaciones):
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(SQL_ACTUALIZAR, actualizaciones)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def ejecutar(self, progreso=None):
+        """
+        Procesar las páginas pendientes. Devuelve el reporte resumido.
+        """
+        conn = get_db_connection()
+        inicio = time.perf_counter()
+        try:
+            # spawn: este proceso puede tener TensorFlow cargado y no debe hacer fork
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto) as pool:
+                while True:
+                    filas = self._pagina(conn)
+                    if not filas:
+                        break
+                    tareas = [(f['id_reconocimiento'], f['imagen_original_url'], self.tamano) for f in filas]
+                    leidas = {}
+                    for id_reconocimiento, imagen, error in pool.map(_leer, tareas, chunksize=16):
+                        if imagen is None:
+                            self.reporte['sin_imagen'] += 1
+                        else:
+                            leidas[id_reconocimiento] = imagen
+                    validas = [f for f in filas if f['id_reconocimiento'] in leidas]
+                    if validas:
+                        confianzas = self._inferir([leidas[f['id_reconocimiento']] for f in validas])
+                        actualizaciones = []
+                        for fila, confianza in zip(validas, confianzas):
+                            acumular(self.reporte, fila, float(confianza))
+                            actualizaciones.append((fila['id_reconocimiento'], round(float(confianza), 2),
+                                                    self.id_modelo, validacion_para(fila, float(confianza))))
+                        if self.escribir:
+                            self._escribir(conn, actualizaciones)
+                    self.ultimo_id = filas[-1]['id_reconocimiento']
+                    self.guardar_control()
+                    if progreso is not None:
+                        progreso(self.ultimo_id, self.reporte, time.perf_counter() - inicio)
+            self.guardar_control(terminado=True)
+        finally:
+            conn.close()
+        return resumir(self.reporte)
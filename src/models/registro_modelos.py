@@ -0,0 +1,373 @@
+"""
+Registro de modelos de reconocimiento respaldado por la tabla modelos_ia.
+
+El modelo activo es la fila más reciente con tipo_modelo =
+'reconocimiento_imagenes' y estado_modelo = 'activo'. Un hilo en segundo
+plano revisa la tabla periódicamente; cuando aparece otra versión la carga,
+la calienta con una predicción de prueba y cambia la referencia usada por
+detectar_equipo de forma atómica. Las peticiones en curso terminan con el
+modelo anterior, que se libera cuando ya nadie lo usa.
+
+Opcionalmente, una versión candidata (GIL_MODELO_SOMBRA=<id_modelo>) recibe
+una fracción del tráfico en un hilo aparte para comparar sus predicciones con
+las del modelo activo sin afectar la respuesta.
+"""
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from gil_database_connection import get_db_connection
+
+DIRECTORIO_MODELOS = os.path.dirname(os.path.abspath(__file__))
+RUTA_POR_DEFECTO = os.path.join(DIRECTORIO_MODELOS, 'microscopio_model.h5')
+TIPO_MODELO = 'reconocimiento_imagenes'
+INTERVALO_REVISION = int(os.getenv('GIL_MODELO_INTERVALO', '30'))
+FRACCION_SOMBRA = float(os.getenv('GIL_MODELO_FRACCION_SOMBRA', '0.1'))
+UMBRAL = 0.3
+
+
+def resolver_ruta(ruta):
+    if not ruta:
+        return RUTA_POR_DEFECTO
+    return ruta if os.path.isabs(ruta) else os.path.join(DIRECTORIO_MODELOS, ruta)
+
+
+def preparar_lote(lote):
+    """
+    Lote de frames BGR (el orden de OpenCV y de las cámaras), uint8 de 0 a 255
+    o float32 en [0, 1] -> float32 RGB en [0, 1], que es lo que esperan los
+    modelos: train_microscopio.py, train_cabeza.py y train_destilacion.py
+    entrenan con imágenes RGB. Todo lo que predice con el modelo binario pasa
+    por aquí, así la conversión de canales se hace en un solo lugar.
+    """
+    lote = np.asarray(lote)[..., ::-1]
+    if lote.dtype == np.uint8:
+        return lote.astype(np.float32) / 255.0
+    return np.ascontiguousarray(lote, dtype=np.float32)
+
+
+class ModeloCargado:
+    """
+    Un modelo Keras en memoria con un contador de peticiones en curso.
+    """
+
+    def __init__(self, id_modelo, version, ruta, modelo):
+        self.id_modelo = id_modelo
+        self.version = version
+        self.ruta = ruta
+        self.modelo = modelo
+        self.en_uso = 0
+        self.condicion = threading.Condition()
+
+    @property
+    def tamano_entrada(self):
+        _, alto, ancho, _ = self.modelo.input_shape
+        return (ancho, alto)
+
+    def predecir(self, lote):
+        return self.modelo.predict(lote, verbose=0)
+
+    def adquirir(self):
+        with self.condicion:
+            self.en_uso += 1
+
+    def liberar(self):
+        with self.condicion:
+            self.en_uso -= 1
+            if self.en_uso == 0:
+                self.condicion.notify_all()
+
+    def esperar_drenado(self, timeout=60):
+        with self.condicion:
+            return self.condicion.wait_for(lambda: self.en_uso == 0, timeout=timeout)
+
+
+def cargar_modelo(id_modelo, version, ruta):
+    """
+    Cargar un modelo desde disco y calentarlo con una predicción de prueba,
+    para que la primera petición real no pague la inicialización de TF.
+    """
+    from models.recursos_cpu import gobernador
+    # Los hilos de TensorFlow se fijan antes de que inicialice su runtime
+    gobernador.preparar_tensorflow()
+    from tensorflow.keras.models import load_model  # type: ignore
+    modelo = load_model(resolver_ruta(ruta))
+    cargado = ModeloCargado(id_modelo, version, ruta, modelo)
+    ancho, alto = cargado.tamano_entrada
+    cargado.predecir(np.zeros((1, alto, ancho, 3), dtype=np.float32))
+    return cargado
+
+
+def consultar_modelo(id_modelo=None):
+    """
+    Devolver la fila del modelo activo (o del id indicado), o None.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    if id_modelo is None:
+        cursor.execute("""
+            SELECT id_modelo, version_modelo, ruta_archivo FROM modelos_ia
+            WHERE tipo_modelo = %s AND estado_modelo = 'activo'
+            ORDER BY fecha_deployment DESC, id_modelo DESC LIMIT 1
+        """, (TIPO_MODELO,))
+    else:
+        cursor.execute("""
+            SELECT id_modelo, version_modelo, ruta_archivo FROM modelos_ia
+            WHERE id_modelo = %s
+        """, (id_modelo,))
+    fila = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return fila
+
+
+def registrar_modelo(nombre, version, ruta, precision=None, parametros=None,
+                     fecha_entrenamiento=None, activar=False):
+    """
+    Insertar una versión en modelos_ia. Si activar es True, las demás
+    versiones de reconocimiento pasan a 'inactivo' y los workers la cargarán
+    en la siguiente revisión.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if activar:
+            cursor.execute("""
+                UPDATE modelos_ia SET estado_modelo = 'inactivo'
+                WHERE tipo_modelo = %s AND estado_modelo = 'activo'
+            """, (TIPO_MODELO,))
+        cursor.execute("""
+            INSERT INTO modelos_ia (nombre_modelo, tipo_modelo, version_modelo, ruta_archivo,
+                                    precision_modelo, fecha_entrenamiento, estado_modelo, parametros_modelo)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (nombre, TIPO_MODELO, version, ruta, precision, fecha_entrenamiento,
+              'activo' if activar else 'inactivo',
+              json.dumps(parametros) if parametros is not None else None))
+        conn.commit()
+        return cursor.lastrowid
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def listar_modelos(ids=None):
+    """
+    Filas de modelos_ia de reconocimiento (todas o las de `ids`), la activa primero.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    filtro = ''
+    parametros = [TIPO_MODELO]
+    if ids:
+        filtro = f"AND id_modelo IN ({', '.join(['%s'] * len(ids))})"
+        parametros += list(ids)
+    cursor.execute(f"""
+        SELECT id_modelo, nombre_modelo, version_modelo, ruta_archivo, estado_modelo, parametros_modelo
+        FROM modelos_ia WHERE tipo_modelo = %s {filtro}
+        ORDER BY estado_modelo = 'activo' DESC, fecha_deployment DESC, id_modelo DESC
+    """, parametros)
+    filas = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return filas
+
+
+def actualizar_parametros(id_modelo, cambios):
+    """
+    Mezclar `cambios` en el JSON de parametros_modelo de una versión.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT parametros_modelo FROM modelos_ia WHERE id_modelo = %s FOR UPDATE", (id_modelo,))
+        fila = cursor.fetchone()
+        if fila is None:
+            raise ValueError(f"No existe el modelo {id_modelo}")
+        try:
+            parametros = json.loads(fila[0]) if fila[0] else {}
+        except (TypeError, ValueError):
+            parametros = {}
+        if not isinstance(parametros, dict):
+            parametros = {'valor_anterior': parametros}
+        parametros.update(cambios)
+        cursor.execute("UPDATE modelos_ia SET parametros_modelo = %s WHERE id_modelo = %s",
+                       (json.dumps(parametros), id_modelo))
+        conn.commit()
+        return parametros
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class RegistroModelos:
+    """
+    Mantiene la referencia al modelo activo y la intercambia sin cortes.
+    """
+
+    def __init__(self, intervalo=INTERVALO_REVISION, id_sombra=None, fraccion_sombra=FRACCION_SOMBRA):
+        self.intervalo = intervalo
+        self.actual = None
+        self.lock = threading.Lock()
+        self.carga_lock = threading.RLock()
+        self.detenido = threading.Event()
+        self.hilo = None
+        # Tráfico sombra
+        self.id_sombra = id_sombra
+        self.fraccion_sombra = fraccion_sombra
+        self.sombra = None
+        self.hilo_sombra = None
+        self.cola_sombra = queue.Queue(maxsize=32)
+        self.contador_sombra = 0
+        self.estadisticas_sombra = {'comparaciones': 0, 'coincidencias': 0,
+                                    'diferencia_media': 0.0, 'descartadas': 0}
+
+    def iniciar(self):
+        """
+        Cargar el modelo activo (bloqueante, sólo la primera vez) y arrancar
+        el hilo que vigila modelos_ia.
+        """
+        with self.carga_lock:
+            if self.actual is None:
+                self.revisar()
+            if self.hilo is None and self.intervalo > 0:
+                self.hilo = threading.Thread(target=self._vigilar, name='registro-modelos', daemon=True)
+                self.hilo.start()
+            if self.id_sombra is not None and self.hilo_sombra is None:
+                self.hilo_sombra = threading.Thread(target=self._bucle_sombra, name='modelo-sombra', daemon=True)
+                self.hilo_sombra.start()
+
+    def detener(self):
+        self.detenido.set()
+
+    def _vigilar(self):
+        while not self.detenido.wait(self.intervalo):
+            try:
+                self.revisar()
+            except Exception as e:
+                print(f"⚠ Error revisando modelos_ia: {e}")
+
+    def revisar(self):
+        """
+        Comparar la versión activa en la base de datos con la cargada y, si
+        cambió, cargar la nueva en este hilo e intercambiarla.
+        """
+        with self.carga_lock:
+            return self._revisar()
+
+    def _revisar(self):
+        try:
+            fila = consultar_modelo()
+        except Exception as e:
+            if self.actual is not None:
+                raise
+            print(f"⚠ modelos_ia no disponible ({e}), usando {RUTA_POR_DEFECTO}")
+            fila = None
+        if fila is None:
+            fila = {'id_modelo': None, 'version_modelo': 'local', 'ruta_archivo': None}
+        actual = self.actual
+        if actual is not None and actual.id_modelo == fila['id_modelo']:
+            return False
+        nuevo = cargar_modelo(fila['id_modelo'], fila['version_modelo'], fila['ruta_archivo'])
+        self.activar(nuevo)
+        return True
+
+    def activar(self, nuevo):
+        with self.lock:
+            anterior = self.actual
+            self.actual = nuevo
+        print(f"✓ Modelo de reconocimiento activo: versión {nuevo.version} (id {nuevo.id_modelo})")
+        if anterior is not None:
+            threading.Thread(target=self._retirar, args=(anterior,), daemon=True).start()
+
+    def _retirar(self, anterior):
+        # Soltar el modelo sólo cuando ya nadie lo usa: las peticiones en curso
+        # siguen llamando a anterior.predecir()
+        if not anterior.esperar_drenado():
+            print(f"⚠ El modelo {anterior.version} sigue en uso tras el tiempo de drenado; se libera al terminar")
+            anterior.esperar_drenado(timeout=None)
+        anterior.modelo = None
+
+    @contextmanager
+    def usar(self):
+        """
+        Entregar el modelo activo protegido contra el intercambio mientras dure
+        el bloque `with`.
+        """
+        if self.actual is None:
+            self.iniciar()
+        with self.lock:
+            modelo = self.actual
+            modelo.adquirir()
+        try:
+            yield modelo
+        finally:
+            modelo.liberar()
+
+    # ---- Tráfico sombra ----
+
+    def enviar_sombra(self, lote, prediccion):
+        """
+        Encolar una muestra para el modelo sombra sin bloquear la petición.
+        """
+        if self.sombra is None:
+            return
+        self.contador_sombra += 1
+        if self.contador_sombra * self.fraccion_sombra < 1:
+            return
+        self.contador_sombra = 0
+        try:
+            self.cola_sombra.put_nowait((lote, prediccion))
+        except queue.Full:
+            self.estadisticas_sombra['descartadas'] += 1
+
+    def _bucle_sombra(self):
+        try:
+            fila = consultar_modelo(self.id_sombra)
+            self.sombra = cargar_modelo(fila['id_modelo'], fila['version_modelo'], fila['ruta_archivo'])
+        except Exception as e:
+            print(f"⚠ No se pudo cargar el modelo sombra {self.id_sombra}: {e}")
+            return
+        while not self.detenido.is_set():
+            try:
+                lote, prediccion = self.cola_sombra.get(timeout=1)
+            except queue.Empty:
+                continue
+            ancho, alto = self.sombra.tamano_entrada
+            if lote.shape[1:3] != (alto, ancho):
+                import cv2
+                lote = np.stack([cv2.resize(img, (ancho, alto)) for img in lote])
+            prediccion_sombra = self.sombra.predecir(lote)
+            e = self.estadisticas_sombra
+            for p, s in zip(np.ravel(prediccion), np.ravel(prediccion_sombra)):
+                e['comparaciones'] += 1
+                e['coincidencias'] += int((p > UMBRAL) == (s > UMBRAL))
+                e['diferencia_media'] += (abs(float(p) - float(s)) - e['diferencia_media']) / e['comparaciones']
+
+    def estado(self):
+        actual = self.actual
+        estado = {
+            'id_modelo': actual.id_modelo if actual else None,
+            'version': actual.version if actual else None,
+            'en_uso': actual.en_uso if actual else 0,
+        }
+        if self.sombra is not None:
+            e = dict(self.estadisticas_sombra)
+            e['id_modelo'] = self.sombra.id_modelo
+            e['version'] = self.sombra.version
+            e['concordancia'] = e['coincidencias'] / e['comparaciones'] if e['comparaciones'] else None
+            estado['sombra'] = e
+        return estado
+
+
+_id_sombra = os.getenv('GIL_MODELO_SOMBRA')
+registro = RegistroModelos(id_sombra=int(_id_sombra) if _id_sombra else None)
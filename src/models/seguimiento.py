@@ -0,0 +1,302 @@
+"""
+Seguimiento temporal de detecciones entre keyframes.
+
+Clasificar cada frame por separado hace que la etiqueta parpadee alrededor
+del umbral de 0.3 y obliga a correr la CNN en todos los frames. Aquí la CNN
+sólo corre cada CADA_N frames (keyframes) o cuando se pierde un objeto
+seguido; entre keyframes las cajas se propagan con un tracker ligero de
+OpenCV (KCF/MOSSE si opencv-contrib está instalado, si no, correlación de
+plantilla en una ventana de búsqueda).
+
+La confianza de cada track se suaviza con una media exponencial y se aplica
+histéresis: un track se confirma cuando supera UMBRAL_ALTO y sólo deja de
+mostrarse cuando cae por debajo de UMBRAL_BAJO.
+"""
+import itertools
+import os
+import threading
+
+import cv2
+
+CADA_N = int(os.getenv('GIL_SEGUIMIENTO_CADA', '10'))
+TIPO_TRACKER = os.getenv('GIL_SEGUIMIENTO_TRACKER', 'kcf')
+UMBRAL_ALTO = 0.45
+UMBRAL_BAJO = 0.2
+ALPHA_CONFIANZA = 0.5
+IOU_ASOCIACION = 0.3
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ancho = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    alto = max(0, min(ay + ah, by + bh) - max(ay, by))
+    interseccion = ancho * alto
+    union = aw * ah + bw * bh - interseccion
+    return interseccion / union if union else 0.0
+
+
+class TrackerPlantilla:
+    """
+    Tracker de respaldo sin opencv-contrib: busca la plantilla del keyframe
+    en una ventana alrededor de la última posición (matchTemplate sobre
+    gris reducido). Se da por perdido si la correlación baja de `minimo`.
+    """
+
+    def __init__(self, lado_plantilla=48, margen=0.5, minimo=0.5):
+        self.lado_plantilla = lado_plantilla
+        self.margen = margen
+        self.minimo = minimo
+        self.plantilla = None
+        self.caja = None
+        self.escala = 1.0
+
+    def _gris(self, frame):
+        gris = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.escala == 1.0:
+            return gris
+        return cv2.resize(gris, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+
+    def init(self, frame, caja):
+        x, y, w, h = [int(v) for v in caja]
+        self.escala = min(1.0, self.lado_plantilla / max(w, h, 1))
+        gris = self._gris(frame)
+        e = self.escala
+        self.plantilla = gris[int(y * e):int((y + h) * e), int(x * e):int((x + w) * e)].copy()
+        self.caja = (x, y, w, h)
+        return True
+
+    def update(self, frame):
+        x, y, w, h = self.caja
+        mx, my = int(w * self.margen), int(h * self.margen)
+        alto, ancho = frame.shape[:2]
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(ancho, x + w + mx), min(alto, y + h + my)
+        e = self.escala
+        ventana = self._gris(frame[y0:y1, x0:x1])
+        ph, pw = self.plantilla.shape[:2]
+        if ventana.shape[0] < ph or ventana.shape[1] < pw or ph == 0 or pw == 0:
+            return False, self.caja
+        resultado = cv2.matchTemplate(ventana, self.plantilla, cv2.TM_CCOEFF_NORMED)
+        _, maximo, _, (dx, dy) = cv2.minMaxLoc(resultado)
+        if maximo < self.minimo:
+            return False, self.caja
+        self.caja = (x0 + int(dx / e), y0 + int(dy / e), w, h)
+        return True, self.caja
+
+
+def crear_tracker(tipo=TIPO_TRACKER):
+    """
+    Tracker de OpenCV por nombre ('kcf', 'mosse', 'plantilla'), con
+    TrackerPlantilla como respaldo si la build no lo incluye.
+    """
+    fabricas = {
+        'kcf': [('legacy', 'TrackerKCF_create'), (None, 'TrackerKCF_create')],
+        'mosse': [('legacy', 'TrackerMOSSE_create')],
+    }
+    for modulo, nombre in fabricas.get(tipo, []):
+        origen = getattr(cv2, modulo, None) if modulo else cv2
+        fabrica = getattr(origen, nombre, None) if origen is not None else None
+        if fabrica is not None:
+            return fabrica()
+    return TrackerPlantilla()
+
+
+class Track:
+    __slots__ = ('id_track', 'etiqueta', 'confianza', 'confirmado', 'caja', 'tracker', 'id_equipo')
+
+    def __init__(self, id_track, etiqueta, confianza, caja=None, id_equipo=None):
+        self.id_track = id_track
+        self.etiqueta = etiqueta
+        self.confianza = float(confianza)
+        self.confirmado = False
+        self.caja = caja
+        self.tracker = None
+        self.id_equipo = id_equipo
+
+    def como_deteccion(self):
+        return {'id_track': self.id_track, 'etiqueta': self.etiqueta, 'confianza': self.confianza,
+                'caja': [int(v) for v in self.caja] if self.caja is not None else None,
+                'id_equipo': self.id_equipo}
+
+
+class SeguidorDetecciones:
+    """
+    Mantiene los tracks de una fuente de video. `procesar(frame, inferir)`
+    devuelve (detecciones_confirmadas, inferido); `inferir()` debe devolver
+    [{'etiqueta', 'confianza', 'caja' (o None para el frame completo),
+    'id_equipo' opcional}] incluyendo confianzas bajas, para que la
+    histéresis pueda bajar, o None si en este frame no se puede inferir.
+    """
+
+    def __init__(self, cada_n=CADA_N, tipo_tracker=TIPO_TRACKER, umbral_alto=UMBRAL_ALTO,
+                 umbral_bajo=UMBRAL_BAJO, alpha=ALPHA_CONFIANZA):
+        self.cada_n = max(1, cada_n)
+        self.tipo_tracker = tipo_tracker
+        self.umbral_alto = umbral_alto
+        self.umbral_bajo = umbral_bajo
+        self.alpha = alpha
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.desde_keyframe = None
+        # La CNN corre fuera del lock; mientras un cliente infiere, los demás
+        # propagan con los trackers en vez de esperarlo
+        self.en_curso = False
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.keyframes = 0
+        self.perdidas = 0
+
+    def _suavizar(self, track, confianza):
+        track.confianza = self.alpha * float(confianza) + (1 - self.alpha) * track.confianza
+        if track.confianza >= self.umbral_alto:
+            track.confirmado = True
+        elif track.confianza < self.umbral_bajo:
+            track.confirmado = False
+
+    def _iniciar_tracker(self, track, frame):
+        track.tracker = None
+        if track.caja is None:
+            return
+        tracker = crear_tracker(self.tipo_tracker)
+        try:
+            tracker.init(frame, tuple(int(v) for v in track.caja))
+            track.tracker = tracker
+        except cv2.error:
+            track.tracker = None
+
+    def _asociar(self, detecciones):
+        """
+        Emparejar detecciones con tracks de la misma etiqueta (mayor IoU
+        primero; las de frame completo se emparejan sólo por etiqueta).
+        """
+        pares = []
+        for i, d in enumerate(detecciones):
+            for j, t in enumerate(self.tracks):
+                if t.etiqueta != d['etiqueta']:
+                    continue
+                if d.get('caja') is None or t.caja is None:
+                    pares.append((1.0, i, j))
+                else:
+                    solape = iou(d['caja'], t.caja)
+                    if solape >= IOU_ASOCIACION:
+                        pares.append((solape, i, j))
+        pares.sort(reverse=True)
+        usados_d, usados_t, emparejados = set(), set(), []
+        for _, i, j in pares:
+            if i in usados_d or j in usados_t:
+                continue
+            usados_d.add(i)
+            usados_t.add(j)
+            emparejados.append((i, j))
+        return emparejados, usados_d, usados_t
+
+    def _keyframe(self, frame, detecciones):
+        emparejados, usados_d, usados_t = self._asociar(detecciones)
+        for i, j in emparejados:
+            d, t = detecciones[i], self.tracks[j]
+            self._suavizar(t, d['confianza'])
+            t.caja = d.get('caja')
+            t.id_equipo = d.get('id_equipo') or t.id_equipo
+        # Los tracks sin detección decaen hacia 0
+        for j, t in enumerate(self.tracks):
+            if j not in usados_t:
+                self._suavizar(t, 0.0)
+        self.tracks = [t for t in self.tracks if t.confianza >= self.umbral_bajo]
+        for i, d in enumerate(detecciones):
+            if i in usados_d or d['confianza'] < self.umbral_bajo:
+                continue
+            t = Track(next(self.ids), d['etiqueta'], d['confianza'], d.get('caja'), d.get('id_equipo'))
+            t.confirmado = t.confianza >= self.umbral_alto
+            self.tracks.append(t)
+        for t in self.tracks:
+            self._iniciar_tracker(t, frame)
+        self.desde_keyframe = 0
+        self.keyframes += 1
+
+    def _propagar(self, frame):
+        """
+        Mover las cajas con los trackers. Devuelve True si se perdió algún
+        track confirmado.
+        """
+        perdido = False
+        for t in self.tracks:
+            if t.tracker is None:
+                continue
+            ok, caja = t.tracker.update(frame)
+            if ok:
+                t.caja = tuple(int(v) for v in caja)
+            else:
+                t.tracker = None
+                perdido = perdido or t.confirmado
+        return perdido
+
+    def _inferir(self, inferir):
+        try:
+            return inferir()
+        finally:
+            with self.lock:
+                self.en_curso = False
+
+    def procesar(self, frame, inferir):
+        with self.lock:
+            self.frames += 1
+            vencido = self.desde_keyframe is None or self.desde_keyframe + 1 >= self.cada_n
+            pedir = vencido and not self.en_curso
+            self.en_curso = self.en_curso or pedir
+        if pedir:
+            detecciones = self._inferir(inferir)
+            if detecciones is not None:
+                with self.lock:
+                    self._keyframe(frame, detecciones)
+                    return self._confirmados(), True
+
+        # Entre keyframes (o si inferir() devolvió None porque no había
+        # turno para el modelo) las cajas se propagan con los trackers
+        with self.lock:
+            perdido = False
+            if self.desde_keyframe is not None:
+                self.desde_keyframe += 1
+                perdido = self._propagar(frame)
+                if perdido:
+                    self.perdidas += 1
+            pedir = perdido and not vencido and not self.en_curso
+            if not pedir:
+                return self._confirmados(), False
+            self.en_curso = True
+        detecciones = self._inferir(inferir)
+        with self.lock:
+            if detecciones is not None:
+                self._keyframe(frame, detecciones)
+            return self._confirmados(), detecciones is not None
+
+    def _confirmados(self):
+        return [t.como_deteccion() for t in self.tracks if t.confirmado]
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'keyframes': self.keyframes,
+                'perdidas': self.perdidas,
+                'ratio_inferencia': self.keyframes / self.frames if self.frames else 0.0,
+                'tracks': len(self.tracks),
+                'confirmados': sum(1 for t in self.tracks if t.confirmado),
+            }
+
+
+_seguidores = {}
+_seguidores_lock = threading.Lock()
+
+
+def seguidor_para(clave):
+    with _seguidores_lock:
+        if clave not in _seguidores:
+            _seguidores[clave] = SeguidorDetecciones()
+        return _seguidores[clave]
+
+
+def estadisticas_seguidores():
+    with _seguidores_lock:
+        seguidores = dict(_seguidores)
+    return {clave: seguidor.estadisticas() for clave, seguidor in seguidores.items()}
@@ -0,0 +1,62 @@
+# Reconocer equipos en un video grabado y resumir el inventario encontrado.
+#
+#   python reconocer_video.py recorrido_bodega.mp4
+#   python reconocer_video.py recorrido.mp4 --laboratorio 2 --muestreo 1 --json resumen.json
+#
+# Con --laboratorio se listan además los microscopios registrados en ese
+# laboratorio que no aparecieron en el video.
+import argparse
+import json
+import sys
+
+from models.reconocimiento_video import (ReconocedorVideo, cruzar_inventario, MUESTREO_SEGUNDOS,
+                                         UMBRAL_ESCENA, TAMANO_LOTE)
+
+
+def mostrar_progreso(progreso):
+    total = progreso['total_frames']
+    avance = f"{progreso['frames'] / total:.0%}" if total else f"{progreso['segundos']:.0f} s"
+    print(f"\r  {avance}  muestreados {progreso['muestreados']}, inferidos {progreso['inferidos']}, "
+          f"apariciones {progreso['apariciones']}", end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconocimiento de equipos en un video")
+    parser.add_argument('video')
+    parser.add_argument('--laboratorio', type=int, default=None)
+    parser.add_argument('--muestreo', type=float, default=MUESTREO_SEGUNDOS,
+                        help="Segundos de video entre frames analizados")
+    parser.add_argument('--umbral-escena', type=float, default=UMBRAL_ESCENA,
+                        help="Fracción de píxeles cambiados para volver a inferir")
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--sin-embeddings', action='store_true',
+                        help="Identificar equipos sólo con el índice de hashes")
+    parser.add_argument('--sin-inventario', action='store_true', help="No consultar la tabla equipos")
+    parser.add_argument('--json', default=None, help="Guardar el resumen completo en este archivo")
+    args = parser.parse_args()
+
+    reconocedor = ReconocedorVideo(muestreo=args.muestreo, umbral_escena=args.umbral_escena,
+                                   tamano_lote=args.lote, embeddings=not args.sin_embeddings)
+    resumen = reconocedor.procesar(args.video, mostrar_progreso)
+    print(file=sys.stderr)
+    if not args.sin_inventario:
+        resumen = cruzar_inventario(resumen, args.laboratorio)
+
+    print(f"✅ {args.video}: {resumen['duracion_s']:.0f} s de video en {resumen['procesamiento_s']:.1f} s")
+    print(f"  frames {resumen['frames']}, muestreados {resumen['muestreados']}, "
+          f"inferidos {resumen['inferidos']}, reutilizados {resumen['reutilizados']}")
+    print(f"  apariciones {resumen['total_apariciones']}, sin identificar {resumen['sin_identificar']}")
+    for equipo in resumen['equipos']:
+        nombre = equipo.get('nombre_equipo') or ''
+        print(f"  - equipo {equipo['id_equipo']} {equipo.get('codigo_interno') or ''} {nombre}: "
+              f"{equipo['apariciones']} apariciones, {equipo['primera_vez_s']:.0f}-{equipo['ultima_vez_s']:.0f} s")
+    for faltante in resumen.get('faltantes', []):
+        print(f"  ✗ no aparece: {faltante['codigo_interno']} {faltante['nombre_equipo']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2, default=str)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# Reevaluar los reconocimientos guardados con el modelo activo (o con otra
+# versión de modelos_ia) y comparar sus decisiones con las anteriores.
+#
+#   python reevaluar_reconocimientos.py                  # continúa si se interrumpió
+#   python reevaluar_reconocimientos.py --solo-reporte   # no escribe en la base
+#   python reevaluar_reconocimientos.py --modelo 7 --procesos 4 --reiniciar --json reporte.json
+import argparse
+import json
+import os
+import sys
+
+from models.cliente_inferencia import predecir_lote, tamano_entrada
+from models.reevaluacion import Reevaluacion, resumir, TAMANO_PAGINA, TAMANO_LOTE
+from models.registro_modelos import consultar_modelo, cargar_modelo, preparar_lote, registro
+
+
+def preparar_modelo(id_modelo):
+    """
+    Devolver (id_modelo, predecir, tamano). Sin --modelo se usa el activo
+    (servidor de inferencia o registro); otra versión se carga en proceso.
+    """
+    activo = consultar_modelo()
+    if id_modelo is None or (activo and activo['id_modelo'] == id_modelo):
+        if activo is None:
+            raise SystemExit("No hay un modelo de reconocimiento activo en modelos_ia")
+        return activo['id_modelo'], predecir_lote, tamano_entrada()
+    fila = consultar_modelo(id_modelo)
+    if fila is None:
+        raise SystemExit(f"No existe el modelo {id_modelo} en modelos_ia")
+    cargado = cargar_modelo(fila['id_modelo'], fila['version_modelo'], fila['ruta_archivo'])
+    return fila['id_modelo'], lambda lote: cargado.predecir(preparar_lote(lote)), cargado.tamano_entrada
+
+
+def mostrar_progreso(ultimo_id, reporte, segundos):
+    print(f"\r  hasta id {ultimo_id}: {reporte['procesadas']} reevaluadas, {reporte['sin_imagen']} sin imagen "
+          f"({reporte['procesadas'] / max(segundos, 1e-9):.1f}/s)", end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reevaluar reconocimientos_imagen con otro modelo")
+    parser.add_argument('--modelo', type=int, default=None, help="id_modelo destino (por defecto el activo)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos que decodifican imágenes")
+    parser.add_argument('--pagina', type=int, default=TAMANO_PAGINA, help="Filas por página y escritura")
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Imágenes por predicción")
+    parser.add_argument('--solo-reporte', action='store_true', help="Comparar sin actualizar la base")
+    parser.add_argument('--reiniciar', action='store_true', help="Ignorar el punto de control")
+    parser.add_argument('--json', default=None, help="Guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    id_modelo, predecir, tamano = preparar_modelo(args.modelo)
+    trabajo = Reevaluacion(id_modelo, predecir, tamano, procesos=args.procesos, tamano_pagina=args.pagina,
+                           tamano_lote=args.lote, escribir=not args.solo_reporte)
+    if args.reiniciar and os.path.exists(trabajo.ruta_control):
+        os.unlink(trabajo.ruta_control)
+    if trabajo.cargar_control():
+        print(f"Continuando desde id_reconocimiento {trabajo.ultimo_id} ({trabajo.reporte['procesadas']} ya reevaluadas)")
+
+    try:
+        reporte = trabajo.ejecutar(mostrar_progreso)
+    except KeyboardInterrupt:
+        print(f"\n⚠ Interrumpido en id {trabajo.ultimo_id}; se continuará desde ahí")
+        reporte = resumir(trabajo.reporte)
+    finally:
+        registro.detener()
+    print(file=sys.stderr)
+
+    porcentaje = lambda v: f"{v:.1%}" if v is not None else '-'
+    print(f"✅ Reevaluación hacia el modelo {id_modelo}{' (sin escribir)' if args.solo_reporte else ''}")
+    print(f"  filas {reporte['procesadas']}, sin imagen {reporte['sin_imagen']}, acuerdo {porcentaje(reporte['acuerdo'])}, "
+          f"diferencia media {reporte['diferencia_media'] or 0:.3f}")
+    print(f"  positivo→negativo {reporte['positivo_a_negativo']}, negativo→positivo {reporte['negativo_a_positivo']}")
+    for modelo, datos in reporte['por_modelo_anterior'].items():
+        print(f"  desde modelo {modelo}: {datos['filas']} filas, "
+              f"{porcentaje(datos['coincidencias'] / datos['filas'] if datos['filas'] else None)} de acuerdo")
+    if reporte['validadas']:
+        print(f"  validadas a mano {reporte['validadas']}: precisión anterior {porcentaje(reporte['precision_anterior'])}, "
+              f"nueva {porcentaje(reporte['precision_nuevo'])}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
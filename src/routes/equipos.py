@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 import mysql.connector
 import os
 from dotenv import load_dotenv
+from models.indice_hash import indice_hash
+from models.indice_embeddings import indice_embeddings
 
 load_dotenv()
 
@@ -87,6 +89,9 @@ def actualizar_equipo(id):
     conn.commit()
     cursor.close()
     conn.close()
+    if data.get('estado_equipo') == 'dado_baja':
+        indice_hash.eliminar_equipo(id)
+        indice_embeddings.eliminar_equipo(id)
     return jsonify({"mensaje": f"Equipo {id} actualizado"})
 
 # 🔹 ELIMINAR
@@ -98,4 +103,6 @@ def eliminar_equipo(id):
     conn.commit()
     cursor.close()
     conn.close()
+    indice_hash.eliminar_equipo(id)
+    indice_embeddings.eliminar_equipo(id)
     return jsonify({"mensaje": f"Equipo {id} eliminado"})
\ No newline at end of file
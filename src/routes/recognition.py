@@ -1,9 +1,26 @@
 
-from flask import Blueprint, render_template, Response, request, redirect, url_for, flash
-from models.recognition import detectar_equipo
+from flask import Blueprint, render_template, Response, request, redirect, url_for, flash, jsonify, session
+from models.recognition import detectar_equipo, clasificar_categorias, cascada
+from models.indice_hash import indice_hash
+from models.indice_embeddings import indice_embeddings, SIMILITUD_MINIMA
+from models.registro_modelos import registro, UMBRAL
+from models.cliente_inferencia import cliente, id_modelo_activo, ErrorInferencia
+from models.eventos_reconocimiento import sumidero, EventoReconocimiento
+from models.aprendizaje_activo import cola_revision, registrar_validacion, VALIDACIONES
+from models.ingesta_imagen import leer_imagen, ImagenInvalida
+from models.deteccion_regiones import DetectorRegiones, detector_para, PRESUPUESTO_MS, PROPUESTAS, MODOS_MODELO
+from models.compuerta_movimiento import compuerta_para, estadisticas_compuertas
+from models.seguimiento import seguidor_para, estadisticas_seguidores, UMBRAL_BAJO
+from models.fuentes_video import obtener_fuente
+from models.planificador_inferencia import planificador, FPS_POR_DEFECTO
+from models.recursos_cpu import gobernador
+from models.reconocimiento_video import (trabajos_video, guardar_temporal, VideoInvalido, MUESTREO_SEGUNDOS,
+                                         UMBRAL_ESCENA)
+from routes.tiempo_real import publicar_deteccion, publicar_detecciones, nombre_sala
 import cv2
 import numpy as np
 import os
+import time
 import mysql.connector
 from dotenv import load_dotenv
 
@@ -11,6 +28,10 @@ from dotenv import load_dotenv
 recognition_bp = Blueprint('recognition', __name__, url_prefix='/reconocimiento')
 load_dotenv()
 
+DIRECTORIO_REFERENCIAS = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'referencias')
+# Segundos sin consultar el índice de hashes en un stream después de un error de MySQL
+ESPERA_INDICE_STREAM = 30.0
+
 def get_db_connection():
     return mysql.connector.connect(
         host=os.getenv('DB_HOST', 'localhost'),
@@ -20,29 +41,143 @@ def get_db_connection():
         port=int(os.getenv('DB_PORT', 3306))
     )
 
-# Abrir la cámara
-camera = cv2.VideoCapture(0)
+def _marcar(etapas, etapa, inicio):
+    """
+    Acumular el tiempo de una etapa del stream (sólo si se pidió medir).
+    """
+    ahora = time.perf_counter()
+    if etapas is not None:
+        etapas.setdefault(etapa, []).append(ahora - inicio)
+    return ahora
+
+def generar_frames(fuente, sala=None, overlay=True, calidad=80, modo='frame', compuerta=True, seguimiento=True,
+                   registrar=True, etapas=None, fps=FPS_POR_DEFECTO, prioridad=1):
+    # `etapas` (dict) recibe los tiempos de lectura, inferencia, publicación y
+    # codificación de cada frame; lo usa benchmarks/bench_replay.py
+    clave = f"{sala or fuente.nombre}:{modo}"
+    # El modelo se comparte entre cámaras: el planificador junta los frames
+    # de todas en lotes y limita cada stream a `fps` inferencias por segundo
+    planificador.registrar_stream(clave, fps, prioridad)
+    # Con seguimiento el detector devuelve también las cajas de confianza baja
+    # para que la histéresis las pueda seguir
+    detector = None
+    if modo == 'regiones':
+        detector = DetectorRegiones(umbral=UMBRAL_BAJO if seguimiento else None,
+                                    predecir=lambda lote: planificador.predecir(clave, lote))
+    # La CNN sólo corre si la escena cambió (o venció el refresco); si no, se
+    # reutiliza el último resultado
+    gate = compuerta_para(clave) if compuerta else None
+    # Entre keyframes las detecciones se propagan con un tracker
+    seguidor = seguidor_para(clave) if seguimiento else None
+    # Tras un fallo de MySQL no se vuelve a consultar el índice hasta pasado este momento
+    sin_indice_hasta = [0.0]
+
+    def inferir(frame):
+        # None si a este stream no le toca inferir todavía
+        if detector is not None:
+            return detector.detectar(frame) if planificador.admitir(clave) else None
+        # Cascada: la cabeza de histogramas resuelve los frames claros y sólo
+        # la banda incierta pide el modelo completo, por el planificador
+        confianza, _ = cascada.probabilidad(frame, completo=lambda f: planificador.probabilidad(clave, f))
+        if confianza is None:
+            return None
+        id_equipo = None
+        if sala and confianza >= UMBRAL_BAJO and time.monotonic() >= sin_indice_hasta[0]:
+            # El video no depende de MySQL: sin base se sigue sin identificar el equipo
+            try:
+                coincidencias = indice_hash.buscar(frame, limite=1)
+                id_equipo = coincidencias[0][0] if coincidencias else None
+            except mysql.connector.Error as e:
+                print(f"⚠ Índice de hashes no disponible en el stream {clave}: {e}")
+                sin_indice_hasta[0] = time.monotonic() + ESPERA_INDICE_STREAM
+        return [{'etiqueta': 'microscopio', 'confianza': confianza, 'caja': None, 'id_equipo': id_equipo}]
+
+    def procesar(frame):
+        if seguidor is not None:
+            return seguidor.procesar(frame, lambda: inferir(frame))
+        detecciones = inferir(frame)
+        if detecciones is None:
+            return None
+        umbral = detector.umbral if detector is not None else UMBRAL
+        return [d for d in detecciones if d['confianza'] > umbral], True
+
+    ultimo = []
+    try:
+        while True:
+            inicio = time.perf_counter()
+            success, frame = fuente.leer()
+            if not success:
+                break
+            marca = _marcar(etapas, 'lectura', inicio)
+
+            procesado = True
+            if gate is not None:
+                # Los frames resueltos por el tracker no cuentan como inferencias
+                resultado, procesado = gate.evaluar(frame, lambda: procesar(frame),
+                                                    corrio_modelo=lambda r: r[1])
+            else:
+                resultado = procesar(frame)
+            # Sin turno en el planificador: se reutiliza el último resultado
+            detecciones, inferido = resultado if resultado is not None else (ultimo, False)
+            inferido = inferido and procesado
+            ultimo = detecciones
+            marca = _marcar(etapas, 'inferencia', marca)
 
-def generar_frames():
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
+            if detector is not None:
+                # Varias cajas por frame; se dibujan aquí o en el cliente
+                if sala:
+                    publicar_detecciones(sala, detecciones, (frame.shape[1], frame.shape[0]))
+                # Los resultados reutilizados o propagados no son observaciones nuevas
+                if detecciones and inferido and registrar:
+                    # Un reconocimiento por frame con todas sus cajas
+                    sumidero.registrar_stream(clave, tuple(sorted(d['etiqueta'] for d in detecciones)),
+                                              lambda: EventoReconocimiento(
+                                                  detecciones[0]['confianza'], coordenadas=detecciones,
+                                                  id_modelo=id_modelo_activo(), imagen=frame.copy()))
+                for d in detecciones:
+                    if overlay:
+                        x, y, w, h = d['caja']
+                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                        cv2.putText(frame, f"{d['etiqueta']} ({d['confianza']*100:.1f}%)", (x + 4, max(20, y - 6)),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                marca = _marcar(etapas, 'publicacion', marca)
+                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+                _marcar(etapas, 'codificacion', marca)
+                yield (b'--frame\r\n'
+                    b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+                continue
 
-        # Detectar equipo
-        nombre, confianza = detectar_equipo(frame)
+            # Detectar equipo
+            nombre = confianza = id_equipo = None
+            if detecciones:
+                nombre, confianza, id_equipo = (detecciones[0]['etiqueta'], detecciones[0]['confianza'],
+                                                detecciones[0]['id_equipo'])
 
-        # Mostrar el resultado en la pantalla
-        if nombre:
-            texto = f"{nombre} ({confianza*100:.1f}%)"
-            cv2.putText(frame, texto, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            # Publicar el resultado a los clientes suscritos (Socket.IO)
+            if sala:
+                publicar_deteccion(sala, nombre, confianza, id_equipo=id_equipo,
+                                   tamano_frame=(frame.shape[1], frame.shape[0]))
 
-        # Convertir a formato web
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
+            # Los resultados reutilizados no son observaciones nuevas
+            if nombre and inferido and registrar:
+                sumidero.registrar_stream(clave, nombre, lambda: EventoReconocimiento(
+                    confianza, id_equipo=id_equipo, id_modelo=id_modelo_activo(), imagen=frame.copy()))
 
-        yield (b'--frame\r\n'
-            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            # Mostrar el resultado en la pantalla (sólo si el cliente no lo dibuja)
+            if nombre and overlay:
+                texto = f"{nombre} ({confianza*100:.1f}%)"
+                cv2.putText(frame, texto, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            marca = _marcar(etapas, 'publicacion', marca)
+
+            # Convertir a formato web
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+            frame_bytes = buffer.tobytes()
+            _marcar(etapas, 'codificacion', marca)
+
+            yield (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    finally:
+        planificador.cancelar_stream(clave)
 
 
 # Vista principal: permite mostrar resultados si existen
@@ -54,24 +189,234 @@ def index():
         if 'imagen' in request.files:
             imagen_file = request.files['imagen']
             if imagen_file.filename != '':
-                # Leer imagen en memoria
-                file_bytes = np.frombuffer(imagen_file.read(), np.uint8)
-                img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+                # Leer imagen con límite de tamaño y decodificarla ya reducida a 224x224
+                try:
+                    datos, img = leer_imagen(imagen_file.stream)
+                except ImagenInvalida as e:
+                    return render_template('reconocimiento.html', resultado=str(e), equipo_info=None), e.codigo
                 nombre, confianza = detectar_equipo(img)
+                id_modelo = id_modelo_activo()
                 if nombre:
                     resultado = f"{nombre} ({confianza*100:.1f}%)"
-                    # Buscar en inventario
+                    # Buscar en inventario: primero el equipo concreto por su foto de referencia
                     conn = get_db_connection()
                     cursor = conn.cursor(dictionary=True)
-                    cursor.execute("SELECT * FROM equipos WHERE nombre_equipo LIKE %s LIMIT 1", (f"%{nombre}%",))
-                    equipo_info = cursor.fetchone()
+                    coincidencias = indice_hash.buscar(img, limite=1)
+                    if not coincidencias:
+                        coincidencias = [(id_equipo, similitud) for id_equipo, similitud
+                                         in indice_embeddings.buscar(img, k=1)
+                                         if similitud >= SIMILITUD_MINIMA]
+                    if coincidencias:
+                        cursor.execute("SELECT * FROM equipos WHERE id_equipo = %s", (coincidencias[0][0],))
+                        equipo_info = cursor.fetchone()
+                    if not equipo_info:
+                        cursor.execute("SELECT * FROM equipos WHERE nombre_equipo LIKE %s LIMIT 1", (f"%{nombre}%",))
+                        equipo_info = cursor.fetchone()
                     cursor.close()
                     conn.close()
                 else:
                     resultado = "No se reconoció ningún equipo de laboratorio."
-    return render_template('reconocimiento.html', resultado=resultado, equipo_info=equipo_info)
+                # Guardar el reconocimiento (y la imagen) en segundo plano
+                sumidero.registrar(EventoReconocimiento(
+                    confianza,
+                    id_equipo=equipo_info['id_equipo'] if equipo_info else None,
+                    id_modelo=id_modelo,
+                    id_usuario=session.get('id_usuario'),
+                    datos_imagen=datos))
+    # ?overlay=cliente dibuja las detecciones recibidas por Socket.IO en lugar de en el video
+    return render_template('reconocimiento.html', resultado=resultado, equipo_info=equipo_info,
+                           overlay_cliente=request.args.get('overlay') == 'cliente')
+
+# 🔹 REGISTRAR FOTO DE REFERENCIA DE UN EQUIPO
+@recognition_bp.route('/api/referencias/<int:id_equipo>', methods=['POST'])
+def registrar_referencia(id_equipo):
+    imagen_file = request.files.get('imagen')
+    if imagen_file is None or imagen_file.filename == '':
+        return jsonify({"error": "Debe enviar una imagen"}), 400
+    try:
+        _, img = leer_imagen(imagen_file.stream)
+    except ImagenInvalida as e:
+        return jsonify({"error": str(e)}), e.codigo
+    valor = indice_hash.agregar_referencia(id_equipo, img)
+    if valor is None:
+        return jsonify({"error": f"No existe el equipo {id_equipo}"}), 404
+    # Guardar la foto para poder reconstruir los índices
+    directorio = os.path.join(DIRECTORIO_REFERENCIAS, str(id_equipo))
+    os.makedirs(directorio, exist_ok=True)
+    cv2.imwrite(os.path.join(directorio, f"{valor}.jpg"), img)
+    indice_embeddings.agregar_imagenes(id_equipo, [img])
+    return jsonify({"id_equipo": id_equipo, "imagen_hash": valor}), 201
+
+# 🔹 BUSCAR EQUIPOS CONCRETOS POR FOTO
+@recognition_bp.route('/api/buscar', methods=['POST'])
+def buscar_por_imagen():
+    imagen_file = request.files.get('imagen')
+    if imagen_file is None or imagen_file.filename == '':
+        return jsonify({"error": "Debe enviar una imagen"}), 400
+    try:
+        _, img = leer_imagen(imagen_file.stream)
+    except ImagenInvalida as e:
+        return jsonify({"error": str(e)}), e.codigo
+    if request.args.get('modo') == 'embeddings':
+        k = request.args.get('k', default=5, type=int)
+        coincidencias = indice_embeddings.buscar(img, k=k)
+        return jsonify({"coincidencias": [
+            {"id_equipo": id_equipo, "similitud": similitud} for id_equipo, similitud in coincidencias
+        ]})
+    radio = request.args.get('radio', default=10, type=int)
+    coincidencias = indice_hash.buscar(img, radio=radio)
+    return jsonify({"coincidencias": [
+        {"id_equipo": id_equipo, "distancia": distancia} for id_equipo, distancia in coincidencias
+    ]})
+
+# 🔹 CLASIFICAR POR CATEGORÍA (TOP-K)
+@recognition_bp.route('/api/categorias', methods=['POST'])
+def clasificar_por_categoria():
+    imagen_file = request.files.get('imagen')
+    if imagen_file is None or imagen_file.filename == '':
+        return jsonify({"error": "Debe enviar una imagen"}), 400
+    try:
+        _, img = leer_imagen(imagen_file.stream)
+    except ImagenInvalida as e:
+        return jsonify({"error": str(e)}), e.codigo
+    k = request.args.get('k', default=3, type=int)
+    return jsonify({"categorias": clasificar_categorias(img, top_k=k)})
+
+# 🔹 ESTADO DEL MODELO ACTIVO
+@recognition_bp.route('/api/modelo', methods=['GET'])
+def estado_modelo():
+    if cliente.disponible():
+        try:
+            return jsonify(cliente.estado()['registro'])
+        except ErrorInferencia:
+            pass
+    return jsonify(registro.estado())
+
+# 🔹 FORZAR REVISIÓN DE modelos_ia (tras activar una versión nueva)
+@recognition_bp.route('/api/modelo/recargar', methods=['POST'])
+def recargar_modelo():
+    if cliente.disponible():
+        try:
+            cambiado = cliente.recargar()['cambiado']
+            return jsonify({"cambiado": cambiado, **cliente.estado()['registro']})
+        except ErrorInferencia:
+            pass
+    cambiado = registro.revisar()
+    return jsonify({"cambiado": cambiado, **registro.estado()})
+
+# 🔹 DETECTAR VARIOS EQUIPOS CON SUS CAJAS
+@recognition_bp.route('/api/detectar', methods=['POST'])
+def detectar_regiones():
+    imagen_file = request.files.get('imagen')
+    if imagen_file is None or imagen_file.filename == '':
+        return jsonify({"error": "Debe enviar una imagen"}), 400
+    try:
+        # Para localizar cajas se conserva más resolución que para clasificar
+        datos, img = leer_imagen(imagen_file.stream, tamano=(640, 640), conservar_aspecto=True)
+    except ImagenInvalida as e:
+        return jsonify({"error": str(e)}), e.codigo
+    propuestas = request.args.get('propuestas', 'rejilla')
+    modo_modelo = request.args.get('modelo', 'binario')
+    if propuestas not in PROPUESTAS or modo_modelo not in MODOS_MODELO:
+        return jsonify({"error": f"propuestas debe ser una de {list(PROPUESTAS)} "
+                                 f"y modelo uno de {list(MODOS_MODELO)}"}), 400
+    # Un detector por combinación, compartido entre peticiones, para conservar
+    # el costo por recorte medido y respetar presupuesto_ms desde la segunda
+    detector = detector_para(propuestas, modo_modelo)
+    inicio = time.perf_counter()
+    detecciones = detector.detectar(img, request.args.get('presupuesto_ms', PRESUPUESTO_MS, type=float))
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+    if detecciones:
+        sumidero.registrar(EventoReconocimiento(
+            detecciones[0]['confianza'], coordenadas=detecciones,
+            id_modelo=id_modelo_activo(),
+            id_usuario=session.get('id_usuario'), datos_imagen=datos))
+    return jsonify({"detecciones": detecciones, "ancho": img.shape[1], "alto": img.shape[0],
+                    "latencia_ms": latencia_ms})
+
+# 🔹 MÉTRICAS DE LA COMPUERTA DE MOVIMIENTO (frames omitidos, CPU ahorrada)
+@recognition_bp.route('/api/movimiento', methods=['GET'])
+def estado_movimiento():
+    return jsonify(estadisticas_compuertas())
+
+# 🔹 MÉTRICAS DEL SEGUIMIENTO (keyframes con CNN frente a frames propagados)
+@recognition_bp.route('/api/seguimiento', methods=['GET'])
+def estado_seguimiento():
+    return jsonify(estadisticas_seguidores())
+
+# 🔹 ESTADO DEL PLANIFICADOR (lotes entre cámaras, FPS efectivos, escala)
+@recognition_bp.route('/api/planificador', methods=['GET'])
+def estado_planificador():
+    return jsonify(planificador.estadisticas())
+
+# 🔹 MÉTRICAS DE LA CASCADA (tasa de escalado al modelo completo, latencias)
+@recognition_bp.route('/api/cascada', methods=['GET'])
+def estado_cascada():
+    return jsonify(cascada.estadisticas())
+
+# 🔹 REPARTO DE CPU DEL PROCESO (hilos de TensorFlow/OpenCV, núcleos)
+@recognition_bp.route('/api/recursos', methods=['GET'])
+def estado_recursos():
+    return jsonify(gobernador.estado())
+
+# 🔹 RECONOCER UN VIDEO GRABADO (recorrido de inventario) EN SEGUNDO PLANO
+@recognition_bp.route('/api/video', methods=['POST'])
+def reconocer_video():
+    video_file = request.files.get('video')
+    if video_file is None or video_file.filename == '':
+        return jsonify({"error": "Debe enviar un video"}), 400
+    extension = os.path.splitext(video_file.filename)[1].lower() or '.mp4'
+    try:
+        ruta = guardar_temporal(video_file.stream, sufijo=extension)
+    except VideoInvalido as e:
+        return jsonify({"error": str(e)}), e.codigo
+    id_trabajo = trabajos_video.encolar(
+        ruta, id_laboratorio=request.args.get('laboratorio', type=int),
+        muestreo=request.args.get('muestreo', MUESTREO_SEGUNDOS, type=float),
+        umbral_escena=request.args.get('umbral_escena', UMBRAL_ESCENA, type=float))
+    return jsonify({"id_trabajo": id_trabajo,
+                    "estado_url": url_for('recognition.estado_video', id_trabajo=id_trabajo)}), 202
+
+@recognition_bp.route('/api/video/<id_trabajo>', methods=['GET'])
+def estado_video(id_trabajo):
+    trabajo = trabajos_video.consultar(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(trabajo)
+
+# 🔹 COLA DE REVISIÓN: RECONOCIMIENTOS PENDIENTES MÁS INCIERTOS PRIMERO
+@recognition_bp.route('/api/revision', methods=['GET'])
+def revision_pendiente():
+    limite = min(request.args.get('limite', default=20, type=int), 200)
+    return jsonify({"pendientes": cola_revision(limite, id_modelo=request.args.get('modelo', type=int))})
+
+@recognition_bp.route('/api/revision/<int:id_reconocimiento>', methods=['POST'])
+def validar_reconocimiento(id_reconocimiento):
+    datos = request.get_json(silent=True) or request.form
+    validacion = datos.get('validacion')
+    if validacion not in VALIDACIONES:
+        return jsonify({"error": "validacion debe ser 'correcto' o 'incorrecto'"}), 400
+    if not registrar_validacion(id_reconocimiento, validacion):
+        return jsonify({"error": "Reconocimiento no encontrado"}), 404
+    return jsonify({"id_reconocimiento": id_reconocimiento, "validacion_manual": validacion})
 
 @recognition_bp.route('/video')
 def video_feed():
-    return Response(generar_frames(),
+    # ?overlay=0 sirve el video sin texto; las detecciones llegan por Socket.IO
+    # (la página lo pide así sólo con ?overlay=cliente)
+    id_laboratorio = request.args.get('laboratorio', 1, type=int)
+    camara = request.args.get('camara', 0, type=int)
+    sala = nombre_sala(id_laboratorio, camara)
+    overlay = request.args.get('overlay', '1') != '0'
+    calidad = min(95, max(30, request.args.get('calidad', 80, type=int)))
+    modo = 'regiones' if request.args.get('modo') == 'regiones' else 'frame'
+    compuerta = request.args.get('compuerta', '1') != '0'
+    seguimiento = request.args.get('seguimiento', '1') != '0'
+    # Presupuesto de inferencias por segundo y prioridad frente a otras cámaras
+    fps = max(0.1, request.args.get('fps', FPS_POR_DEFECTO, type=float))
+    prioridad = max(1, request.args.get('prioridad', 1, type=int))
+    # La fuente (webcam, archivo, RTSP...) se configura por laboratorio
+    fuente = obtener_fuente(id_laboratorio, camara)
+    return Response(generar_frames(fuente, sala, overlay, calidad, modo, compuerta, seguimiento,
+                                   fps=fps, prioridad=prioridad),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
\ No newline at end of file
@@ -0,0 +1,73 @@
+from flask_socketio import join_room, leave_room, emit
+from extensiones import socketio
+import threading
+import time
+
+# Las detecciones del video en vivo se publican por Socket.IO en el namespace
+# /reconocimiento, en una sala por laboratorio y cámara. El navegador dibuja
+# el resultado sobre el video, así el servidor no tiene que pintarlo en cada
+# frame.
+NAMESPACE = '/reconocimiento'
+INTERVALO_REPETICION = 1.0   # reenviar la misma detección como mucho cada segundo
+CAMBIO_CONFIANZA = 0.05
+
+_ultimos = {}
+_ultimos_lock = threading.Lock()
+
+
+def nombre_sala(id_laboratorio, camara):
+    return f"lab-{id_laboratorio}-cam-{camara}"
+
+
+def publicar_deteccion(sala, etiqueta, confianza=None, caja=None, id_equipo=None, tamano_frame=None):
+    """
+    Enviar una detección a los clientes de la sala. Sólo se emite si cambió
+    la etiqueta, la confianza se movió lo suficiente o pasó INTERVALO_REPETICION.
+    """
+    ahora = time.monotonic()
+    confianza = float(confianza) if confianza is not None else None
+    with _ultimos_lock:
+        anterior = _ultimos.get(sala)
+        if anterior is not None:
+            misma = anterior['etiqueta'] == etiqueta and anterior['caja'] == caja
+            cerca = (confianza is None or anterior['confianza'] is None
+                     or abs(anterior['confianza'] - confianza) < CAMBIO_CONFIANZA)
+            if misma and cerca and ahora - anterior['momento'] < INTERVALO_REPETICION:
+                return False
+        _ultimos[sala] = {'etiqueta': etiqueta, 'confianza': confianza, 'caja': caja, 'momento': ahora}
+    socketio.emit('deteccion', {
+        'sala': sala,
+        'etiqueta': etiqueta,
+        'confianza': confianza,
+        'caja': caja,
+        'id_equipo': id_equipo,
+        'ancho': tamano_frame[0] if tamano_frame else None,
+        'alto': tamano_frame[1] if tamano_frame else None,
+        'momento': time.time(),
+    }, to=sala, namespace=NAMESPACE)
+    return True
+
+
+def publicar_detecciones(sala, detecciones, tamano_frame=None):
+    """
+    Enviar todas las cajas detectadas en un frame (modo por regiones).
+    """
+    socketio.emit('detecciones', {
+        'sala': sala,
+        'detecciones': detecciones,
+        'ancho': tamano_frame[0] if tamano_frame else None,
+        'alto': tamano_frame[1] if tamano_frame else None,
+        'momento': time.time(),
+    }, to=sala, namespace=NAMESPACE)
+
+
+@socketio.on('suscribir', namespace=NAMESPACE)
+def suscribir(datos):
+    sala = nombre_sala(datos.get('laboratorio', 1), datos.get('camara', 0))
+    join_room(sala)
+    emit('suscrito', {'sala': sala})
+
+
+@socketio.on('cancelar', namespace=NAMESPACE)
+def cancelar(datos):
+    leave_room(nombre_sala(datos.get('laboratorio', 1), datos.get('camara', 0)))
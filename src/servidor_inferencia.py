@@ -0,0 +1,122 @@
+# Servidor de inferencia local: carga el modelo activo una sola vez y atiende
+# a todos los workers web por un socket Unix o TCP local, juntando las
+# peticiones concurrentes en micro-lotes (ver models/cliente_inferencia.py).
+#
+#   python servidor_inferencia.py                                   # unix:/tmp/gil_inferencia.sock
+#   python servidor_inferencia.py --direccion tcp:127.0.0.1:8765 --max-lote 32 --espera-ms 5
+#
+# Los workers lo usan con GIL_INFERENCIA_DIRECCION=<la misma dirección>.
+import argparse
+import os
+import signal
+import socketserver
+import sys
+
+from models.cliente_inferencia import (enviar_mensaje, recibir_mensaje, arreglo_a_mensaje,
+                                       mensaje_a_arreglo, predecir_en_proceso)
+from models.planificador_inferencia import PlanificadorInferencia
+from models.recursos_cpu import gobernador
+from models.registro_modelos import registro
+
+DIRECCION_POR_DEFECTO = os.getenv('GIL_INFERENCIA_DIRECCION', 'unix:/tmp/gil_inferencia.sock')
+
+
+class ManejadorInferencia(socketserver.BaseRequestHandler):
+    """
+    Atiende una conexión persistente de un worker: un mensaje, una respuesta.
+    """
+
+    def handle(self):
+        planificador = self.server.planificador
+        clave = f"conexion-{id(self)}"
+        while True:
+            try:
+                cabecera, datos = recibir_mensaje(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                respuesta, salida = self.atender(planificador, clave, cabecera, datos)
+            except Exception as e:
+                respuesta, salida = {'ok': False, 'error': str(e)}, b''
+            estado = registro.estado()
+            respuesta.update(id_modelo=estado['id_modelo'], version=estado['version'])
+            try:
+                enviar_mensaje(self.request, respuesta, salida)
+            except OSError:
+                return
+
+    def atender(self, planificador, clave, cabecera, datos):
+        operacion = cabecera.get('op')
+        if operacion == 'predecir':
+            prediccion = planificador.predecir(clave, mensaje_a_arreglo(cabecera, datos))
+            meta, salida = arreglo_a_mensaje(prediccion)
+            return {'ok': True, **meta}, salida
+        if operacion == 'estado':
+            with registro.usar() as activo:
+                tamano = activo.tamano_entrada
+            return {'ok': True, 'tamano_entrada': list(tamano), 'registro': registro.estado(),
+                    'planificador': planificador.estadisticas()}, b''
+        if operacion == 'recargar':
+            return {'ok': True, 'cambiado': registro.revisar()}, b''
+        return {'ok': False, 'error': f"Operación desconocida: {operacion}"}, b''
+
+
+class ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ServidorTCP(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def crear_servidor(direccion, planificador):
+    tipo, _, destino = direccion.partition(':')
+    if tipo == 'unix':
+        if os.path.exists(destino):
+            os.unlink(destino)
+        servidor = ServidorUnix(destino, ManejadorInferencia)
+    elif tipo == 'tcp':
+        host, _, puerto = destino.rpartition(':')
+        servidor = ServidorTCP((host or '127.0.0.1', int(puerto)), ManejadorInferencia)
+    else:
+        raise ValueError(f"Dirección no válida: {direccion}")
+    servidor.planificador = planificador
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de inferencia con micro-lotes")
+    parser.add_argument('--direccion', default=DIRECCION_POR_DEFECTO,
+                        help="unix:/ruta.sock o tcp:host:puerto")
+    parser.add_argument('--max-lote', type=int, default=32, help="Máximo de imágenes por lote")
+    parser.add_argument('--espera-ms', type=float, default=5.0,
+                        help="Espera máxima para juntar peticiones en un lote")
+    parser.add_argument('--trabajadores', type=int, default=1, help="Hilos que llaman al modelo")
+    args = parser.parse_args()
+
+    # Hilos y núcleos del rol 'inferencia' antes de cargar TensorFlow
+    reparto = gobernador.aplicar('inferencia')
+    # Cargar y calentar el modelo antes de aceptar conexiones
+    registro.iniciar()
+    planificador = PlanificadorInferencia(trabajadores=args.trabajadores, max_lote=args.max_lote,
+                                          ventana=args.espera_ms / 1000, predecir=predecir_en_proceso)
+    servidor = crear_servidor(args.direccion, planificador)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"✅ Servidor de inferencia en {args.direccion} (modelo {registro.estado()['version']}, "
+          f"TF {reparto['hilos_tf_intra']}/{reparto['hilos_tf_inter']} hilos, núcleos {reparto['nucleos'] or 'todos'})")
+    try:
+        servidor.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        servidor.server_close()
+        planificador.detener()
+        registro.detener()
+        if args.direccion.startswith('unix:') and os.path.exists(args.direccion[5:]):
+            os.unlink(args.direccion[5:])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# Servidor web de producción: N workers x M hilos sobre waitress (o el
+# servidor de werkzeug si waitress no está instalado). El proceso maestro
+# importa los módulos pesados (Flask, OpenCV, NumPy, todo models/ y routes/),
+# construye la aplicación con create_app() y compila las plantillas una sola
+# vez; luego congela el heap con gc.freeze() y hace fork de N workers que
+# comparten esas páginas copy-on-write en lugar de tener cada uno su copia.
+# Cada worker ejecuta los ganchos de inicio de app.py después del fork y los
+# de apagado al recibir SIGTERM. Con gunicorn, ver gunicorn.conf.py.
+#
+#   python servidor_prefork.py --hilos 8 --puerto 5000
+#   python servidor_prefork.py --workers 4 --servidor-inferencia --reporte-memoria 30
+#
+# Por defecto hay un solo worker, porque Socket.IO no funciona repartido entre
+# workers sin afinidad de sesión (ver comprobar_workers en app.py). Para usar
+# más, Socket.IO se sirve en otra instancia de un worker y el proxy le envía
+# /socket.io/; si no está configurado así, el servidor se niega a arrancar:
+#
+#   GIL_SOCKETIO_COLA=redis://localhost:6379 python servidor_prefork.py --workers 1 --puerto 5001
+#   GIL_SOCKETIO_COLA=redis://localhost:6379 GIL_SOCKETIO_EXTERNO=true \
+#       python servidor_prefork.py --workers 4 --puerto 5000
+#
+# waitress no soporta websockets: con él Socket.IO usa long-polling.
+#
+# TensorFlow no es seguro después de un fork (por eso los pools de
+# models/reevaluacion.py usan spawn), así que el maestro nunca carga el
+# modelo. Con --servidor-inferencia lanza servidor_inferencia.py y los
+# workers lo usan por GIL_INFERENCIA_DIRECCION: el modelo queda en memoria una
+# sola vez para todos. Sin él, cada worker carga su modelo en la primera
+# petición que lo necesite.
+#
+# Lo que es de cada worker se crea después del fork: las conexiones a MySQL
+# se abren por petición y las cámaras en el primer /video que las pide
+# (models/fuentes_video.obtener_fuente). El maestro no debe tocar ninguna.
+#
+# kill -USR1 <pid del maestro> imprime el uso de memoria (RSS, PSS y parte
+# compartida) de cada proceso y el ahorro por worker.
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import traceback
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRECCION_INFERENCIA = 'unix:/tmp/gil_inferencia.sock'
+
+
+def leer_memoria(pid):
+    """
+    {'rss', 'pss', 'compartida', 'privada'} en MB según /proc/<pid>/smaps_rollup
+    (Linux 4.14+), o None si no se puede leer.
+    """
+    campos = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as f:
+            for linea in f:
+                partes = linea.split()
+                if len(partes) >= 2 and partes[0].endswith(':') and partes[1].isdigit():
+                    campos[partes[0][:-1]] = int(partes[1]) / 1024
+    except OSError:
+        return None
+    return {
+        'rss': campos.get('Rss', 0.0),
+        'pss': campos.get('Pss', 0.0),
+        'compartida': campos.get('Shared_Clean', 0.0) + campos.get('Shared_Dirty', 0.0),
+        'privada': campos.get('Private_Clean', 0.0) + campos.get('Private_Dirty', 0.0),
+    }
+
+
+def reporte_memoria(procesos):
+    """
+    Imprimir la memoria de cada proceso (nombre -> pid) y el ahorro frente a
+    que cada worker tuviera su propia copia (suma de RSS menos suma de PSS).
+    """
+    filas = {nombre: leer_memoria(pid) for nombre, pid in procesos.items()}
+    filas = {nombre: fila for nombre, fila in filas.items() if fila is not None}
+    if not filas:
+        print("⚠ No se puede leer /proc/<pid>/smaps_rollup en este sistema")
+        return None
+    print(f"{'proceso':<20} {'RSS MB':>8} {'PSS MB':>8} {'compartida':>11} {'privada':>8}")
+    for nombre, fila in filas.items():
+        print(f"{nombre:<20} {fila['rss']:8.1f} {fila['pss']:8.1f} {fila['compartida']:11.1f} "
+              f"{fila['privada']:8.1f}")
+    workers = [fila for nombre, fila in filas.items() if nombre.startswith('worker')]
+    total_rss = sum(f['rss'] for f in filas.values())
+    total_pss = sum(f['pss'] for f in filas.values())
+    print(f"Total: {total_rss:.1f} MB sumando RSS, {total_pss:.1f} MB reales (PSS)")
+    if workers:
+        ahorro = sum(f['rss'] - f['pss'] for f in workers) / len(workers)
+        print(f"Ahorro por worker: {ahorro:.1f} MB compartidos copy-on-write")
+    return filas
+
+
+def iniciar_servidor_inferencia(direccion, espera=120):
+    """
+    Lanzar servidor_inferencia.py y esperar a que responda.
+    """
+    from models.cliente_inferencia import ClienteInferencia, ErrorInferencia
+
+    proceso = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'servidor_inferencia.py'),
+                                '--direccion', direccion], cwd=BASE_DIR)
+    cliente = ClienteInferencia(direccion, timeout=5.0)
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"servidor_inferencia.py terminó con código {proceso.returncode}")
+        try:
+            cliente.estado()
+            return proceso
+        except ErrorInferencia:
+            cliente.fallo_hasta = 0.0
+            time.sleep(0.5)
+    proceso.terminate()
+    raise RuntimeError(f"El servidor de inferencia no respondió en {espera} s")
+
+
+def precargar(config=None):
+    """
+    Importar y construir todo lo compartible antes del fork.
+    """
+    # Sin recolecciones hasta congelar: no mover objetos entre generaciones
+    gc.disable()
+    from app import create_app
+    from jinja2 import TemplateError
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+
+    app = create_app(config)
+    for nombre in app.jinja_env.list_templates():
+        if nombre.endswith('.html'):
+            try:
+                app.jinja_env.get_template(nombre)
+            except TemplateError as e:
+                # Una plantilla rota solo falla en su ruta, no en el arranque
+                print(f"⚠ No se pudo precompilar la plantilla {nombre}: {e}")
+    # Dejar fuera de la recolección todo lo creado hasta aquí, para que los
+    # workers no escriban en esas páginas al recorrerlas
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def despues_de_fork():
+    """
+    Estado propio de cada worker.
+    """
+    import numpy as np
+    random.seed()
+    np.random.seed()
+    gc.enable()
+
+
+def servir(app, sock, motor, hilos):
+    """
+    Atender peticiones en el socket compartido hasta SIGTERM.
+    """
+    if motor == 'waitress':
+        from waitress import serve
+        serve(app, sockets=[sock], threads=hilos, ident='gil')
+        return
+    from werkzeug.serving import make_server
+    # El servidor de werkzeug crea un hilo por petición; --hilos no aplica
+    host, puerto = sock.getsockname()[:2]
+    servidor = make_server(host, puerto, app, threaded=True, fd=sock.fileno())
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.server_close()
+
+
+def trabajar(app, sock, motor, hilos):
+    from app import iniciar_worker, apagar
+
+    despues_de_fork()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    iniciar_worker(app)
+    try:
+        servir(app, sock, motor, hilos)
+    except SystemExit:
+        pass
+    finally:
+        apagar(app)
+    os._exit(0)
+
+
+def crear_worker(app, sock, motor, hilos):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            trabajar(app, sock, motor, hilos)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(1)
+    return pid
+
+
+def motor_por_defecto():
+    try:
+        import waitress  # noqa: F401
+        return 'waitress'
+    except ImportError:
+        return 'werkzeug'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor web pre-fork con memoria compartida copy-on-write")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Más de uno requiere GIL_SOCKETIO_EXTERNO y GIL_SOCKETIO_COLA")
+    parser.add_argument('--hilos', type=int, default=8, help="Hilos por worker (con waitress)")
+    parser.add_argument('--motor', choices=('waitress', 'werkzeug'), default=motor_por_defecto(),
+                        help="Servidor WSGI de cada worker")
+    parser.add_argument('--servidor-inferencia', action='store_true',
+                        help="Lanzar servidor_inferencia.py y compartir un solo modelo")
+    parser.add_argument('--direccion-inferencia', default=os.getenv('GIL_INFERENCIA_DIRECCION', DIRECCION_INFERENCIA))
+    parser.add_argument('--reporte-memoria', type=float, default=0,
+                        help="Segundos tras el arranque para imprimir el reporte de memoria (0 = no)")
+    args = parser.parse_args()
+
+    from app import comprobar_workers
+    try:
+        comprobar_workers(args.workers)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    inferencia = None
+    if args.servidor_inferencia:
+        # Antes de importar la aplicación: cliente_inferencia lee la dirección al importarse
+        os.environ['GIL_INFERENCIA_DIRECCION'] = args.direccion_inferencia
+        inferencia = iniciar_servidor_inferencia(args.direccion_inferencia)
+
+    app = precargar()
+    sock = socket.create_server((args.host, args.puerto), backlog=128)
+    sock.set_inheritable(True)
+
+    workers = {}
+    for indice in range(args.workers):
+        workers[crear_worker(app, sock, args.motor, args.hilos)] = indice
+    print(f"✅ {args.workers} workers {args.motor} en http://{args.host}:{args.puerto} (maestro {os.getpid()})")
+
+    estado = {'terminar': False, 'reporte': False}
+    signal.signal(signal.SIGTERM, lambda *_: estado.update(terminar=True))
+    signal.signal(signal.SIGINT, lambda *_: estado.update(terminar=True))
+    signal.signal(signal.SIGUSR1, lambda *_: estado.update(reporte=True))
+    reporte_en = time.monotonic() + args.reporte_memoria if args.reporte_memoria else None
+
+    def procesos():
+        nombres = {'maestro': os.getpid()}
+        if inferencia is not None:
+            nombres['inferencia'] = inferencia.pid
+        nombres.update({f"worker-{indice}": pid for pid, indice in sorted(workers.items(), key=lambda w: w[1])})
+        return nombres
+
+    try:
+        while not estado['terminar']:
+            try:
+                pid, codigo = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid in workers:
+                indice = workers.pop(pid)
+                print(f"⚠ worker-{indice} terminó ({codigo}); se reemplaza")
+                workers[crear_worker(app, sock, args.motor, args.hilos)] = indice
+            elif inferencia is not None and pid == inferencia.pid:
+                print("⚠ El servidor de inferencia terminó; los workers usarán el modelo en proceso")
+                inferencia = None
+            if estado['reporte'] or (reporte_en is not None and time.monotonic() >= reporte_en):
+                estado['reporte'], reporte_en = False, None
+                reporte_memoria(procesos())
+            time.sleep(0.5)
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        limite = time.monotonic() + 10
+        while workers and time.monotonic() < limite:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            workers.pop(pid, None)
+            time.sleep(0.1)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if inferencia is not None:
+            inferencia.terminate()
+            inferencia.wait(10)
+        sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
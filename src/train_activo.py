@@ -0,0 +1,166 @@
+# Ronda de aprendizaje activo: ajuste fino incremental de la cabeza con los
+# reconocimientos validados a mano (models/aprendizaje_activo.py).
+#
+# En lugar de reentrenar desde cero, se parte de la cabeza guardada por
+# train_cabeza.py y se ajusta unas pocas épocas con las muestras cosechadas
+# (los 'incorrecto', errores del modelo, pesan más) mezcladas con una
+# repetición del dataset base para no olvidar lo aprendido. Las
+# características del backbone salen de la caché, así que sólo se calculan
+# las de las imágenes nuevas.
+#
+# La cabeza actual y la ajustada se comparan sobre una reserva fija (la
+# validación del dataset base más ~20% de las muestras cosechadas). Si la
+# ajustada mejora, se guarda, se monta el modelo completo y se registra (y
+# activa) en modelos_ia.
+#
+#   python train_activo.py
+#   python train_activo.py --revision 20          # sólo mostrar la cola de revisión
+#   python train_activo.py --mejora-minima 0.005 --sin-activar
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+from tensorflow.keras.models import clone_model, load_model  # type: ignore
+from tensorflow.keras.optimizers import Adam  # type: ignore
+
+from models.aprendizaje_activo import cosechar, cola_revision, en_reserva
+from models.cache_caracteristicas import CacheCaracteristicas
+from models.dataset_compilado import compilar, cargar as cargar_compilado
+from models.registro_modelos import registrar_modelo, UMBRAL
+from train_cabeza import (train_dir, cabeza_salida, modelo_salida, CLASE_POSITIVA, dividir_por_hash,
+                          componer_modelo)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+modelos_dir = os.path.join(BASE_DIR, 'models')
+
+PESO_ERRORES = 2.0
+
+
+def precision(cabeza, X, y):
+    if len(X) == 0:
+        return None
+    return float(((np.ravel(cabeza.predict(X, verbose=0)) > UMBRAL) == (y > 0.5)).mean())
+
+
+def caracteristicas_base(cache, variantes):
+    """
+    (X_train, y_train, X_val, y_val) del dataset base, con la misma
+    división por hash que train_cabeza.py.
+    """
+    compilar(train_dir)
+    dataset = cargar_compilado(train_dir)
+    etiquetas = (dataset.etiquetas == dataset.clases.index(CLASE_POSITIVA)).astype(np.float32)
+    hashes = cache.actualizar_compilado(dataset, variantes=variantes)
+    validacion = dividir_por_hash(hashes)
+    en_validacion = np.array([h in validacion for h in hashes])
+    X_train, pos_train = cache.obtener([h if not en_validacion[i] else None for i, h in enumerate(hashes)],
+                                       variantes=variantes)
+    X_val, pos_val = cache.obtener([h if en_validacion[i] else None for i, h in enumerate(hashes)], variantes=1)
+    return X_train, etiquetas[pos_train], X_val, etiquetas[pos_val]
+
+
+def caracteristicas_cosechadas(cache, muestras, variantes):
+    """
+    (X_train, y_train, pesos_train, X_reserva, y_reserva) de las muestras validadas.
+    """
+    hashes = cache.actualizar([m['ruta'] for m in muestras], variantes=variantes)
+    etiquetas = np.array([m['etiqueta'] for m in muestras], dtype=np.float32)
+    pesos = np.array([PESO_ERRORES if m['validacion_manual'] == 'incorrecto' else 1.0 for m in muestras],
+                     dtype=np.float32)
+    reserva = np.array([en_reserva(m['id_reconocimiento']) for m in muestras], dtype=bool)
+    X_train, pos_train = cache.obtener([h if not reserva[i] else None for i, h in enumerate(hashes)],
+                                       variantes=variantes)
+    X_res, pos_res = cache.obtener([h if reserva[i] else None for i, h in enumerate(hashes)], variantes=1)
+    return X_train, etiquetas[pos_train], pesos[pos_train], X_res, etiquetas[pos_res]
+
+
+def mostrar_revision(limite):
+    pendientes = cola_revision(limite)
+    print(f"Cola de revisión ({len(pendientes)} más inciertos):")
+    for fila in pendientes:
+        print(f"  #{fila['id_reconocimiento']}  confianza {fila['confianza_deteccion']:.2f}  "
+              f"{fila['imagen_original_url']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajuste fino de la cabeza con reconocimientos validados")
+    parser.add_argument('--variantes', type=int, default=2, help="Variantes de aumento por imagen (1-5)")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--tasa', type=float, default=1e-4, help="Tasa de aprendizaje del ajuste fino")
+    parser.add_argument('--repeticion', type=float, default=1.0,
+                        help="Ejemplos del dataset base por cada ejemplo cosechado")
+    parser.add_argument('--mejora-minima', type=float, default=0.0,
+                        help="Mejora de precisión en la reserva necesaria para registrar")
+    parser.add_argument('--sin-activar', action='store_true', help="Registrar la versión como inactiva")
+    parser.add_argument('--revision', type=int, default=None, help="Sólo mostrar la cola de revisión")
+    args = parser.parse_args()
+
+    if args.revision:
+        mostrar_revision(args.revision)
+        return 0
+    if not os.path.exists(cabeza_salida):
+        print(f"⚠ No existe {cabeza_salida}; entrene primero con train_cabeza.py")
+        return 1
+
+    muestras = cosechar()
+    errores = sum(m['validacion_manual'] == 'incorrecto' for m in muestras)
+    print(f"Muestras validadas: {len(muestras)} ({errores} errores del modelo)")
+    if not muestras:
+        return 0
+
+    cache = CacheCaracteristicas()
+    Xb_train, yb_train, Xb_val, yb_val = caracteristicas_base(cache, args.variantes)
+    Xc_train, yc_train, pc_train, Xc_res, yc_res = caracteristicas_cosechadas(cache, muestras, args.variantes)
+    if len(Xc_train) == 0:
+        print("⚠ Todas las muestras cosechadas quedaron en la reserva; se necesitan más validaciones")
+        return 0
+
+    # Repetición del dataset base para no olvidar lo aprendido
+    rng = np.random.default_rng(42)
+    cantidad = min(len(Xb_train), int(len(Xc_train) * args.repeticion))
+    elegidos = rng.choice(len(Xb_train), size=cantidad, replace=False) if cantidad else np.array([], np.int64)
+    X = np.concatenate([Xc_train, Xb_train[elegidos]])
+    y = np.concatenate([yc_train, yb_train[elegidos]])
+    pesos = np.concatenate([pc_train, np.ones(cantidad, dtype=np.float32)])
+
+    X_res = np.concatenate([Xb_val, Xc_res])
+    y_res = np.concatenate([yb_val, yc_res])
+
+    actual = load_model(cabeza_salida)
+    ajustada = clone_model(actual)
+    ajustada.set_weights(actual.get_weights())
+    ajustada.compile(optimizer=Adam(learning_rate=args.tasa), loss='binary_crossentropy', metrics=['accuracy'])
+    ajustada.fit(X, y, sample_weight=pesos, epochs=args.epochs, batch_size=32, shuffle=True, verbose=2)
+
+    antes, despues = precision(actual, X_res, y_res), precision(ajustada, X_res, y_res)
+    antes_cosecha, despues_cosecha = precision(actual, Xc_res, yc_res), precision(ajustada, Xc_res, yc_res)
+    print(f"Reserva ({len(X_res)} ejemplos, {len(Xc_res)} cosechados): "
+          f"precisión {antes:.3f} -> {despues:.3f}")
+    if antes_cosecha is not None:
+        print(f"  sólo cosechados: {antes_cosecha:.3f} -> {despues_cosecha:.3f}")
+
+    if despues <= antes + args.mejora_minima:
+        print("Sin mejora suficiente; no se registra una versión nueva")
+        return 0
+
+    version = datetime.datetime.now().strftime('al-%Y%m%d-%H%M')
+    ajustada.save(cabeza_salida)
+    nombre_archivo = f"microscopio_{version}.h5"
+    modelo = componer_modelo(ajustada)
+    modelo.save(os.path.join(modelos_dir, nombre_archivo))
+    modelo.save(modelo_salida)
+    id_modelo = registrar_modelo(
+        'microscopio_activo', version, nombre_archivo, precision=round(despues, 4),
+        parametros={'tipo': 'aprendizaje_activo', 'muestras_validadas': len(muestras), 'errores': errores,
+                    'ejemplos_ajuste': len(X), 'epochs': args.epochs, 'tasa': args.tasa,
+                    'precision_anterior': antes, 'reserva': len(X_res)},
+        fecha_entrenamiento=datetime.date.today(), activar=not args.sin_activar)
+    print(f"✅ Versión {version} registrada en modelos_ia (id {id_modelo}"
+          f"{'' if args.sin_activar else ', activa'})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
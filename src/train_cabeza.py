@@ -0,0 +1,126 @@
+# Entrenamiento rápido de la cabeza clasificadora sobre características cacheadas.
+#
+# A diferencia de train_microscopio.py, el backbone congelado (MobileNetV2) se
+# ejecuta una sola vez por imagen y variante de aumento; sus salidas quedan en
+# data/cache y se reutilizan entre ejecuciones. Al agregar imágenes a
+# data/entrenamiento sólo se calculan las nuevas.
+import argparse
+import os
+import random
+
+import numpy as np
+from tensorflow.keras.models import Model, Sequential, load_model  # type: ignore
+from tensorflow.keras.layers import Dense, Dropout, Input  # type: ignore
+from tensorflow.keras.optimizers import Adam  # type: ignore
+
+from models.cache_caracteristicas import CacheCaracteristicas, obtener_backbone, DIMENSION, VARIANTES
+from models.dataset_compilado import compilar, cargar as cargar_compilado
+
+# Rutas
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+train_dir = os.path.join(BASE_DIR, '..', 'data', 'entrenamiento')
+cabeza_salida = os.path.join(BASE_DIR, 'models', 'microscopio_cabeza.h5')
+modelo_salida = os.path.join(BASE_DIR, 'models', 'microscopio_model.h5')
+
+CLASE_POSITIVA = 'microscopio'
+EXTENSIONES = ('.jpg', '.jpeg', '.png')
+
+
+def listar_dataset():
+    """
+    Devolver (rutas, etiquetas) con etiqueta 1 para la clase positiva.
+    """
+    rutas, etiquetas = [], []
+    for clase in sorted(os.listdir(train_dir)):
+        carpeta = os.path.join(train_dir, clase)
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            if nombre.lower().endswith(EXTENSIONES):
+                rutas.append(os.path.join(carpeta, nombre))
+                etiquetas.append(1 if clase == CLASE_POSITIVA else 0)
+    return rutas, np.array(etiquetas, dtype=np.float32)
+
+
+def dividir_por_hash(hashes, proporcion=0.2, semilla=42):
+    """
+    Separar validación por contenido, no por archivo, para que las variantes
+    de una misma imagen nunca queden a ambos lados.
+    """
+    unicos = sorted({h for h in hashes if h is not None})
+    random.Random(semilla).shuffle(unicos)
+    validacion = set(unicos[:max(1, int(len(unicos) * proporcion))])
+    return validacion
+
+
+def crear_cabeza():
+    return Sequential([
+        Input(shape=(DIMENSION,)),
+        Dropout(0.3),
+        Dense(64, activation='relu'),
+        Dense(1, activation='sigmoid'),
+    ])
+
+
+def componer_modelo(cabeza):
+    """
+    Montar backbone + cabeza en un único modelo compatible con detectar_equipo.
+    """
+    backbone = obtener_backbone()
+    return Model(inputs=backbone.input, outputs=cabeza(backbone.output))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrenar la cabeza sobre características cacheadas")
+    parser.add_argument('--variantes', type=int, default=4,
+                        help=f"Variantes de aumento por imagen (1-{len(VARIANTES)})")
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--continuar', action='store_true', help="Partir de la cabeza guardada")
+    parser.add_argument('--sin-exportar', action='store_true', help="No reescribir microscopio_model.h5")
+    parser.add_argument('--sin-compilado', action='store_true',
+                        help="Leer las imágenes originales en lugar del dataset compilado")
+    args = parser.parse_args()
+    if not 1 <= args.variantes <= len(VARIANTES):
+        parser.error(f"--variantes debe estar entre 1 y {len(VARIANTES)} ({', '.join(VARIANTES)})")
+
+    cache = CacheCaracteristicas()
+    if args.sin_compilado:
+        rutas, etiquetas = listar_dataset()
+        hashes = cache.actualizar(rutas, variantes=args.variantes)
+    else:
+        # Dataset compilado: la compilación es incremental y las imágenes
+        # se leen ya decodificadas desde el memmap
+        compilar(train_dir)
+        dataset = cargar_compilado(train_dir)
+        positiva = dataset.clases.index(CLASE_POSITIVA)
+        etiquetas = (dataset.etiquetas == positiva).astype(np.float32)
+        hashes = cache.actualizar_compilado(dataset, variantes=args.variantes)
+
+    validacion = dividir_por_hash(hashes)
+    en_validacion = np.array([h in validacion for h in hashes])
+    entrenamiento_hashes = [h if not en_validacion[i] else None for i, h in enumerate(hashes)]
+    validacion_hashes = [h if en_validacion[i] else None for i, h in enumerate(hashes)]
+
+    # Entrenamiento con todas las variantes; validación sólo con la original
+    X_train, pos_train = cache.obtener(entrenamiento_hashes, variantes=args.variantes)
+    X_val, pos_val = cache.obtener(validacion_hashes, variantes=1)
+    y_train, y_val = etiquetas[pos_train], etiquetas[pos_val]
+
+    if args.continuar and os.path.exists(cabeza_salida):
+        cabeza = load_model(cabeza_salida)
+    else:
+        cabeza = crear_cabeza()
+    cabeza.compile(optimizer=Adam(learning_rate=0.001),
+        loss='binary_crossentropy',
+        metrics=['accuracy'])
+    cabeza.fit(X_train, y_train, validation_data=(X_val, y_val),
+               epochs=args.epochs, batch_size=32, verbose=2)
+
+    cabeza.save(cabeza_salida)
+    if not args.sin_exportar:
+        componer_modelo(cabeza).save(modelo_salida)
+    print(f"✅ Cabeza entrenada con {len(X_train)} ejemplos ({args.variantes} variantes) y guardada")
+
+
+if __name__ == '__main__':
+    main()
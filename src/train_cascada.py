@@ -0,0 +1,156 @@
+# Entrenamiento de la etapa barata de la cascada (models/cascada.py) y tabla
+# de compromiso entre tasa de escalado, precisión y latencia.
+#
+#   python train_cascada.py                     # entrena y compara con el modelo completo
+#   python train_cascada.py --sin-modelo        # sólo la cabeza de histogramas (sin TensorFlow)
+#   python train_cascada.py --aplicar --tolerancia 0.01
+#
+# Con --aplicar se guarda en configuracion_sistema la banda más estrecha cuya
+# precisión queda a menos de --tolerancia de la del modelo completo.
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from gil_database_connection import get_db_connection
+from models.cascada import CabezaHistogramas, caracteristicas, RUTA_CABEZA
+from models.dataset_compilado import compilar, cargar as cargar_compilado
+from models.registro_modelos import UMBRAL
+
+# Rutas
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+train_dir = os.path.join(BASE_DIR, '..', 'data', 'entrenamiento')
+
+CLASE_POSITIVA = 'microscopio'
+BANDAS = [(0.5, 0.5), (0.4, 0.6), (0.3, 0.7), (0.2, 0.8), (0.15, 0.85), (0.1, 0.9), (0.05, 0.95), (0.0, 1.0)]
+
+
+def calcular_caracteristicas(dataset):
+    filas = []
+    for imagenes, _ in dataset.lotes(64):
+        # El almacén compilado está en RGB y los frames de la cámara en BGR
+        filas += [caracteristicas(cv2.cvtColor(imagen, cv2.COLOR_RGB2BGR)) for imagen in imagenes]
+    return np.stack(filas)
+
+
+def separar_validacion(hashes, proporcion=0.2):
+    """
+    Validación por hash de contenido: estable entre ejecuciones y sin
+    imágenes repetidas a ambos lados.
+    """
+    orden = sorted(range(len(hashes)), key=lambda i: hashes[i])
+    corte = max(1, int(len(orden) * proporcion))
+    en_validacion = np.zeros(len(hashes), dtype=bool)
+    en_validacion[orden[:corte]] = True
+    return en_validacion
+
+
+def predecir_completo(dataset, indices):
+    """
+    Probabilidades del modelo completo (activo) y su latencia por imagen.
+    """
+    from models.cliente_inferencia import predecir_lote, tamano_entrada
+    tamano = tamano_entrada()
+    probabilidades = []
+    # predecir_lote recibe BGR, como detectar_equipo, y lo pasa al RGB del modelo
+    for imagenes, _ in dataset.lotes(32, indices):
+        lote = np.stack([cv2.resize(cv2.cvtColor(img, cv2.COLOR_RGB2BGR), tamano) for img in imagenes])
+        probabilidades.append(np.ravel(predecir_lote(lote)))
+    # Latencia de una imagen suelta, como la paga detectar_equipo
+    muestra = np.asarray(dataset.imagenes[indices[:20]])
+    inicio = time.perf_counter()
+    for imagen in muestra:
+        predecir_lote(cv2.resize(cv2.cvtColor(imagen, cv2.COLOR_RGB2BGR), tamano)[np.newaxis])
+    latencia = (time.perf_counter() - inicio) / len(muestra)
+    return np.concatenate(probabilidades), latencia
+
+
+def medir_barato(dataset, indices, cabeza):
+    muestra = [cv2.cvtColor(img, cv2.COLOR_RGB2BGR) for img in np.asarray(dataset.imagenes[indices[:100]])]
+    inicio = time.perf_counter()
+    for imagen in muestra:
+        cabeza.predecir(caracteristicas(imagen))
+    return (time.perf_counter() - inicio) / len(muestra)
+
+
+def tabla_compromiso(barata, completa, etiquetas, latencia_barata, latencia_completa):
+    filas = []
+    for inferior, superior in BANDAS:
+        escalar = (barata >= inferior) & (barata <= superior)
+        final = np.where(escalar, completa, barata) if completa is not None else barata
+        filas.append({
+            'inferior': inferior,
+            'superior': superior,
+            'tasa_escalado': float(escalar.mean()),
+            'precision': float(((final > UMBRAL) == (etiquetas > 0.5)).mean()) if completa is not None else None,
+            'latencia_ms': (latencia_barata + escalar.mean() * latencia_completa) * 1000
+            if latencia_completa is not None else None,
+        })
+    return filas
+
+
+def guardar_banda(inferior, superior):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE configuracion_sistema SET valor_config = %s
+        WHERE clave_config = 'cascada_banda_incertidumbre'
+    """, (json.dumps({'inferior': inferior, 'superior': superior}),))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrenar la etapa barata de la cascada de confianza")
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--sin-modelo', action='store_true', help="No comparar con el modelo completo")
+    parser.add_argument('--aplicar', action='store_true', help="Guardar la banda elegida en configuracion_sistema")
+    parser.add_argument('--tolerancia', type=float, default=0.01,
+                        help="Pérdida de precisión aceptada frente al modelo completo")
+    args = parser.parse_args()
+
+    compilar(train_dir)
+    dataset = cargar_compilado(train_dir)
+    etiquetas = (dataset.etiquetas == dataset.clases.index(CLASE_POSITIVA)).astype(np.float32)
+    X = calcular_caracteristicas(dataset)
+    en_validacion = separar_validacion(dataset.hashes)
+    validacion = np.flatnonzero(en_validacion)
+
+    cabeza = CabezaHistogramas.entrenar(X[~en_validacion], etiquetas[~en_validacion], epochs=args.epochs)
+    cabeza.guardar(RUTA_CABEZA)
+    barata = cabeza.predecir(X[validacion])
+    y_val = etiquetas[validacion]
+    print(f"✅ Cabeza de histogramas guardada en {RUTA_CABEZA}")
+    print(f"  precisión sola: {((barata > UMBRAL) == (y_val > 0.5)).mean():.3f} "
+          f"({len(validacion)} imágenes de validación)")
+
+    completa = latencia_completa = None
+    if not args.sin_modelo:
+        completa, latencia_completa = predecir_completo(dataset, validacion)
+        print(f"  precisión modelo completo: {((completa > UMBRAL) == (y_val > 0.5)).mean():.3f}")
+    latencia_barata = medir_barato(dataset, validacion, cabeza)
+
+    filas = tabla_compromiso(barata, completa, y_val, latencia_barata, latencia_completa)
+    print(f"\n{'banda':<12} {'escalado':>9} {'precisión':>10} {'latencia (ms)':>14}")
+    for f in filas:
+        precision = f"{f['precision']:.3f}" if f['precision'] is not None else '-'
+        latencia = f"{f['latencia_ms']:.1f}" if f['latencia_ms'] is not None else '-'
+        print(f"{f['inferior']:.2f}-{f['superior']:.2f}    {f['tasa_escalado']:>9.1%} {precision:>10} {latencia:>14}")
+
+    if args.aplicar:
+        if completa is None:
+            print("⚠ --aplicar necesita comparar con el modelo completo")
+            return
+        objetivo = ((completa > UMBRAL) == (y_val > 0.5)).mean() - args.tolerancia
+        elegida = next(f for f in filas if f['precision'] >= objetivo)
+        guardar_banda(elegida['inferior'], elegida['superior'])
+        print(f"✅ Banda {elegida['inferior']:.2f}-{elegida['superior']:.2f} guardada "
+              f"(escalado {elegida['tasa_escalado']:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# Entrenamiento multiclase: una clase por cada fila de categorias_equipos.
+# Las imágenes de cada categoría van en data/categorias/<codigo_categoria>/
+# (MICRO, BAL, CENT, ...). Las categorías sin imágenes se omiten.
+import argparse
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import MobileNetV2  # type: ignore
+from tensorflow.keras.models import Model  # type: ignore
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout  # type: ignore
+from tensorflow.keras.optimizers import Adam  # type: ignore
+
+from gil_database_connection import get_db_connection
+from models.dataset_compilado import compilar, cargar as cargar_compilado
+
+# Rutas
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+train_dir = os.path.join(BASE_DIR, '..', 'data', 'categorias')
+cache_dir = os.path.join(BASE_DIR, '..', 'data', 'cache')
+modelo_salida = os.path.join(BASE_DIR, 'models', 'categorias_model.h5')
+etiquetas_salida = os.path.join(BASE_DIR, 'models', 'categorias_model.json')
+
+img_size = (224, 224)
+batch_size = 16
+epochs = 10
+validation_split = 0.2
+EXTENSIONES = ('.jpg', '.jpeg', '.png')
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def cargar_categorias():
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id_categoria, nombre_categoria, codigo_categoria
+        FROM categorias_equipos ORDER BY id_categoria
+    """)
+    categorias = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return categorias
+
+
+def listar_imagenes(categorias):
+    """
+    Devolver (rutas, etiquetas, clases) con las categorías que tienen imágenes.
+    """
+    rutas, etiquetas, clases = [], [], []
+    for categoria in categorias:
+        carpeta = os.path.join(train_dir, categoria['codigo_categoria'] or '')
+        if not categoria['codigo_categoria'] or not os.path.isdir(carpeta):
+            print(f"⚠ Sin imágenes para la categoría {categoria['nombre_categoria']}, se omite")
+            continue
+        archivos = sorted(f for f in os.listdir(carpeta) if f.lower().endswith(EXTENSIONES))
+        if not archivos:
+            print(f"⚠ Sin imágenes para la categoría {categoria['nombre_categoria']}, se omite")
+            continue
+        indice = len(clases)
+        clases.append(categoria)
+        rutas.extend(os.path.join(carpeta, f) for f in archivos)
+        etiquetas.extend([indice] * len(archivos))
+    return rutas, etiquetas, clases
+
+
+def decodificar(ruta, etiqueta):
+    datos = tf.io.read_file(ruta)
+    imagen = tf.io.decode_image(datos, channels=3, expand_animations=False)
+    imagen = tf.image.resize(imagen, img_size)
+    # Se cachea en uint8 para ocupar 4 veces menos que float32
+    return tf.cast(tf.clip_by_value(imagen, 0, 255), tf.uint8), etiqueta
+
+
+# Aumento de datos vectorizado: se aplica a lotes completos dentro del grafo
+aumento = tf.keras.Sequential([
+    tf.keras.layers.RandomFlip('horizontal'),
+    tf.keras.layers.RandomRotation(20 / 360),
+    tf.keras.layers.RandomZoom(0.2),
+    tf.keras.layers.RandomTranslation(0.1, 0.1),
+    tf.keras.layers.RandomBrightness(0.2, value_range=(0, 1)),
+])
+
+
+def normalizar(imagenes, etiquetas):
+    return tf.cast(imagenes, tf.float32) / 255.0, etiquetas
+
+
+def huella_archivos(rutas):
+    """
+    Identificar el contenido de la lista de archivos para invalidar la caché
+    cuando se agregan, quitan o modifican imágenes.
+    """
+    h = hashlib.sha1()
+    for ruta in rutas:
+        h.update(f"{ruta}:{os.path.getmtime(ruta)}:{os.path.getsize(ruta)}".encode())
+    return h.hexdigest()[:12]
+
+
+def crear_dataset(rutas, etiquetas, nombre_cache, entrenamiento):
+    nombre_cache = f"{nombre_cache}_{huella_archivos(rutas)}"
+    ds = tf.data.Dataset.from_tensor_slices((rutas, etiquetas))
+    ds = ds.map(decodificar, num_parallel_calls=AUTOTUNE)
+    # Las imágenes ya redimensionadas se guardan en disco tras la primera época
+    os.makedirs(cache_dir, exist_ok=True)
+    ds = ds.cache(os.path.join(cache_dir, nombre_cache))
+    if entrenamiento:
+        ds = ds.shuffle(len(rutas), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(normalizar, num_parallel_calls=AUTOTUNE)
+    if entrenamiento:
+        ds = ds.map(lambda x, y: (aumento(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def crear_dataset_compilado(dataset, indices, etiquetas, entrenamiento):
+    """
+    Igual que crear_dataset() pero leyendo lotes ya decodificados del
+    memmap de dataset_compilado (sin decode ni resize por época).
+    """
+    def leer_lote(seleccion):
+        orden = np.argsort(seleccion)
+        imagenes = np.empty((len(seleccion),) + dataset.imagenes.shape[1:], dtype=np.uint8)
+        imagenes[orden] = dataset.imagenes[seleccion[orden]]
+        return imagenes, etiquetas[seleccion]
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if entrenamiento:
+        ds = ds.shuffle(len(indices), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    def leer(seleccion):
+        imagenes, lote_etiquetas = tf.numpy_function(leer_lote, [seleccion], (tf.uint8, tf.int64))
+        imagenes.set_shape((None,) + dataset.imagenes.shape[1:])
+        lote_etiquetas.set_shape((None,))
+        return imagenes, lote_etiquetas
+
+    ds = ds.map(leer, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(normalizar, num_parallel_calls=AUTOTUNE)
+    if entrenamiento:
+        ds = ds.map(lambda x, y: (aumento(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def dividir(total):
+    """
+    División fija entrenamiento/validación.
+    """
+    orden = list(range(total))
+    random.Random(42).shuffle(orden)
+    corte = int(total * (1 - validation_split))
+    return orden[:corte], orden[corte:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrenar el modelo multiclase por categorías")
+    parser.add_argument('--compilado', action='store_true',
+                        help="Leer del dataset compilado (compilar_dataset.py) en vez de las imágenes")
+    args = parser.parse_args()
+
+    if args.compilado:
+        compilar(train_dir)
+        dataset = cargar_compilado(train_dir)
+        por_codigo = {c['codigo_categoria']: c for c in cargar_categorias()}
+        clases = [por_codigo[codigo] for codigo in dataset.clases if codigo in por_codigo]
+        if len(clases) < 2:
+            print("✗ Se necesitan imágenes de al menos dos categorías")
+            return
+        # Filas cuya carpeta no corresponde a ninguna categoría se descartan
+        mapa = np.array([clases.index(por_codigo[c]) if c in por_codigo else -1
+                         for c in dataset.clases], dtype=np.int64)
+        etiquetas = mapa[dataset.etiquetas]
+        validas = np.flatnonzero(etiquetas >= 0)
+        entrenamiento, validacion = dividir(len(validas))
+        train_data = crear_dataset_compilado(dataset, validas[entrenamiento], etiquetas, True)
+        val_data = crear_dataset_compilado(dataset, validas[validacion], etiquetas, False)
+    else:
+        rutas, etiquetas, clases = listar_imagenes(cargar_categorias())
+        if len(clases) < 2:
+            print("✗ Se necesitan imágenes de al menos dos categorías")
+            return
+        entrenamiento, validacion = dividir(len(rutas))
+        train_data = crear_dataset([rutas[i] for i in entrenamiento],
+                                   [etiquetas[i] for i in entrenamiento],
+                                   'categorias_train', True)
+        val_data = crear_dataset([rutas[i] for i in validacion],
+                                 [etiquetas[i] for i in validacion],
+                                 'categorias_val', False)
+
+    # Modelo base preentrenado
+    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+    x = base_model.output
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.3)(x)
+    x = Dense(128, activation='relu')(x)
+    predictions = Dense(len(clases), activation='softmax')(x)
+
+    model = Model(inputs=base_model.input, outputs=predictions)
+
+    # Congelar capas base
+    for layer in base_model.layers:
+        layer.trainable = False
+
+    model.compile(optimizer=Adam(learning_rate=0.0001),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy'])
+
+    model.fit(train_data, validation_data=val_data, epochs=epochs)
+
+    # Guardar modelo y clases (en el orden de la capa de salida)
+    model.save(modelo_salida)
+    with open(etiquetas_salida, 'w', encoding='utf-8') as f:
+        json.dump(clases, f, ensure_ascii=False, indent=2, default=str)
+    print(f"✅ Modelo de {len(clases)} categorías entrenado y guardado")
+
+
+if __name__ == '__main__':
+    main()
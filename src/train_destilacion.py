@@ -0,0 +1,224 @@
+# Destilación del modelo de microscopio en un estudiante compacto para los PC
+# más lentos de los laboratorios.
+#
+# El maestro es el modelo activo (registro de modelos_ia, o
+# models/microscopio_model.h5 si la base no está disponible). El estudiante es
+# un MobileNetV2 con alpha 0.35 a 128x128 (unas 10 veces menos operaciones)
+# que aprende de las probabilidades suaves del maestro sobre data/entrenamiento
+# y sobre frames capturados sin etiqueta (uploads/ por defecto), y de las
+# etiquetas reales donde las hay.
+#
+#   python train_destilacion.py
+#   python train_destilacion.py --alpha 0.5 --tamano 160 --temperatura 2 --activar
+#
+# Al terminar se mide latencia y tamaño del estudiante y se registra en
+# modelos_ia (inactivo salvo --activar).
+import argparse
+import datetime
+import os
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import MobileNetV2  # type: ignore
+from tensorflow.keras.models import Model  # type: ignore
+from tensorflow.keras.layers import Activation, Dense, Dropout, GlobalAveragePooling2D, Input  # type: ignore
+from tensorflow.keras.optimizers import Adam  # type: ignore
+
+from models.cliente_inferencia import predecir_en_proceso
+from models.dataset_compilado import compilar, cargar as cargar_compilado, EXTENSIONES
+from models.registro_modelos import registrar_modelo, registro, UMBRAL
+
+# Rutas
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+train_dir = os.path.join(BASE_DIR, '..', 'data', 'entrenamiento')
+capturas_dir = os.path.join(BASE_DIR, '..', 'uploads')
+modelos_dir = os.path.join(BASE_DIR, 'models')
+
+CLASE_POSITIVA = 'microscopio'
+SIN_ETIQUETA = -1.0
+EPSILON = 1e-6
+
+
+def cargar_sin_etiqueta(carpetas, limite, tamano=(224, 224)):
+    """
+    Frames capturados (sin etiqueta) como RGB uint8 de 224x224.
+    """
+    imagenes = []
+    for carpeta in carpetas:
+        if not os.path.isdir(carpeta):
+            print(f"⚠ No existe {carpeta}, se omite")
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            if len(imagenes) >= limite:
+                return np.stack(imagenes) if imagenes else np.zeros((0, *tamano, 3), np.uint8)
+            if not nombre.lower().endswith(EXTENSIONES):
+                continue
+            imagen = cv2.imread(os.path.join(carpeta, nombre), cv2.IMREAD_COLOR)
+            if imagen is None:
+                continue
+            imagen = cv2.resize(imagen, tamano, interpolation=cv2.INTER_AREA)
+            imagenes.append(cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
+    return np.stack(imagenes) if imagenes else np.zeros((0, *tamano, 3), np.uint8)
+
+
+def predecir_maestro(imagenes, tamano_lote=32):
+    """
+    Probabilidades del modelo activo, calculadas una sola vez por imagen.
+    `imagenes` es RGB; predecir_en_proceso recibe BGR, como las cámaras.
+    """
+    return np.concatenate([np.ravel(predecir_en_proceso(imagenes[i:i + tamano_lote, ..., ::-1]))
+                           for i in range(0, len(imagenes), tamano_lote)])
+
+
+def crear_estudiante(alpha, tamano):
+    """
+    Devolver (modelo de entrenamiento con salida logit, modelo exportable
+    con sigmoide). Comparten los pesos.
+    """
+    base = MobileNetV2(weights='imagenet', include_top=False, alpha=alpha, input_shape=(tamano, tamano, 3))
+    entrada = Input(shape=(tamano, tamano, 3))
+    x = GlobalAveragePooling2D()(base(entrada))
+    x = Dropout(0.2)(x)
+    x = Dense(32, activation='relu')(x)
+    logit = Dense(1)(x)
+    return Model(entrada, logit), Model(entrada, Activation('sigmoid')(logit))
+
+
+def perdida_destilacion(temperatura, peso_etiquetas):
+    """
+    Entropía cruzada contra la probabilidad del maestro suavizada con
+    `temperatura` más, donde hay etiqueta real, la entropía cruzada normal.
+    y = [etiqueta (-1 si no hay), probabilidad del maestro].
+    """
+    def perdida(y, logit):
+        etiqueta, maestro = y[:, 0:1], y[:, 1:2]
+        maestro = tf.clip_by_value(maestro, EPSILON, 1 - EPSILON)
+        suave = tf.sigmoid(tf.math.log(maestro / (1 - maestro)) / temperatura)
+        blanda = tf.nn.sigmoid_cross_entropy_with_logits(labels=suave, logits=logit / temperatura)
+        # El factor T² mantiene la escala del gradiente al subir la temperatura
+        blanda = blanda * temperatura ** 2
+        con_etiqueta = tf.cast(etiqueta >= 0, tf.float32)
+        dura = tf.nn.sigmoid_cross_entropy_with_logits(labels=tf.maximum(etiqueta, 0.0), logits=logit)
+        return tf.reduce_mean((1 - peso_etiquetas) * blanda + peso_etiquetas * con_etiqueta * dura)
+    return perdida
+
+
+def crear_dataset(imagenes, objetivos, tamano, tamano_lote, mezclar):
+    def preparar(imagen, objetivo):
+        imagen = tf.image.resize(tf.cast(imagen, tf.float32) / 255.0, (tamano, tamano))
+        if mezclar:
+            imagen = tf.image.random_flip_left_right(imagen)
+            imagen = tf.image.random_brightness(imagen, 0.1)
+        return imagen, objetivo
+
+    dataset = tf.data.Dataset.from_tensor_slices((imagenes, objetivos))
+    if mezclar:
+        dataset = dataset.shuffle(len(imagenes), seed=42)
+    return dataset.map(preparar, num_parallel_calls=tf.data.AUTOTUNE).batch(tamano_lote).prefetch(tf.data.AUTOTUNE)
+
+
+def medir_latencia(modelo, tamano, repeticiones=50):
+    """
+    Mediana en ms de una predicción de una imagen, como en detectar_equipo.
+    """
+    imagen = np.random.default_rng(0).random((1, tamano, tamano, 3), dtype=np.float32)
+    modelo(imagen, training=False)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        modelo(imagen, training=False)
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Destilar el modelo activo en un estudiante compacto")
+    parser.add_argument('--alpha', type=float, default=0.35, help="Ancho del MobileNetV2 estudiante")
+    parser.add_argument('--tamano', type=int, default=128, help="Resolución de entrada del estudiante")
+    parser.add_argument('--temperatura', type=float, default=2.0)
+    parser.add_argument('--peso-etiquetas', type=float, default=0.3,
+                        help="Peso de las etiquetas reales frente a las del maestro")
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--sin-etiqueta', action='append', default=None,
+                        help="Carpeta con frames capturados sin etiqueta (repetible)")
+    parser.add_argument('--max-sin-etiqueta', type=int, default=5000)
+    parser.add_argument('--version', default=None)
+    parser.add_argument('--activar', action='store_true', help="Activar el estudiante en modelos_ia")
+    args = parser.parse_args()
+
+    compilar(train_dir)
+    dataset = cargar_compilado(train_dir)
+    etiquetas = (dataset.etiquetas == dataset.clases.index(CLASE_POSITIVA)).astype(np.float32)
+    imagenes = np.asarray(dataset.imagenes)
+    capturas = cargar_sin_etiqueta(args.sin_etiqueta or [capturas_dir], args.max_sin_etiqueta)
+    print(f"Imágenes: {len(imagenes)} etiquetadas, {len(capturas)} capturadas sin etiqueta")
+
+    # Validación por hash (estable entre ejecuciones); sólo imágenes etiquetadas
+    orden = sorted(range(len(dataset.hashes)), key=lambda i: dataset.hashes[i])
+    en_validacion = np.zeros(len(imagenes), dtype=bool)
+    en_validacion[orden[:max(1, len(orden) // 5)]] = True
+
+    registro.iniciar()
+    maestro_version = registro.estado()['version']
+    maestro = predecir_maestro(np.concatenate([imagenes, capturas]))
+    maestro_etiquetadas, maestro_capturas = maestro[:len(imagenes)], maestro[len(imagenes):]
+
+    X_train = np.concatenate([imagenes[~en_validacion], capturas])
+    y_train = np.stack([np.concatenate([etiquetas[~en_validacion], np.full(len(capturas), SIN_ETIQUETA)]),
+                        np.concatenate([maestro_etiquetadas[~en_validacion], maestro_capturas])], axis=1)
+    X_val, y_val = imagenes[en_validacion], etiquetas[en_validacion]
+    y_val_objetivo = np.stack([y_val, maestro_etiquetadas[en_validacion]], axis=1)
+
+    entrenamiento, exportable = crear_estudiante(args.alpha, args.tamano)
+    entrenamiento.compile(optimizer=Adam(learning_rate=0.001),
+                          loss=perdida_destilacion(args.temperatura, args.peso_etiquetas))
+    entrenamiento.fit(crear_dataset(X_train, y_train.astype(np.float32), args.tamano, 32, True),
+                      validation_data=crear_dataset(X_val, y_val_objetivo.astype(np.float32), args.tamano, 32, False),
+                      epochs=args.epochs, verbose=2)
+
+    prediccion = np.ravel(exportable.predict(crear_dataset(X_val, y_val_objetivo.astype(np.float32),
+                                                           args.tamano, 32, False), verbose=0))
+    precision = float(((prediccion > UMBRAL) == (y_val > 0.5)).mean())
+    precision_maestro = float(((maestro_etiquetadas[en_validacion] > UMBRAL) == (y_val > 0.5)).mean())
+    concordancia = float(((prediccion > UMBRAL) == (maestro_etiquetadas[en_validacion] > UMBRAL)).mean())
+
+    version = args.version or datetime.datetime.now().strftime('est-%Y%m%d-%H%M')  # version_modelo es VARCHAR(20)
+    nombre_archivo = f"microscopio_{version}.h5"
+    exportable.save(os.path.join(modelos_dir, nombre_archivo))
+
+    latencia = medir_latencia(exportable, args.tamano)
+    with registro.usar() as activo:
+        ancho, _ = activo.tamano_entrada
+        latencia_maestro = medir_latencia(activo.modelo, ancho)
+    parametros = {
+        'tipo': 'destilado',
+        'maestro': maestro_version,
+        'alpha': args.alpha,
+        'tamano_entrada': args.tamano,
+        'temperatura': args.temperatura,
+        'peso_etiquetas': args.peso_etiquetas,
+        'imagenes_etiquetadas': int((~en_validacion).sum()),
+        'imagenes_sin_etiqueta': len(capturas),
+        'latencia_ms': round(latencia, 2),
+        'latencia_maestro_ms': round(latencia_maestro, 2),
+        'tamano_mb': round(os.path.getsize(os.path.join(modelos_dir, nombre_archivo)) / 2 ** 20, 2),
+        'parametros': int(exportable.count_params()),
+        'precision_maestro': precision_maestro,
+        'concordancia_maestro': concordancia,
+    }
+    id_modelo = registrar_modelo('microscopio_estudiante', version, nombre_archivo,
+                                 precision=round(precision, 4), parametros=parametros,
+                                 fecha_entrenamiento=datetime.date.today(), activar=args.activar)
+    registro.detener()
+
+    print(f"✅ Estudiante {version} registrado en modelos_ia (id {id_modelo}"
+          f"{', activo' if args.activar else ''})")
+    print(f"  precisión {precision:.3f} (maestro {precision_maestro:.3f}), concordancia {concordancia:.3f}")
+    print(f"  latencia {latencia:.1f} ms (maestro {latencia_maestro:.1f} ms), "
+          f"{parametros['tamano_mb']} MB, {parametros['parametros']:,} parámetros")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+# Punto de entrada WSGI para servidores de producción:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#   waitress-serve --threads 8 --call wsgi:crear   # un solo proceso
+#
+# Construir la aplicación no tiene efectos secundarios; los ganchos de inicio
+# (app.iniciar_worker) los ejecuta el servidor en cada worker.
+from app import create_app, iniciar_worker
+
+app = create_app()
+
+
+def crear():
+    # Para servidores de un solo proceso sin ganchos propios (waitress-serve --call)
+    iniciar_worker(app)
+    return app
@@ -0,0 +1,60 @@
+// Dibuja sobre el video las detecciones que el servidor publica por Socket.IO
+(function () {
+    const contenedor = document.getElementById('video-reconocimiento');
+    const canvas = document.getElementById('overlay-deteccion');
+    if (!contenedor || !canvas || typeof io === 'undefined') return;
+
+    const ctx = canvas.getContext('2d');
+    const socket = io('/reconocimiento');
+    const suscripcion = {
+        laboratorio: parseInt(contenedor.dataset.laboratorio, 10),
+        camara: parseInt(contenedor.dataset.camara, 10)
+    };
+    let ultima = null;
+
+    socket.on('connect', () => socket.emit('suscribir', suscripcion));
+
+    // Modo frame completo: una sola detección (sin caja o con caja)
+    socket.on('deteccion', (evento) => {
+        ultima = {
+            ancho: evento.ancho,
+            alto: evento.alto,
+            detecciones: evento.etiqueta ? [evento] : []
+        };
+        dibujar();
+    });
+
+    // Modo por regiones: todas las cajas del frame
+    socket.on('detecciones', (evento) => {
+        ultima = evento;
+        dibujar();
+    });
+
+    function dibujar() {
+        canvas.width = canvas.clientWidth;
+        canvas.height = canvas.clientHeight;
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        if (!ultima) return;
+
+        const escalaX = ultima.ancho ? canvas.width / ultima.ancho : 1;
+        const escalaY = ultima.alto ? canvas.height / ultima.alto : 1;
+        ctx.strokeStyle = '#00ff00';
+        ctx.fillStyle = '#00ff00';
+        ctx.lineWidth = 2;
+        ctx.font = '18px sans-serif';
+
+        ultima.detecciones.forEach((d, i) => {
+            const texto = `${d.etiqueta} (${(d.confianza * 100).toFixed(1)}%)` +
+                (d.id_equipo ? ` · equipo #${d.id_equipo}` : '');
+            if (d.caja) {
+                const [x, y, w, h] = d.caja;
+                ctx.strokeRect(x * escalaX, y * escalaY, w * escalaX, h * escalaY);
+                ctx.fillText(texto, x * escalaX + 4, Math.max(18, y * escalaY - 6));
+            } else {
+                ctx.fillText(texto, 10, 28 + i * 24);
+            }
+        });
+    }
+
+    window.addEventListener('resize', dibujar);
+})();